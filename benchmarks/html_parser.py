@@ -0,0 +1,98 @@
+'''
+Compare the throughput of the HTMLReader with different parsers and backends, on a
+corpus of generated HTML pages.
+
+Usage:
+
+```sh
+python benchmarks/html_parser.py [pages] [entries]
+```
+'''
+
+import os
+import sys
+import tempfile
+import time
+
+from ianalyzer_readers.extract import XML, Metadata
+from ianalyzer_readers.readers.core import Field
+from ianalyzer_readers.readers.html import HTMLReader
+from ianalyzer_readers.xml_tag import Tag
+
+
+def make_reader(directory: str) -> HTMLReader:
+    class BenchmarkReader(HTMLReader):
+        tag_toplevel = Tag('body')
+        tag_entry = Tag('article')
+
+        def sources(self, **kwargs):
+            for filename in sorted(os.listdir(directory)):
+                yield os.path.join(directory, filename), {'filename': filename}
+
+        fields = [
+            Field('filename', Metadata('filename')),
+            Field('page', XML(Tag('h1'), toplevel=True)),
+            Field('title', XML(Tag('h2'))),
+            Field('author', XML(Tag('span', class_='author'))),
+            Field('tags', XML(Tag('a', rel='tag'), multiple=True)),
+            Field('content', XML(Tag('div', class_='content'), flatten=True)),
+        ]
+
+    return BenchmarkReader()
+
+
+def make_corpus(directory: str, pages: int, entries: int) -> None:
+    for i in range(pages):
+        with open(os.path.join(directory, 'page{:05}.html'.format(i)), 'w') as f:
+            f.write('<!DOCTYPE html><html><head><title>Page {0}</title>'
+                    '<meta charset="utf-8"></head><body>'
+                    '<nav><ul><li><a href="/">Home</a><li><a href="/archive">Archive</a>'
+                    '</ul></nav><h1>Page {0}</h1>\n'.format(i))
+            for j in range(entries):
+                f.write(
+                    '<article id="a{0}-{1}"><h2>Article {1}</h2>'
+                    '<p class="byline">By <span class="author">Author {1}</span></p>'
+                    '<div class="content"><p>Some <b>bold</b> and <i>italic</i> text,'
+                    '<br>with a line break.<p>A second paragraph &amp; more.</div>'
+                    '<footer><a rel="tag" href="#">news</a> <a rel="tag" href="#">page{0}</a>'
+                    '</footer></article>\n'.format(i, j)
+                )
+            f.write('<footer>Footer</footer></body></html>\n')
+
+
+def measure(reader: HTMLReader):
+    start = time.perf_counter()
+    documents = list(reader.documents())
+    return documents, time.perf_counter() - start
+
+
+def main(pages: int, entries: int) -> None:
+    options = [('html.parser', 'bs4'), ('lxml', 'bs4'), ('html.parser', 'lxml')]
+
+    with tempfile.TemporaryDirectory() as directory:
+        make_corpus(directory, pages, entries)
+        size = sum(
+            os.path.getsize(os.path.join(directory, filename))
+            for filename in os.listdir(directory)
+        )
+        print('{} pages, {} entries per page, {:.1f} MB'.format(
+            pages, entries, size / 2 ** 20))
+
+        baseline = None
+        for parser, backend in options:
+            reader = make_reader(directory)
+            reader.parser = parser
+            reader.backend = backend
+            documents, seconds = measure(reader)
+            if baseline is None:
+                baseline, expected = seconds, documents
+            assert documents == expected
+            name = parser if backend == 'bs4' else '{} backend'.format(backend)
+            print('{:<16}{:>8.2f} s{:>10.0f} docs/s{:>8.1f}x'.format(
+                name, seconds, len(documents) / seconds, baseline / seconds))
+
+
+if __name__ == '__main__':
+    args = [int(arg) for arg in sys.argv[1:]]
+    defaults = [200, 50]
+    main(*(args + defaults[len(args):]))
@@ -0,0 +1,65 @@
+'''
+Compare parsing several Turtle files one by one with parsing them in parallel with
+`RDFReader.parse_graph_from_filenames`.
+
+Usage:
+
+```sh
+python benchmarks/rdf_parse_files.py [files] [subjects per file] [workers]
+```
+'''
+
+import os
+import sys
+import tempfile
+import time
+
+from rdflib import BNode, Graph, Literal, URIRef
+
+from ianalyzer_readers.readers.rdf import RDFReader
+
+EX = 'http://example.org/'
+TEXT = URIRef(EX + 'text')
+NOTE = URIRef(EX + 'note')
+
+
+def make_file(directory: str, index: int, subjects: int) -> str:
+    graph = Graph()
+    for i in range(subjects):
+        line = URIRef(EX + 'line/{}/{}'.format(index, i))
+        note = BNode()
+        graph.add((line, TEXT, Literal('Line {}'.format(i))))
+        graph.add((line, NOTE, note))
+        graph.add((note, TEXT, Literal('Note {}'.format(i))))
+    filename = os.path.join(directory, 'file{}.ttl'.format(index))
+    graph.serialize(filename, format='turtle')
+    return filename
+
+
+def main(files: int, subjects: int, workers: int) -> None:
+    reader = RDFReader()
+    with tempfile.TemporaryDirectory() as directory:
+        filenames = [make_file(directory, i, subjects) for i in range(files)]
+
+        start = time.perf_counter()
+        graph = Graph()
+        for filename in filenames:
+            graph.parse(filename)
+        baseline = time.perf_counter() - start
+        print('{} files, {} triples'.format(files, len(graph)))
+        print('{:<16}{:>8.2f} s'.format('parse loop', baseline))
+
+        for n in [None, workers]:
+            start = time.perf_counter()
+            graph = reader.parse_graph_from_filenames(filenames, workers=n)
+            seconds = time.perf_counter() - start
+            print('{:<16}{:>8.2f} s{:>8.1f}x'.format(
+                '{} workers'.format(n or 'no'), seconds, baseline / seconds
+            ))
+    print('Using {} of {} CPUs.'.format(workers, os.cpu_count()))
+
+
+if __name__ == '__main__':
+    args = [int(arg) for arg in sys.argv[1:]]
+    defaults = [8, 5000, os.cpu_count()]
+    main(*(args + defaults[len(args):]))
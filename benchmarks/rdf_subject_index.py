@@ -0,0 +1,84 @@
+'''
+Compare RDF extraction from an rdflib graph with extraction from a SubjectIndex.
+The time for the subject index includes building it.
+
+Usage:
+
+```sh
+python benchmarks/rdf_subject_index.py [subjects]
+```
+'''
+
+import sys
+import time
+
+from rdflib import Graph, Literal, URIRef
+from rdflib.collection import Collection
+from rdflib.namespace import RDF
+
+from ianalyzer_readers.extract import RDF as RDFExtractor
+from ianalyzer_readers.readers.core import Field
+from ianalyzer_readers.readers.rdf import RDFReader, SubjectIndex
+
+EX = 'http://example.org/'
+LINE = URIRef(EX + 'Line')
+SPEAKER = URIRef(EX + 'speaker')
+NAME = URIRef(EX + 'name')
+TEXT = URIRef(EX + 'text')
+WORDS = URIRef(EX + 'words')
+
+
+class BenchmarkReader(RDFReader):
+    subject_type = LINE
+
+    fields = [
+        Field('id', RDFExtractor()),
+        Field('speaker', RDFExtractor(SPEAKER, NAME)),
+        Field('text', RDFExtractor(TEXT)),
+        Field('words', RDFExtractor(WORDS, is_collection=True)),
+    ]
+
+
+def make_graph(subjects: int) -> Graph:
+    graph = Graph()
+    speakers = [URIRef(EX + 'speaker/{}'.format(i)) for i in range(100)]
+    for i, speaker in enumerate(speakers):
+        graph.add((speaker, NAME, Literal('Speaker {}'.format(i))))
+    for i in range(subjects):
+        line = URIRef(EX + 'line/{}'.format(i))
+        graph.add((line, RDF.type, LINE))
+        graph.add((line, SPEAKER, speakers[i % len(speakers)]))
+        graph.add((line, TEXT, Literal('Line {}'.format(i))))
+        words = URIRef(EX + 'words/{}'.format(i))
+        Collection(graph, words, [Literal(word) for word in ('to', 'be', 'or', 'not')])
+        graph.add((line, WORDS, words))
+    return graph
+
+
+def measure(reader: RDFReader, graph: Graph) -> float:
+    start = time.perf_counter()
+    extraction_graph = reader._graph_for_extractors(graph)
+    for subject in reader.document_subjects(graph):
+        reader._document_from_subject(extraction_graph, subject, None)
+    return time.perf_counter() - start
+
+
+def main(subjects: int) -> None:
+    graph = make_graph(subjects)
+    print('{} subjects, {} triples'.format(subjects, len(graph)))
+
+    reader = BenchmarkReader()
+    baseline = measure(reader, graph)
+    print('{:<16}{:>8.2f} s'.format('graph', baseline))
+
+    reader.subject_index = True
+    seconds = measure(reader, graph)
+    print('{:<16}{:>8.2f} s{:>8.1f}x'.format('subject index', seconds, baseline / seconds))
+
+    start = time.perf_counter()
+    index = SubjectIndex(graph)
+    print('{:<16}{:>8.2f} s{:>8.1f} MB'.format(
+        'building index', time.perf_counter() - start, index.memory_usage / 2 ** 20))
+
+if __name__ == '__main__':
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 50000)
@@ -0,0 +1,79 @@
+'''
+Compare the speed of XLSXReader engines on a large generated sheet.
+
+Usage:
+
+```sh
+python benchmarks/xlsx_engine.py [rows]
+```
+'''
+
+import datetime
+import os
+import sys
+import tempfile
+import time
+
+import openpyxl
+
+from ianalyzer_readers.extract import CSV
+from ianalyzer_readers.readers.core import Field
+from ianalyzer_readers.readers.xlsx import XLSXReader
+
+
+class BenchmarkReader(XLSXReader):
+    fields = [
+        Field('id', CSV('id')),
+        Field('name', CSV('name')),
+        Field('amount', CSV('amount')),
+        Field('date', CSV('date')),
+        Field('paid', CSV('paid')),
+    ]
+
+
+def make_workbook(path: str, rows: int) -> None:
+    wb = openpyxl.Workbook(write_only=True)
+    sheet = wb.create_sheet()
+    sheet.append(['id', 'name', 'amount', 'date', 'paid'])
+    start = datetime.date(2000, 1, 1)
+    for i in range(rows):
+        sheet.append([
+            i,
+            'customer {}'.format(i % 1000),
+            i * 1.25,
+            start + datetime.timedelta(days=i % 10000),
+            i % 2 == 0,
+        ])
+    wb.save(path)
+
+
+def measure(path: str, **attributes) -> float:
+    reader = BenchmarkReader()
+    for name, value in attributes.items():
+        setattr(reader, name, value)
+    start = time.perf_counter()
+    for _ in reader.source2dicts(path):
+        pass
+    return time.perf_counter() - start
+
+
+def main(rows: int) -> None:
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, 'benchmark.xlsx')
+        make_workbook(path, rows)
+        print('{} rows, {:.1f} MB'.format(rows, os.path.getsize(path) / 1024 ** 2))
+
+        configurations = [
+            ('openpyxl', {'engine': 'openpyxl'}),
+            ('openpyxl (streaming)', {'engine': 'openpyxl', 'streaming': True}),
+            ('xml', {'engine': 'xml'}),
+        ]
+        baseline = None
+        for name, attributes in configurations:
+            seconds = measure(path, **attributes)
+            baseline = baseline or seconds
+            print('{:<22}{:>8.2f} s{:>8.1f}x'.format(name, seconds, baseline / seconds))
+
+
+if __name__ == '__main__':
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 200000)
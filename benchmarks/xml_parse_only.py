@@ -0,0 +1,84 @@
+'''
+Compare parsing XML sources completely and with a derived `parse_only` filter, for
+documents where the reader only uses a part of each file.
+
+Usage:
+
+```sh
+python benchmarks/xml_parse_only.py [entries] [paragraphs]
+```
+'''
+
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+
+from ianalyzer_readers.extract import XML
+from ianalyzer_readers.readers.core import Field
+from ianalyzer_readers.readers.xml import XMLReader
+from ianalyzer_readers.xml_tag import Tag, CurrentTag
+
+
+def make_reader(path: str) -> XMLReader:
+    class BenchmarkReader(XMLReader):
+        tag_toplevel = CurrentTag()
+        tag_entry = Tag('record')
+
+        def sources(self, **kwargs):
+            yield path
+
+        fields = [
+            Field('collection', XML(Tag('header'), Tag('title'), toplevel=True)),
+            Field('title', XML(Tag('title'))),
+            Field('date', XML(Tag('date'), attribute='when')),
+        ]
+
+    return BenchmarkReader()
+
+
+def make_file(path: str, entries: int, paragraphs: int) -> None:
+    with open(path, 'w') as f:
+        f.write('<collection><header><title>Collection</title></header>\n')
+        for i in range(entries):
+            f.write('<record><title>Record {0}</title><date when="{0}"/></record>\n'.format(i))
+            f.write('<text>')
+            for j in range(paragraphs):
+                f.write('<p n="{}">Paragraph with <hi>some</hi> text</p>'.format(j))
+            f.write('</text>\n')
+        f.write('</collection>\n')
+
+
+def measure(reader: XMLReader):
+    tracemalloc.start()
+    start = time.perf_counter()
+    documents = list(reader.documents())
+    seconds = time.perf_counter() - start
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return documents, seconds, peak
+
+
+def main(entries: int, paragraphs: int) -> None:
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, 'records.xml')
+        make_file(path, entries, paragraphs)
+        reader = make_reader(path)
+        print('{} entries, {} paragraphs per entry'.format(entries, paragraphs))
+
+        documents, baseline, baseline_peak = measure(reader)
+        reader.parse_only = True
+        filtered, seconds, peak = measure(reader)
+
+    assert filtered == documents
+    print('{:<16}{:>8.2f} s{:>10.1f} MB'.format(
+        'full parse', baseline, baseline_peak / 2 ** 20))
+    print('{:<16}{:>8.2f} s{:>10.1f} MB{:>8.1f}x'.format(
+        'parse_only', seconds, peak / 2 ** 20, baseline / seconds))
+
+
+if __name__ == '__main__':
+    args = [int(arg) for arg in sys.argv[1:]]
+    defaults = [2000, 20]
+    main(*(args + defaults[len(args):]))
@@ -0,0 +1,82 @@
+'''
+Compare XML extraction with and without a TagIndex, for a reader with many fields.
+
+Usage:
+
+```sh
+python benchmarks/xml_tag_index.py [entries] [fields]
+```
+'''
+
+import os
+import sys
+import tempfile
+import time
+
+from ianalyzer_readers.extract import XML
+from ianalyzer_readers.readers.core import Field
+from ianalyzer_readers.readers.xml import XMLReader
+from ianalyzer_readers.xml_tag import Tag
+
+
+def make_reader(path: str, fields: int) -> XMLReader:
+    class BenchmarkReader(XMLReader):
+        tag_toplevel = Tag('collection')
+        tag_entry = Tag('record')
+
+        def sources(self, **kwargs):
+            yield path
+
+    BenchmarkReader.fields = [
+        Field('field{}'.format(i), XML(Tag('meta'), Tag('field{}'.format(i))))
+        for i in range(fields)
+    ] + [
+        Field('id', XML(Tag('ref', type='id'))),
+    ]
+    return BenchmarkReader()
+
+
+def make_file(path: str, entries: int, fields: int) -> None:
+    with open(path, 'w') as f:
+        f.write('<collection>\n')
+        for i in range(entries):
+            f.write('<record><meta>')
+            for j in range(fields):
+                f.write('<field{0}>value {0}</field{0}>'.format(j))
+            f.write('</meta><body><p>Text of record {}</p>'.format(i))
+            f.write('<ref type="id">{}</ref></body></record>\n'.format(i))
+        f.write('</collection>\n')
+
+
+def measure(reader: XMLReader) -> float:
+    start = time.perf_counter()
+    for _ in reader.documents():
+        pass
+    return time.perf_counter() - start
+
+
+def main(entries: int, fields: int) -> None:
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, 'records.xml')
+        make_file(path, entries, fields)
+        reader = make_reader(path, fields)
+        print('{} entries, {} fields'.format(entries, fields + 1))
+
+        start = time.perf_counter()
+        reader._soup_from_xml(path)
+        parsing = time.perf_counter() - start
+
+        baseline = measure(reader)
+        reader.tag_index = True
+        seconds = measure(reader)
+
+    print('{:<16}{:>8.2f} s'.format('parsing', parsing))
+    print('{:<16}{:>8.2f} s'.format('tree search', baseline))
+    print('{:<16}{:>8.2f} s{:>8.1f}x'.format('tag index', seconds, baseline / seconds))
+    print('Extraction times include parsing the file and building the index.')
+
+
+if __name__ == '__main__':
+    args = [int(arg) for arg in sys.argv[1:]]
+    defaults = [5000, 25]
+    main(*(args + defaults[len(args):]))
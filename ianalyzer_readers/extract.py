@@ -6,20 +6,28 @@ Some extractors are intended to work with specific `Reader` classes, while other
 are generic.
 '''
 
+import contextlib
+import contextvars
+import itertools
 import re
 import logging
 import traceback
-from typing import Any, Dict, Callable, Union, List, Optional, Iterable
+from typing import Any, Dict, Callable, Union, List, Optional, Iterable, Sequence, Set, Tuple
 import warnings
 
 import bs4
 import html
+from lxml import etree
+import lxml.html
 from rdflib import BNode, Graph, Literal, URIRef
-from rdflib.collection import Collection
 
 logger = logging.getLogger()
 
-from ianalyzer_readers.xml_tag import TagSpecification, resolve_tag_specification
+from ianalyzer_readers.xml_tag import (
+    Tag, TagIndex, TagSpecification, resolve_tag_specification, _MULTI_VALUED_ATTRIBUTES
+)
+
+_XML_NAMESPACE = 'http://www.w3.org/XML/1998/namespace'
 
 
 class Extractor(object):
@@ -74,6 +82,165 @@ class Extractor(object):
         else:
             return None
 
+    def walk(self) -> Iterable['Extractor']:
+        '''
+        Iterate over this extractor and all extractors nested in it, including
+        `applicable` conditions.
+        '''
+        yield self
+        for extractor in self._nested_extractors():
+            yield from extractor.walk()
+
+    def _nested_extractors(self) -> List['Extractor']:
+        '''
+        The extractors that this extractor uses directly. Extractors that contain
+        other extractors should extend this method.
+        '''
+        if isinstance(self.applicable, Extractor):
+            return [self.applicable]
+        return []
+
+    def compile(self, arguments: Sequence[str],
+                columns: Optional[Dict[str, int]] = None) -> Callable:
+        '''
+        Compile this extractor into a single function with positional arguments.
+
+        The compiled function returns the same value as `apply`, but avoids most of
+        its overhead: arguments are not forwarded as keywords, and `applicable`
+        conditions are only evaluated once. Readers compile the extractors of their
+        fields when they create their extraction plan.
+
+        Custom extractors that override `apply`, `_is_applicable` or `_apply` can be
+        compiled as well; they are then called with keyword arguments, as `apply` would.
+
+        Parameters:
+            arguments: the names of the arguments that the reader provides, in the
+                order in which they will be passed to the compiled function, e.g.
+                `['rows', 'metadata', 'index']`.
+            columns: optional mapping of column names to column indices. If provided,
+                `CSV` extractors are compiled for rows that are sequences of values,
+                rather than dictionaries (see `CSVReader.tuple_rows`).
+
+        Returns:
+            A function that takes the values of `arguments` as positional arguments and
+                returns the extracted value.
+        '''
+        arguments = tuple(arguments)
+        if _defining_class(type(self), 'apply') is not Extractor:
+            return _with_keywords(self.apply, arguments)
+
+        condition = self._compile_condition(arguments, columns)
+        body = self._compile_body(arguments, columns)
+        if condition is None:
+            return body
+
+        def apply_if_applicable(*values):
+            if condition(*values):
+                return body(*values)
+            return None
+
+        return apply_if_applicable
+
+    def dependencies(self) -> Optional[Set[str]]:
+        '''
+        The names of the reader arguments that this extractor uses, including the
+        arguments used by nested extractors and the `applicable` condition.
+
+        Readers use this to find fields that have the same value for every document in
+        a source, so they only need to be extracted once per source. This assumes that
+        `transform` functions only depend on their input.
+
+        Returns:
+            A set of argument names (like `'metadata'` or `'index'`), or `None` if the
+                dependencies of the extractor are not known. This is the case for custom
+                extractors, unless they implement `_dependencies`.
+        '''
+        for method in ['apply', '_is_applicable']:
+            if _defining_class(type(self), method) is not Extractor:
+                return None
+        if _defining_class(type(self), '_apply') is not _defining_class(type(self), '_dependencies'):
+            return None
+
+        dependencies = self._dependencies()
+        if dependencies is None:
+            return None
+        if isinstance(self.applicable, Extractor):
+            condition = self.applicable.dependencies()
+            if condition is None:
+                return None
+            return dependencies | condition
+        if callable(self.applicable):
+            return dependencies | {'metadata'}
+        return dependencies
+
+    def _dependencies(self) -> Optional[Set[str]]:
+        '''
+        The names of the arguments that `_apply` uses, or `None` if unknown.
+        Subclasses should implement this together with `_apply`.
+        '''
+        return None
+
+    def _compile_condition(self, arguments: Sequence[str],
+                           columns: Optional[Dict[str, int]] = None) -> Optional[Callable]:
+        '''
+        Compile the `applicable` condition of this extractor. Returns `None` if the
+        extractor is always applicable.
+        '''
+        if _defining_class(type(self), '_is_applicable') is not Extractor:
+            return _with_keywords(self._is_applicable, arguments)
+        if isinstance(self.applicable, Extractor):
+            applicable = self.applicable.compile(arguments, columns)
+            return lambda *values: bool(applicable(*values))
+        if callable(self.applicable):
+            applicable = self.applicable
+            if 'metadata' not in arguments:
+                return lambda *values: applicable(None)
+            position = arguments.index('metadata')
+            return lambda *values: applicable(values[position])
+        return None
+
+    def _compile_body(self, arguments: Sequence[str],
+                      columns: Optional[Dict[str, int]] = None) -> Callable:
+        '''
+        Compile this extractor without its `applicable` condition, i.e. `_apply`
+        followed by `transform`.
+        '''
+        if _defining_class(type(self), 'apply') is not Extractor:
+            return _with_keywords(self.apply, arguments)
+
+        if _defining_class(type(self), '_apply') is _defining_class(type(self), '_compile_apply'):
+            extract = self._compile_apply(arguments, columns)
+        else:
+            extract = None
+        if extract is None:
+            extract = _with_keywords(self._apply, arguments)
+
+        transform = self.transform
+        if not transform:
+            return extract
+
+        def extract_and_transform(*values):
+            result = extract(*values)
+            try:
+                return transform(result)
+            except Exception:
+                logger.error(traceback.format_exc())
+                logger.critical("Value {v} could not be converted."
+                                .format(v=result))
+                return None
+
+        return extract_and_transform
+
+    def _compile_apply(self, arguments: Sequence[str],
+                       columns: Optional[Dict[str, int]] = None) -> Optional[Callable]:
+        '''
+        Compile the `_apply` method of this extractor. Subclasses can implement this to
+        provide a faster equivalent of their `_apply` method; if it returns `None`,
+        `_apply` is called with keyword arguments. Extractors that contain other
+        extractors should pass on `columns` when they compile them.
+        '''
+        return None
+
     def _apply(self, *nargs, **kwargs):
         '''
         Actual extractor method to be implemented in subclasses (assume that
@@ -153,12 +320,34 @@ class Choice(Extractor):
         self.extractors = list(extractors)
         super().__init__(**kwargs)
 
+    def _nested_extractors(self):
+        return self.extractors + super()._nested_extractors()
+
     def _apply(self, *nargs, **kwargs):
         for extractor in self.extractors:
             if extractor._is_applicable(*nargs, **kwargs):
                 return extractor.apply(*nargs, **kwargs)
         return None
 
+    def _compile_apply(self, arguments, columns=None):
+        always = lambda *values: True
+        options = [
+            (extractor._compile_condition(arguments, columns) or always,
+             extractor._compile_body(arguments, columns))
+            for extractor in self.extractors
+        ]
+
+        def choose(*values):
+            for condition, body in options:
+                if condition(*values):
+                    return body(*values)
+            return None
+
+        return choose
+
+    def _dependencies(self):
+        return _union_dependencies(self.extractors)
+
 
 class Combined(Extractor):
     '''
@@ -181,11 +370,21 @@ class Combined(Extractor):
         self.extractors = list(extractors)
         super().__init__(**kwargs)
 
+    def _nested_extractors(self):
+        return self.extractors + super()._nested_extractors()
+
     def _apply(self, *nargs, **kwargs):
         return tuple(
             extractor.apply(*nargs, **kwargs) for extractor in self.extractors
         )
 
+    def _compile_apply(self, arguments, columns=None):
+        extractors = [extractor.compile(arguments, columns) for extractor in self.extractors]
+        return lambda *values: tuple(extractor(*values) for extractor in extractors)
+
+    def _dependencies(self):
+        return _union_dependencies(self.extractors)
+
 
 class Backup(Extractor):
     '''
@@ -212,6 +411,9 @@ class Backup(Extractor):
         self.extractors = list(extractors)
         super().__init__(**kwargs)
 
+    def _nested_extractors(self):
+        return self.extractors + super()._nested_extractors()
+
     def _apply(self, *nargs, **kwargs):
         for extractor in self.extractors:
             result = extractor.apply(*nargs, **kwargs)
@@ -219,6 +421,21 @@ class Backup(Extractor):
                 return result
         return None
 
+    def _compile_apply(self, arguments, columns=None):
+        extractors = [extractor.compile(arguments, columns) for extractor in self.extractors]
+
+        def first_truthy(*values):
+            for extractor in extractors:
+                result = extractor(*values)
+                if result:
+                    return result
+            return None
+
+        return first_truthy
+
+    def _dependencies(self):
+        return _union_dependencies(self.extractors)
+
 
 class Constant(Extractor):
     '''
@@ -240,6 +457,13 @@ class Constant(Extractor):
     def _apply(self, *nargs, **kwargs):
         return self.value
 
+    def _compile_apply(self, arguments, columns=None):
+        value = self.value
+        return lambda *values: value
+
+    def _dependencies(self):
+        return set()
+
 
 class Metadata(Extractor):
     '''
@@ -260,6 +484,16 @@ class Metadata(Extractor):
     def _apply(self, metadata: Dict, *nargs, **kwargs):
         return metadata.get(self.key)
 
+    def _compile_apply(self, arguments, columns=None):
+        if 'metadata' not in arguments:
+            return None
+        position = arguments.index('metadata')
+        key = self.key
+        return lambda *values: values[position].get(key)
+
+    def _dependencies(self):
+        return {'metadata'}
+
 class Pass(Extractor):
     '''
     An extractor that just passes the value of another extractor.
@@ -281,9 +515,18 @@ class Pass(Extractor):
         self.extractor = extractor
         super().__init__(**kwargs)
 
+    def _nested_extractors(self):
+        return [self.extractor] + super()._nested_extractors()
+
     def _apply(self, *nargs, **kwargs):
         return self.extractor.apply(*nargs, **kwargs)
 
+    def _compile_apply(self, arguments, columns=None):
+        return self.extractor.compile(arguments, columns)
+
+    def _dependencies(self):
+        return self.extractor.dependencies()
+
 class Order(Extractor):
     '''
     An extractor that returns the index of the document in its
@@ -301,6 +544,15 @@ class Order(Extractor):
     def _apply(self, index: int = None, *nargs, **kwargs):
         return index
 
+    def _compile_apply(self, arguments, columns=None):
+        if 'index' not in arguments:
+            return lambda *values: None
+        position = arguments.index('index')
+        return lambda *values: values[position]
+
+    def _dependencies(self):
+        return {'index'}
+
 class XML(Extractor):
     '''
     Extractor for XML data. Searches through a BeautifulSoup document.
@@ -357,6 +609,10 @@ class XML(Extractor):
 
             Note: this option is not supported when this extractor is nested in another
             extractor (like `Combined`).
+
+            If the reader caches external files (see
+            `XMLReader.external_file_cache_size`), the parsed file is shared between
+            sources, so `extract_soup_func` and `transform` must not modify its tree.
         extract_soup_func: A function to extract a value directly from the soup element,
             instead of using the content string or an attribute.
             `attribute` and `flatten` will do nothing if this property is set.
@@ -383,6 +639,24 @@ class XML(Extractor):
         self.extract_soup_func = extract_soup_func
         super().__init__(**kwargs)
 
+    def supports_lxml(self, metadata: Optional[Dict] = None, html: bool = False) -> bool:
+        '''
+        Whether this extractor can be used on lxml trees, rather than BeautifulSoup.
+
+        This is the case if all tags support lxml, and `extract_soup_func` is not used.
+
+        Parameters:
+            metadata: the metadata used to resolve tag specifications.
+            html: whether the source is an HTML document.
+        '''
+        if self.extract_soup_func:
+            return False
+        try:
+            tags = [resolve_tag_specification(tag, metadata) for tag in self.tags]
+        except Exception:
+            return False
+        return all(tag.supports_lxml(html) for tag in tags)
+
     def _select(self, tags: Iterable[TagSpecification], soup: bs4.PageElement, metadata=None):
         '''
         Return the BeautifulSoup element that matches the constraints of this
@@ -391,12 +665,12 @@ class XML(Extractor):
 
         if len(tags) > 1:
             tag = resolve_tag_specification(tags[0], metadata)
-            for element in tag.find_in_soup(soup):
+            for element in _find(tag, soup):
                 for result in self._select(tags[1:], element, metadata):
                     yield result
         elif len(tags) == 1:
             tag = resolve_tag_specification(tags[0], metadata)
-            for result in tag.find_in_soup(soup):
+            for result in _find(tag, soup):
                 yield result
         else:
             yield soup
@@ -416,8 +690,44 @@ class XML(Extractor):
             result = next(results_generator, None)
             return self._extract(result)
 
+    def _compile_apply(self, arguments, columns=None):
+        if 'soup_top' not in arguments or 'soup_entry' not in arguments:
+            return None
+        start = arguments.index('soup_top' if self.toplevel else 'soup_entry')
+        metadata = arguments.index('metadata') if 'metadata' in arguments else None
+        tags, extract = self.tags, self._extract
+
+        shared = _shared_selection.get()
+        if shared is not None and _defining_class(type(self), '_select') is XML:
+            entry = arguments.index('soup_entry')
+            keys = tuple(_tag_key(tag) for tag in tags)
+            def select(values, soup, meta):
+                return shared.select(values[entry], soup, tags, keys, meta)
+        else:
+            def select(values, soup, meta):
+                return self._select(tags, soup, metadata=meta)
+
+        if self.multiple:
+            def extract_xml(*values):
+                soup = values[start]
+                meta = values[metadata] if metadata is not None else None
+                return list(map(extract, select(values, soup, meta)))
+        else:
+            def extract_xml(*values):
+                soup = values[start]
+                meta = values[metadata] if metadata is not None else None
+                return extract(next(select(values, soup, meta), None))
+
+        return extract_xml
+
+    def _dependencies(self):
+        dependencies = {'soup_top' if self.toplevel else 'soup_entry'}
+        if any(callable(tag) for tag in self.tags):
+            dependencies.add('metadata')
+        return dependencies
+
     def _extract(self, soup: Optional[bs4.PageElement]):
-        if not soup:
+        if soup is None if _is_lxml(soup) else not soup:
             return None
 
         # Use appropriate extractor
@@ -436,6 +746,8 @@ class XML(Extractor):
         Output direct text contents of a node.
         '''
 
+        if _is_lxml(soup):
+            return _lxml_string(soup)
         if isinstance(soup, bs4.element.Tag):
             return soup.string
         else:
@@ -447,7 +759,9 @@ class XML(Extractor):
         underlying XML structure.
         '''
 
-        if isinstance(soup, bs4.element.Tag):
+        if _is_lxml(soup):
+            text = ''.join(_lxml_strings(soup))
+        elif isinstance(soup, bs4.element.Tag):
             text = soup.get_text()
         else:
             text = '\n\n'.join(node.get_text() for node in soup)
@@ -468,6 +782,8 @@ class XML(Extractor):
         Output content of nodes' attribute.
         '''
 
+        if _is_lxml(soup):
+            return _lxml_attribute(soup, self.attribute)
         if isinstance(soup, bs4.element.Tag):
             if self.attribute == 'name':
                 return soup.name
@@ -481,6 +797,272 @@ class XML(Extractor):
             ]
 
 
+class SharedSelection(object):
+    '''
+    Shares the elements selected by `XML` extractors within a document.
+
+    Readers often have several fields that start with the same tags, like
+    `XML(Tag('meta'), Tag('title'))` and `XML(Tag('meta'), Tag('date'))`. Extractors
+    that are compiled in `sharing()` merge their tag chains into a prefix tree: the
+    results of each prefix are stored for the current entry, so `Tag('meta')` is only
+    searched once, and its results are used by both fields. This includes extractors
+    nested in `Backup` or `Choice`.
+
+    Tags are compared by their type and arguments, so two `Tag('meta')` objects are the
+    same prefix. Results are found lazily, so an extractor that only needs the first
+    match does not search further than that. The stored results are cleared when the
+    extractors are called for a different entry.
+    '''
+
+    def __init__(self):
+        self.index: Optional[TagIndex] = None
+        '''
+        A `TagIndex` of the current BeautifulSoup document, if the reader made one.
+        Queries that the index can answer use it instead of searching the tree.
+        '''
+        self._entry = None
+        self._results = {}
+
+    @contextlib.contextmanager
+    def sharing(self):
+        '''
+        Context manager in which `XML` extractors are compiled to use this object.
+        '''
+        token = _shared_selection.set(self)
+        try:
+            yield self
+        finally:
+            _shared_selection.reset(token)
+
+    def clear(self) -> None:
+        '''
+        Remove all stored results and the index.
+        '''
+        self.index = None
+        self._entry = None
+        self._results.clear()
+
+    def select(self, entry: Any, soup: Any, tags: Sequence[TagSpecification],
+               keys: Tuple, metadata: Optional[Dict] = None) -> Iterable:
+        '''
+        Select elements with a chain of tags, like `XML._select`.
+
+        Parameters:
+            entry: the entry element of the document, which determines when stored
+                results are cleared.
+            soup: the element to search from.
+            tags: the tag specifications.
+            keys: a key for each tag specification (see `_tag_key`).
+            metadata: the metadata to resolve tag specifications.
+        '''
+        if entry is not self._entry:
+            self._results.clear()
+            self._entry = entry
+        return iter(self._prefix_results(soup, tags, keys, len(tags), metadata))
+
+    def _prefix_results(self, soup: Any, tags: Sequence[TagSpecification], keys: Tuple,
+                        length: int, metadata: Optional[Dict]) -> '_LazyList':
+        key = (id(soup), keys[:length])
+        stored = self._results.get(key)
+        # the element is stored with the results, so its id is not reused
+        if stored is None or stored[0] is not soup:
+            if length == 0:
+                results = _LazyList([soup])
+            else:
+                parents = self._prefix_results(soup, tags, keys, length - 1, metadata)
+                tag = resolve_tag_specification(tags[length - 1], metadata)
+                results = _LazyList(
+                    result for parent in parents
+                    for result in _find(tag, parent, self.index)
+                )
+            stored = (soup, results)
+            self._results[key] = stored
+        return stored[1]
+
+
+def _defining_class(cls: type, attribute: str) -> Optional[type]:
+    '''
+    The class in the method resolution order of `cls` that defines an attribute.
+    '''
+    for klass in cls.__mro__:
+        if attribute in vars(klass):
+            return klass
+
+
+def _union_dependencies(extractors: Iterable[Extractor]) -> Optional[Set[str]]:
+    dependencies = set()
+    for extractor in extractors:
+        nested = extractor.dependencies()
+        if nested is None:
+            return None
+        dependencies |= nested
+    return dependencies
+
+
+def _with_keywords(function: Callable, arguments: Sequence[str]) -> Callable:
+    '''
+    Wrap a function that takes keyword arguments, so it takes the values of
+    `arguments` as positional arguments instead.
+    '''
+    return lambda *values: function(**dict(zip(arguments, values)))
+
+
+_shared_selection: contextvars.ContextVar[Optional[SharedSelection]] = \
+    contextvars.ContextVar('shared_selection', default=None)
+
+
+class _LazyList(object):
+    '''
+    The results of an iterator, which are stored as they are found, so they can be
+    iterated over several times.
+    '''
+
+    def __init__(self, iterable: Iterable):
+        self._items = []
+        self._source = iter(iterable)
+
+    def __iter__(self):
+        index = 0
+        while True:
+            if index == len(self._items):
+                try:
+                    self._items.append(next(self._source))
+                except StopIteration:
+                    return
+            yield self._items[index]
+            index += 1
+
+
+def _tag_key(tag: TagSpecification) -> Tuple:
+    '''
+    A hashable key for a tag specification. Tags of the same type with the same
+    arguments have the same key.
+    '''
+    if not isinstance(tag, Tag):
+        return ('object', id(tag))
+    attributes = sorted(
+        (name, _value_key(value)) for name, value in vars(tag).items()
+        if not name.startswith('_')
+    )
+    return (type(tag), tuple(attributes))
+
+
+def _value_key(value: Any) -> Any:
+    if value is None or isinstance(value, (str, bytes, int, float)):
+        return (type(value), value)
+    if isinstance(value, (tuple, list)):
+        return (type(value), tuple(_value_key(item) for item in value))
+    if isinstance(value, dict):
+        return (dict, tuple(
+            (_value_key(key), _value_key(item)) for key, item in value.items()
+        ))
+    if isinstance(value, re.Pattern):
+        return (re.Pattern, value.pattern, value.flags)
+    # other values (like functions) are compared by identity; they are kept alive by
+    # the tag
+    return ('object', id(value))
+
+
+def _find(tag, soup, index: Optional[TagIndex] = None):
+    if _is_lxml(soup):
+        return tag.find_in_lxml(soup)
+    if index is not None:
+        matches = tag.find_in_index(index, soup)
+        if matches is not None:
+            return matches
+    return tag.find_in_soup(soup)
+
+
+def _is_lxml(node) -> bool:
+    return isinstance(node, (etree._Element, etree._ElementTree))
+
+
+def _lxml_string(node):
+    '''
+    Equivalent of BeautifulSoup's `.string` for lxml nodes: the text content, if the
+    node has a single child that is (or contains only) text.
+    '''
+    if isinstance(node, etree._ElementTree):
+        node = node.getroot()
+    while node is not None:
+        if isinstance(node, etree._ProcessingInstruction):
+            # BeautifulSoup includes the target
+            return node.target + ' ' + (node.text or '')
+        if not isinstance(node.tag, str):
+            # comments
+            return node.text
+        if len(node) == 0:
+            return node.text and _collapse_whitespace(node.text, _preserves_whitespace(node))
+        if len(node) > 1 or node.text or node[0].tail:
+            return None
+        node = node[0]
+
+
+def _lxml_strings(node) -> Iterable[str]:
+    '''
+    Iterate over the text in an lxml node, in the same chunks as BeautifulSoup would.
+    '''
+    if isinstance(node, etree._ElementTree):
+        node = node.getroot()
+        if node is None:
+            return []
+    if not isinstance(node, lxml.html.HtmlMixin):
+        return (_collapse_whitespace(text) for text in node.itertext())
+    return _html_strings(node, _preserves_whitespace(node))
+
+
+def _html_strings(element, preserve: bool) -> Iterable[str]:
+    preserve = preserve or element.tag in _PRESERVE_WHITESPACE_TAGS
+    if element.text:
+        yield _collapse_whitespace(element.text, preserve)
+    for child in element:
+        if isinstance(child.tag, str):
+            yield from _html_strings(child, preserve)
+        if child.tail:
+            yield _collapse_whitespace(child.tail, preserve)
+
+
+_ASCII_SPACES = '\x20\x0a\x09\x0c\x0d'
+
+_PRESERVE_WHITESPACE_TAGS = {'pre', 'textarea'}
+
+
+def _collapse_whitespace(text: str, preserve: bool = False) -> str:
+    '''
+    Like BeautifulSoup, replace text that only contains whitespace with a single space
+    or newline.
+    '''
+    if preserve or text.strip(_ASCII_SPACES):
+        return text
+    return '\n' if '\n' in text else ' '
+
+
+def _preserves_whitespace(element) -> bool:
+    if not isinstance(element, lxml.html.HtmlMixin):
+        return False
+    return any(
+        node.tag in _PRESERVE_WHITESPACE_TAGS
+        for node in itertools.chain([element], element.iterancestors())
+    )
+
+
+def _lxml_attribute(node, attribute: str):
+    if isinstance(node, etree._ElementTree):
+        return '[document]' if attribute == 'name' else None
+    if attribute == 'name':
+        return etree.QName(node).localname
+    if ':' in attribute:
+        prefix, _, name = attribute.partition(':')
+        namespace = _XML_NAMESPACE if prefix == 'xml' else node.nsmap.get(prefix)
+        if namespace:
+            attribute = '{{{}}}{}'.format(namespace, name)
+    value = node.get(attribute)
+    if value is not None and isinstance(node, lxml.html.HtmlMixin) \
+            and attribute in _MULTI_VALUED_ATTRIBUTES:
+        return value.split()
+    return value
+
+
 class CSV(Extractor):
     '''
     This extractor extracts values from a list of CSV or spreadsheet rows.
@@ -514,6 +1096,54 @@ class CSV(Extractor):
                 row = rows[0]
                 return self.format(row[self.field])
 
+    def _compile_apply(self, arguments, columns=None):
+        if 'rows' not in arguments:
+            return None
+        position = arguments.index('rows')
+        if columns is not None:
+            return self._compile_sequence_rows(position, columns.get(self.field))
+
+        column, format = self.field, self.format
+
+        if self.multiple:
+            def extract_csv(*values):
+                rows = values[position]
+                if column in rows[0]:
+                    return [format(row[column]) for row in rows]
+        else:
+            def extract_csv(*values):
+                row = values[position][0]
+                if column in row:
+                    return format(row[column])
+
+        return extract_csv
+
+    def _compile_sequence_rows(self, position: int, column: Optional[int]) -> Callable:
+        '''
+        Compile this extractor for rows that are sequences of values. Like
+        `csv.DictReader`, values that are missing in short rows are `None`.
+        '''
+        format = self.format
+
+        if column is None:
+            return lambda *values: None
+
+        if self.multiple:
+            def extract_csv(*values):
+                return [
+                    format(row[column] if column < len(row) else None)
+                    for row in values[position]
+                ]
+        else:
+            def extract_csv(*values):
+                row = values[position][0]
+                return format(row[column] if column < len(row) else None)
+
+        return extract_csv
+
+    def _dependencies(self):
+        return {'rows'}
+
     def format(self, value):
         if value and value not in self.convert_to_none:
             return value
@@ -541,6 +1171,9 @@ class ExternalFile(Extractor):
         '''
         return self.stream_handler(open(metadata['associated_file'], 'r'))
 
+    def _dependencies(self):
+        return {'metadata'}
+
 
 class RDF(Extractor):
     """An extractor to extract data from RDF triples
@@ -574,15 +1207,17 @@ class RDF(Extractor):
         ''' apply a query to the RDFReader's graph, with one subject resulting from the `document_subjects` function
         
         Parameters:
-            graph: a graph in which to query (set on RDFReader)
+            graph: a graph in which to query (set on RDFReader), or a `SubjectIndex`
+                of the graph
             subject: the subject with which to query
         
         Returns:
             a string or list of strings
         '''
         if self.is_collection:
-            collection = Collection(graph, subject)
-            return [self._get_node_value(node) for node in list(collection)]
+            # same as iterating over `Collection(graph, subject)`; this also
+            # supports a `SubjectIndex`
+            return [self._get_node_value(node) for node in graph.items(subject)]
         nodes = self._select(graph, subject, self.predicates)
         if len(nodes) == 0:
             return None
@@ -590,6 +1225,16 @@ class RDF(Extractor):
             return [self._get_node_value(node) for node in nodes]
         return self._get_node_value(nodes[0])
 
+    def _compile_apply(self, arguments, columns=None):
+        if 'graph' not in arguments or 'subject' not in arguments:
+            return None
+        graph, subject = arguments.index('graph'), arguments.index('subject')
+        apply = self._apply
+        return lambda *values: apply(values[graph], values[subject])
+
+    def _dependencies(self):
+        return {'graph', 'subject'}
+
     def _select(self, graph, subject, predicates: Iterable[URIRef]) -> List[Union[Literal, URIRef, BNode]]:
         ''' search in a graph with predicates
             if more than one predicate is passed, this is a recursive query:
@@ -0,0 +1,139 @@
+'''
+This module implements the process pool that readers use to extract data in parallel.
+
+Each worker process holds its own copy of the reader. Tasks only name a method of the
+reader and its arguments, and the results are sent back to the main process. Where the
+platform supports it, workers are started by forking the main process, so the reader
+itself is never pickled: this means readers can use lambdas and other unpicklable
+objects in their fields. Otherwise, the reader is pickled without its caches (like
+extraction plans); fields that are defined on the reader class are not pickled, since
+the class is pickled by reference.
+
+Results of a task are sent back as a list, so a single task should not produce more
+data than fits in memory.
+'''
+
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor, FIRST_COMPLETED, wait
+import multiprocessing
+from typing import Any, Iterable, Iterator, List, Tuple
+
+import bs4
+from lxml import etree
+
+
+_reader = None
+
+_in_worker = False
+
+
+def _initialize_worker(reader) -> None:
+    global _reader, _in_worker
+    _reader = reader
+    _in_worker = True
+
+
+def _run_task(method: str, args: Tuple) -> List:
+    results = getattr(_reader, method)(*args)
+    return [_plain_value(result) for result in results]
+
+
+def _plain_value(value: Any) -> Any:
+    '''
+    Convert a result to a value that can be sent to the main process.
+
+    Strings from a document tree (BeautifulSoup's `NavigableString` and lxml's smart
+    strings) keep a reference to the tree, which would be sent along with them; these
+    are converted to plain strings. Other subclasses of `str`, like rdflib's terms, are
+    sent as they are.
+    '''
+    if isinstance(value, (bs4.NavigableString, etree._ElementUnicodeResult)):
+        return str(value)
+    if isinstance(value, dict):
+        return {key: _plain_value(item) for key, item in value.items()}
+    if isinstance(value, list):
+        return [_plain_value(item) for item in value]
+    if isinstance(value, tuple):
+        return tuple(_plain_value(item) for item in value)
+    return value
+
+
+def _pool_context():
+    if 'fork' in multiprocessing.get_all_start_methods():
+        return multiprocessing.get_context('fork')
+    return multiprocessing.get_context()
+
+
+def in_worker() -> bool:
+    '''
+    Whether the current process is a worker process.
+
+    Readers should use this to fall back to sequential processing in a worker, rather
+    than start a pool of their own: the workers of the main pool already use the
+    available processors.
+    '''
+    return _in_worker
+
+
+def map_reader_method(
+        reader,
+        method: str,
+        argument_lists: Iterable[Tuple],
+        workers: int,
+        ordered: bool = True,
+    ) -> Iterator[List]:
+    '''
+    Call a method of a reader for each set of arguments in a pool of worker processes.
+
+    Arguments are submitted lazily: at most two tasks per worker are pending at any
+    time, so `argument_lists` can be a long-running generator.
+
+    Parameters:
+        reader: the reader of which the method is called.
+        method: the name of the method. The method should return an iterable; its
+            results are collected in a list in the worker process.
+        argument_lists: an iterable of tuples, which are the positional arguments for
+            each call.
+        workers: the number of worker processes.
+        ordered: if `True`, results are yielded in the order of `argument_lists`. If
+            `False`, results are yielded as soon as each task is finished.
+
+    Returns:
+        An iterator of the results of each task, as lists.
+    '''
+    max_pending = 2 * workers
+
+    executor = ProcessPoolExecutor(
+        max_workers=workers,
+        mp_context=_pool_context(),
+        initializer=_initialize_worker,
+        initargs=(reader,),
+    )
+
+    pending = deque() if ordered else set()
+
+    try:
+        for args in argument_lists:
+            future = executor.submit(_run_task, method, args)
+            if ordered:
+                pending.append(future)
+                if len(pending) >= max_pending:
+                    yield pending.popleft().result()
+            else:
+                pending.add(future)
+                if len(pending) >= max_pending:
+                    done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                    for future in done:
+                        yield future.result()
+
+        while pending:
+            if ordered:
+                yield pending.popleft().result()
+            else:
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    yield future.result()
+    finally:
+        for future in pending:
+            future.cancel()
+        executor.shutdown(wait=True)
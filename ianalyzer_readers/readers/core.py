@@ -8,7 +8,8 @@ The module defines two classes, `Field` and `Reader`.
 '''
 
 from .. import extract
-from typing import List, Iterable, Dict, Any, Union, Tuple, Optional
+from .. import parallel
+from typing import List, Iterable, Dict, Any, Union, Tuple, Optional, Callable, Sequence
 import logging
 import csv
 
@@ -62,6 +63,149 @@ class Field(object):
         self.skip = skip
 
 
+class ExtractionPlan(object):
+    '''
+    A description of how a Reader extracts its fields, which is created once and reused
+    for every source.
+
+    The plan validates the fields of the reader and splits them up, so this does not
+    need to happen for each source or document. The extractors of the fields are
+    compiled (see `Extractor.compile`) for the arguments that the reader provides.
+    Reader subclasses can extend the plan with information that is specific to their
+    format.
+
+    Fields that only depend on arguments that are the same for every document in a
+    source (`source_arguments`) are source-invariant: readers can extract them once
+    per source with `source_template`, and only extract `document_extractors` for each
+    document, starting from `document_from_template`.
+
+    Parameters:
+        fields: the fields of the reader.
+        arguments: the names of the arguments that the reader passes to extractors, in
+            the order in which they are passed to the compiled extractors.
+        source_arguments: the names of arguments that have the same value for every
+            document in a source.
+        selection: optional list of the names of fields that should be extracted. If
+            `None`, all fields are extracted.
+
+    Attributes:
+        fields: the fields that should be extracted, i.e. fields that are not skipped
+            and are included in the selection.
+        required_fields: the names of required fields.
+        hidden_fields: the names of fields that are extracted because other fields
+            depend on them, but should not be included in documents. This is empty
+            unless a subclass adds such fields.
+        extractors: a list of `(name, extractor)` tuples for `fields`, where
+            `extractor` is the compiled extractor of the field.
+        source_extractors: the compiled extractors of source-invariant fields.
+        document_fields: the fields that are not source-invariant.
+        document_extractors: the compiled extractors of `document_fields`.
+    '''
+
+    def __init__(self, fields: List[Field], arguments: Sequence[str] = (),
+                 source_arguments: Sequence[str] = (),
+                 selection: Optional[Sequence[str]] = None):
+        self.fields = [
+            field for field in fields
+            if not field.skip and (selection is None or field.name in selection)
+        ]
+        self.required_fields = [
+            field.name for field in fields
+            if field.required and (selection is None or field.name in selection)
+        ]
+        self.hidden_fields = []
+        self.extractors = self.compile(self.fields, arguments)
+        self._split_extractors(self.fields, self.extractors, source_arguments)
+
+    def source_template(self, *values) -> Document:
+        '''
+        Extract the source-invariant fields for a source.
+
+        Parameters:
+            *values: the arguments for the compiled extractors. Arguments that are not
+                in `source_arguments` are not used and can be `None`.
+
+        Returns:
+            A document dictionary that contains all fields, in which only
+                source-invariant fields have a value. The other fields are `None`.
+        '''
+        template = dict.fromkeys(self._template_fields)
+        for name, extractor in self.source_extractors:
+            template[name] = extractor(*values)
+        return template
+
+    def document_from_template(self, template: Document) -> Document:
+        '''
+        Start a new document from a template made with `source_template`.
+
+        Lists, dictionaries and sets in the values of source-invariant fields are
+        copied, so documents of the same source do not share them.
+        '''
+        document = template.copy()
+        for name, _ in self.source_extractors:
+            value = document[name]
+            if isinstance(value, (list, dict, set)):
+                document[name] = _copy_value(value)
+        return document
+
+    def uses_only(self, arguments: Sequence[str],
+                  fields: Optional[List[Field]] = None) -> bool:
+        '''
+        Whether the extracted fields only use the given arguments. For example, if
+        fields only use `metadata` and `index`, a reader does not need to parse the
+        content of a source, just count its documents.
+
+        Parameters:
+            arguments: the names of arguments.
+            fields: the fields to check. Defaults to `fields`.
+        '''
+        arguments = set(arguments)
+        for field in self.fields if fields is None else fields:
+            dependencies = field.extractor.dependencies()
+            if dependencies is None or not dependencies <= arguments:
+                return False
+        return True
+
+    def _split_extractors(self, fields: List[Field], extractors: List[Tuple[str, Callable]],
+                          source_arguments: Sequence[str]) -> None:
+        '''
+        Set `source_extractors` and `document_extractors` by splitting up the compiled
+        extractors of a list of fields. The template for documents contains these
+        fields.
+        '''
+        source_arguments = set(source_arguments)
+        self.source_extractors = []
+        self.document_fields = []
+        self.document_extractors = []
+        for field, extractor in zip(fields, extractors):
+            dependencies = field.extractor.dependencies()
+            if dependencies is not None and dependencies <= source_arguments:
+                self.source_extractors.append(extractor)
+            else:
+                self.document_fields.append(field)
+                self.document_extractors.append(extractor)
+        self._template_fields = [field.name for field in fields]
+
+    @staticmethod
+    def compile(fields: List[Field], arguments: Sequence[str],
+                columns: Optional[Dict[str, int]] = None) -> List[Tuple[str, Callable]]:
+        '''
+        Compile the extractors of a list of fields.
+
+        Parameters:
+            fields: the fields to compile.
+            arguments: the names of the arguments for the compiled extractors.
+            columns: optional mapping of column names to indices, see
+                `Extractor.compile`.
+
+        Returns:
+            a list of `(name, extractor)` tuples.
+        '''
+        return [
+            (field.name, field.extractor.compile(arguments, columns)) for field in fields
+        ]
+
+
 class Reader(object):
     '''
     A base class for readers. Readers are objects that can generate documents
@@ -82,6 +226,20 @@ class Reader(object):
     - How to extract said fields from the source files.
     '''
 
+    _cached_attributes: Tuple[str, ...] = ('_plans',)
+    '''
+    Names of instance attributes that cache data derived from the reader. These are
+    left out when the reader is pickled (e.g. to send it to worker processes), since
+    they can hold objects that cannot be pickled, like compiled extractors. They are
+    created again when they are needed.
+    '''
+
+    def __getstate__(self) -> Dict[str, Any]:
+        return {
+            key: value for key, value in self.__dict__.items()
+            if key not in self._cached_attributes
+        }
+
     @property
     def data_directory(self) -> str:
         '''
@@ -130,7 +288,7 @@ class Reader(object):
         '''
         raise NotImplementedError('Reader missing sources implementation')
 
-    def source2dicts(self, source: Source) -> Iterable[Document]:
+    def source2dicts(self, source: Source, fields: Optional[Sequence[str]] = None) -> Iterable[Document]:
         '''
         Given a source file, returns an iterable of extracted documents.
 
@@ -138,6 +296,8 @@ class Reader(object):
             source: the source file to extract. This can be a string with the path to
                 the file, or a tuple with a path and a dictionary containing metadata.
                 Some reader subclasses may also support bytes as input.
+            fields: optional list of the names of fields to extract. If omitted, all
+                fields are extracted.
         
         Returns:
             an iterable of document dictionaries. Each of these is a dictionary,
@@ -150,28 +310,94 @@ class Reader(object):
         '''
         raise NotImplementedError('Reader missing source2dicts implementation')
 
-    def documents(self, sources:Iterable[Source] = None) -> Iterable[Document]:
+    def documents(self,
+                  sources: Iterable[Source] = None,
+                  workers: Optional[int] = None,
+                  ordered: bool = True,
+                  fields: Optional[Sequence[str]] = None,
+                  ) -> Iterable[Document]:
         '''
         Returns an iterable of extracted documents from source files.
 
         Parameters:
             sources: an iterable of paths to source files. If omitted, the reader
                 class will use the value of `self.sources()` instead.
+            workers: if set, sources are extracted in parallel in a pool of this many
+                worker processes. Each worker extracts complete sources, so this is
+                useful for datasets with many source files. Documents are still
+                returned one at a time, but all documents of a source are collected
+                in memory before they are returned.
+            ordered: when using `workers`, whether documents should be returned in the
+                same order as they would be without workers. If `False`, the documents
+                of each source are returned as soon as the source is finished. This
+                option does nothing if `workers` is not set.
+            fields: optional list of the names of fields to extract. Documents only
+                contain these fields, and the reader skips extractors and other work
+                that is only needed for other fields. If omitted, all fields are
+                extracted.
 
         Returns:
             an iterable of document dictionaries. Each of these is a dictionary,
                 where the keys are names of this Reader's `fields`, and the values
                 are based on the extractor of each field.
+
+        Raises:
+            ValueError: if `fields` contains a name that is not the name of a field
+                of this reader, or the name of a skipped field.
         '''
         sources = sources or self.sources()
+
+        if fields is None:
+            source_arguments = lambda source: (source,)
+        else:
+            fields = tuple(fields)
+            # validate field names before extracting anything
+            self._extraction_plan(fields)
+            source_arguments = lambda source: (source, fields)
+
+        if workers:
+            return (document
+                    for documents in parallel.map_reader_method(
+                        self, 'source2dicts', map(source_arguments, sources),
+                        workers=workers, ordered=ordered,
+                    )
+                    for document in documents
+                    )
+
         return (document
                 for source in sources
                 for document in self.source2dicts(
-                    source
+                    *source_arguments(source)
                 )
                 )
 
-    def export_csv(self, path: str, sources: Optional[Iterable[Source]] = None) -> None:
+    def count_documents(self, sources: Optional[Iterable[Source]] = None) -> int:
+        '''
+        Count the documents in source files, without extracting any fields.
+
+        This is usually much faster than extracting documents: reader subclasses only
+        do as much work as they need to find the number of documents in each source.
+
+        Parameters:
+            sources: an iterable of paths to source files. If omitted, the reader class
+                will use the value of `self.sources()` instead.
+
+        Returns:
+            The number of documents that `documents()` would return for these
+                sources.
+        '''
+        sources = sources or self.sources()
+        return sum(self._count_source_documents(source) for source in sources)
+
+    def _count_source_documents(self, source: Source) -> int:
+        '''
+        Count the documents in a single source. By default, this extracts documents
+        without any fields; subclasses can implement a faster method.
+        '''
+        return sum(1 for _ in self.source2dicts(source, fields=[]))
+
+    def export_csv(self, path: str, sources: Optional[Iterable[Source]] = None,
+                   fields: Optional[Sequence[str]] = None) -> None:
         '''
         Extracts documents from sources and saves them in a CSV file.
 
@@ -182,16 +408,69 @@ class Reader(object):
             path: the path where the CSV file should be saved.
             sources: an iterable of paths to source files. If omitted, the reader class
                 will use the value of `self.sources()` instead.
+            fields: optional list of the names of fields to export. If omitted, all
+                fields are exported.
         '''
-        documents = self.documents(sources)
+        documents = self.documents(sources, fields=fields)
+
+        if fields is None:
+            fieldnames = self.fieldnames
+        else:
+            fieldnames = [name for name in self.fieldnames if name in fields]
 
         with open(path, 'w') as outfile:
-            writer = csv.DictWriter(outfile, self.fieldnames)
+            writer = csv.DictWriter(outfile, fieldnames)
             writer.writeheader()
             for doc in documents:
                 writer.writerow(doc)
 
 
+    def _extraction_plan(self, fields: Optional[Sequence[str]] = None) -> ExtractionPlan:
+        '''
+        The extraction plan of this reader. The plan is created when it is first used,
+        and reused afterwards.
+
+        Parameters:
+            fields: optional list of the names of fields that should be extracted. A
+                separate plan is kept for each selection of fields.
+
+        Raises:
+            ValueError: if `fields` contains an unknown field name.
+        '''
+        selection = None if fields is None else tuple(fields)
+        plans = self.__dict__.setdefault('_plans', {})
+        plan = plans.get(selection)
+        if plan is None:
+            if selection is not None:
+                self._validate_field_selection(selection)
+            plan = self._make_extraction_plan(selection)
+            plans[selection] = plan
+        return plan
+
+    def _make_extraction_plan(self, selection: Optional[Sequence[str]] = None) -> ExtractionPlan:
+        '''
+        Create the extraction plan for this reader. Subclasses can extend this method to
+        validate their fields, or to return a subclass of `ExtractionPlan`.
+
+        Parameters:
+            selection: optional list of the names of fields that should be extracted.
+        '''
+        return ExtractionPlan(self.fields, selection=selection)
+
+    def _validate_field_selection(self, selection: Sequence[str]) -> None:
+        '''
+        Raise an error if a selection of fields includes names that are not the names
+        of extracted fields.
+        '''
+        available = {field.name for field in self.fields if not field.skip}
+        unknown = [name for name in selection if name not in available]
+        if unknown:
+            raise ValueError(
+                'Unknown field(s): {}. Available fields are: {}'.format(
+                    ', '.join(unknown), ', '.join(sorted(available))
+                )
+            )
+
     def _reject_extractors(self, *inapplicable_extractors: extract.Extractor):
         '''
         Raise errors if any fields use any of the given extractors.
@@ -207,3 +486,16 @@ class Reader(object):
             if isinstance(field.extractor, inapplicable_extractors):
                 raise RuntimeError(
                     "Specified extractor method cannot be used with this type of data")
+
+
+def _copy_value(value: Any) -> Any:
+    '''
+    Copy the lists, dictionaries and sets in a value. Other objects are not copied.
+    '''
+    if isinstance(value, list):
+        return [_copy_value(item) for item in value]
+    if isinstance(value, dict):
+        return {key: _copy_value(item) for key, item in value.items()}
+    if isinstance(value, set):
+        return set(value)
+    return value
@@ -4,10 +4,13 @@ This module defines the CSV reader.
 Extraction is based on python's `csv` library.
 '''
 
-from .. import extract
-from typing import List, Dict, Iterable
-from .core import Reader, Document, Source
+from .. import extract, parallel
+from typing import BinaryIO, List, Dict, Iterable, Optional, Sequence, Tuple
+from .core import Reader, Document, Source, ExtractionPlan
 import csv
+import io
+import itertools
+import os
 import sys
 
 import logging
@@ -55,13 +58,56 @@ class CSVReader(Reader):
     use a fixed "preamble", e.g. to describe metadata or provenance.
     '''
 
-    def source2dicts(self, source: Source) -> Iterable[Document]:
+    compact_rows = False
+    '''
+    If `True`, rows are read as lists of values instead of dictionaries, and each `CSV`
+    extractor looks up its column by index. This saves memory and time for large
+    files, and extracts the same documents.
+
+    Custom extractors that implement `_dependencies` receive the rows as lists as well.
+    Fields with custom extractors that do not implement it are not supported; in that
+    case, the reader falls back to reading rows as dictionaries.
+    '''
+
+    chunk_workers: Optional[int] = None
+    '''
+    If set, files larger than `chunk_size` are split into chunks, which are extracted
+    in parallel in a pool of this many worker processes. Documents are returned in the
+    same order, and with the same `Order` index, as without chunks.
+
+    Chunks start at a record boundary, so values with line breaks are supported if
+    they are quoted with `"`. Files should not contain `"` characters in unquoted
+    values. If `field_entry` is set, documents are never split
+    across chunks. This is not used while reading in a worker process, e.g. when
+    `documents()` is called with `workers`.
+
+    If any field depends on the index of documents (e.g. an `Order` extractor), each
+    chunk is read twice: once to count its documents, so every chunk knows the index
+    of its first document, and once to extract them. Counting only parses the CSV
+    rows, but it does add a pass over the file.
+    '''
+
+    chunk_size: int = 64 * 1024 * 1024
+    '''
+    The approximate size of chunks in bytes, when using `chunk_workers`.
+    '''
+
+    def _make_extraction_plan(self, selection=None) -> ExtractionPlan:
+        self._reject_extractors(extract.XML)
+        return ExtractionPlan(
+            self.fields, ('rows', 'metadata', 'index'), source_arguments=('metadata',),
+            selection=selection,
+        )
+
+    def source2dicts(self, source: Source, fields: Optional[Sequence[str]] = None) -> Iterable[Document]:
         '''
         Given a CSV source file, returns an iterable of extracted documents.
 
         Parameters:
             source: the source file to extract. This can be a string with the path to
                 the file, or a tuple with a path and a dictionary containing metadata.
+            fields: optional list of the names of fields to extract. If omitted, all
+                fields are extracted.
         
         Returns:
             an iterable of document dictionaries. Each of these is a dictionary,
@@ -71,7 +117,7 @@ class CSVReader(Reader):
 
         # make sure the field size is as big as the system permits
         csv.field_size_limit(sys.maxsize)
-        self._reject_extractors(extract.XML)
+        plan = self._extraction_plan(fields)
 
         if isinstance(source, str):
             filename = source
@@ -81,6 +127,30 @@ class CSVReader(Reader):
         else:
             filename, metadata = source
 
+        if plan.uses_only(['metadata', 'index']):
+            # the content of rows is not needed, only the number of documents
+            template = plan.source_template(None, metadata, None)
+            for index in range(self._count_documents_in_file(filename)):
+                yield self._document_from_rows(None, metadata, index, template, plan)
+            return
+
+        if self._use_chunks(filename):
+            documents = self._chunked_source2dicts(filename, metadata, plan, fields)
+        else:
+            documents = self._sequential_source2dicts(filename, metadata, plan)
+
+        is_empty = True
+        for document in documents:
+            is_empty = False
+            yield document
+
+        if is_empty:
+            # like a file with a single document without any rows
+            template = plan.source_template(None, metadata, None)
+            yield self._document_from_rows([], metadata, 0, template, plan)
+
+    def _sequential_source2dicts(self, filename: str, metadata: Dict,
+                                 plan: ExtractionPlan) -> Iterable[Document]:
         with open(filename, 'r') as f:
             logger.info('Reading CSV file {}...'.format(filename))
 
@@ -88,34 +158,252 @@ class CSVReader(Reader):
             for _ in range(self.skip_lines):
                 next(f)
 
-            reader = csv.DictReader(f, delimiter=self.delimiter)
-            document_id = None
-            rows = []
-            index = 0
-            for row in reader:
-                is_new_document = True
+            header = next(csv.reader(f, delimiter=self.delimiter), [])
+            yield from self._rows2dicts(f, header, metadata, plan)
 
-                if self.required_field and not row.get(self.required_field):  # skip row if required_field is empty
-                    continue
+    def _rows2dicts(self, f: Iterable[str], header: List[str], metadata: Dict,
+                    plan: ExtractionPlan, first_index: int = 0) -> Iterable[Document]:
+        '''
+        Extract documents from the lines of a CSV file after the header row.
 
+        Parameters:
+            f: an iterable of lines, e.g. a file opened in text mode.
+            header: the column names of the file.
+            metadata: a dictionary with file metadata.
+            plan: the extraction plan.
+            first_index: the index of the first document in these lines.
+
+        Returns:
+            an iterable of documents. Unlike `source2dicts`, this yields nothing if
+                there are no rows.
+        '''
+        columns = _column_indices(header)
+        template = plan.source_template(None, metadata, None)
 
+        if self.compact_rows and self._supports_compact_rows(plan):
+            reader = csv.reader(f, delimiter=self.delimiter)
+            extractors = plan.compile(
+                plan.document_fields, ('rows', 'metadata', 'index'), columns
+            )
+            for index, rows in enumerate(self._group_rows(reader, columns), first_index):
+                doc = plan.document_from_template(template)
+                for name, extractor in extractors:
+                    doc[name] = extractor(rows, metadata, index)
+                yield doc
+        else:
+            reader = csv.DictReader(f, fieldnames=header, delimiter=self.delimiter)
+            for index, rows in enumerate(self._group_rows(reader, columns), first_index):
+                yield self._document_from_rows(rows, metadata, index, template, plan)
+
+    def _supports_compact_rows(self, plan: ExtractionPlan) -> bool:
+        '''
+        Whether documents can be extracted from compact rows. This requires that the
+        dependencies of all extractors are known, i.e. that they do not override
+        `apply` without implementing `_dependencies`.
+        '''
+        return all(
+            field.extractor.dependencies() is not None
+            for field in plan.document_fields
+        )
+
+    def _use_chunks(self, filename: str) -> bool:
+        if not self.chunk_workers or parallel.in_worker():
+            return False
+        return os.path.getsize(filename) > self.chunk_size
+
+    def _chunked_source2dicts(self, filename: str, metadata: Dict, plan: ExtractionPlan,
+                              fields: Optional[Sequence[str]]) -> Iterable[Document]:
+        '''
+        Extract documents from a CSV file by splitting it into chunks, which are
+        extracted in parallel. See `chunk_workers`.
+        '''
+        logger.info('Reading CSV file {} in chunks...'.format(filename))
+        header, chunks = self._file_chunks(filename)
+        selection = None if fields is None else tuple(fields)
+
+        if plan.uses_only(['rows', 'metadata']):
+            offsets = [0 for _ in chunks]
+        else:
+            # documents are counted first, so each chunk knows its first index
+            counts = parallel.map_reader_method(
+                self, '_count_chunk_documents',
+                ((filename, header, start, end) for start, end in chunks),
+                workers=self.chunk_workers,
+            )
+            offsets = list(itertools.accumulate(
+                itertools.chain([0], (count for count, in counts))
+            ))
+
+        results = parallel.map_reader_method(
+            self, '_chunk2dicts',
+            (
+                (filename, metadata, header, start, end, offset, selection)
+                for (start, end), offset in zip(chunks, offsets)
+            ),
+            workers=self.chunk_workers,
+        )
+        for documents in results:
+            yield from documents
+
+    def _chunk2dicts(self, filename: str, metadata: Dict, header: List[str],
+                     start: int, end: int, first_index: int,
+                     fields: Optional[Sequence[str]]) -> List[Document]:
+        csv.field_size_limit(sys.maxsize)
+        plan = self._extraction_plan(fields)
+        with _open_byte_range(filename, start, end) as f:
+            return list(self._rows2dicts(f, header, metadata, plan, first_index))
+
+    def _count_chunk_documents(self, filename: str, header: List[str],
+                               start: int, end: int) -> List[int]:
+        csv.field_size_limit(sys.maxsize)
+        with _open_byte_range(filename, start, end) as f:
+            reader = csv.reader(f, delimiter=self.delimiter)
+            groups = self._group_rows(reader, _column_indices(header))
+            return [sum(1 for _ in groups)]
+
+    def _file_chunks(self, filename: str) -> Tuple[List[str], List[Tuple[int, int]]]:
+        '''
+        Split a CSV file into chunks of roughly `chunk_size` bytes.
+
+        Chunks start at the beginning of a record, so they never split a quoted
+        value that spans multiple lines. If `field_entry` is set, chunks also
+        start at the first row of a document.
+
+        Returns:
+            a tuple with the column names of the file, and a list of `(start, end)`
+                tuples with the byte offsets of each chunk.
+        '''
+        with open(filename, 'rb') as f:
+            for _ in range(self.skip_lines):
+                f.readline()
+            header = self._parse_record(_read_record(f)) or []
+            data_start = f.tell()
+
+            size = os.path.getsize(filename)
+            boundaries = [data_start]
+            for boundary in _record_boundaries(f, data_start, self.chunk_size):
                 if self.field_entry:
-                    identifier = row[self.field_entry]
-                    if identifier == document_id:
-                        is_new_document = False
-                    else:
-                        document_id = identifier
-
-                if is_new_document and rows:
-                    yield self._document_from_rows(rows, metadata, index)
-                    rows = [row]
-                    index += 1
+                    boundary = self._next_document_start(f, boundary, header)
+                if boundary >= size:
+                    break
+                if boundary > boundaries[-1]:
+                    boundaries.append(boundary)
+            boundaries.append(size)
+
+        return header, list(zip(boundaries, boundaries[1:]))
+
+    def _next_document_start(self, f: BinaryIO, offset: int, header: List[str]) -> int:
+        '''
+        Find the byte offset of the first row at or after `offset` that starts a
+        new document, based on `field_entry`. The offset should be the start of a
+        record.
+
+        The first row that is not skipped may continue a document from before
+        `offset`, so the search starts at the next row with a different identifier.
+        '''
+        columns = _column_indices(header)
+        f.seek(offset)
+        document_id = None
+        is_first = True
+        while True:
+            record_start = f.tell()
+            row = self._parse_record(_read_record(f))
+            if row is None:
+                return record_start
+            if not row:
+                continue
+            if self.required_field and not _row_value(row, columns.get(self.required_field)):
+                continue
+            identifier = _row_value(row, columns.get(self.field_entry))
+            if is_first:
+                document_id = identifier
+                is_first = False
+            elif identifier != document_id:
+                return record_start
+
+    def _parse_record(self, record: bytes) -> Optional[List[str]]:
+        if not record:
+            return None
+        text = io.TextIOWrapper(io.BytesIO(record))
+        return next(csv.reader(text, delimiter=self.delimiter), [])
+
+    def _count_source_documents(self, source: Source) -> int:
+        if isinstance(source, bytes):
+            raise NotImplementedError()
+        filename = source if isinstance(source, str) else source[0]
+        return self._count_documents_in_file(filename)
+
+    def _count_documents_in_file(self, filename: str) -> int:
+        '''
+        Count the documents in a CSV file, without extracting any fields.
+
+        Rows are grouped and skipped based on `field_entry` and `required_field`, in
+        the same way as `source2dicts`, but rows are not converted to dictionaries.
+        '''
+        csv.field_size_limit(sys.maxsize)
+
+        with open(filename, 'r') as f:
+            logger.info('Counting documents in CSV file {}...'.format(filename))
+
+            for _ in range(self.skip_lines):
+                next(f)
+
+            reader = csv.reader(f, delimiter=self.delimiter)
+            header = next(reader, [])
+            groups = self._group_rows(reader, _column_indices(header))
+            # like source2dicts, a file without rows is a single document
+            return max(1, sum(1 for _ in groups))
+
+    def _group_rows(self, reader: Iterable, columns: Dict[str, int]) -> Iterable[List]:
+        '''
+        Group the rows of a CSV file into documents, based on `field_entry`. Rows are
+        skipped based on `required_field`.
+
+        Parameters:
+            reader: an iterable of rows after the header row. Rows can be dictionaries,
+                as from a `csv.DictReader`, or lists, as from a `csv.reader`.
+            columns: a mapping of column names to indices, based on the header row.
+
+        Returns:
+            an iterable of lists of rows. This does not include empty groups.
+        '''
+        def value(row, column):
+            if isinstance(row, dict):
+                return row.get(column)
+            return _row_value(row, columns.get(column))
+
+        document_id = None
+        rows = []
+        for row in reader:
+            if not row:
+                # csv.DictReader skips empty lines
+                continue
+
+            if self.required_field and not value(row, self.required_field):  # skip row if required_field is empty
+                continue
+
+            is_new_document = True
+            if self.field_entry:
+                if self.field_entry not in columns:
+                    raise KeyError(self.field_entry)
+                identifier = value(row, self.field_entry)
+                if identifier == document_id:
+                    is_new_document = False
                 else:
-                    rows.append(row)
+                    document_id = identifier
+
+            if is_new_document and rows:
+                yield rows
+                rows = [row]
+            else:
+                rows.append(row)
 
-            yield self._document_from_rows(rows, metadata, index)
+        if rows:
+            yield rows
 
-    def _document_from_rows(self, rows: List[Dict], metadata: Dict, doc_index: int) -> Document:
+    def _document_from_rows(self, rows: List[Dict], metadata: Dict, doc_index: int,
+                            template: Optional[Document] = None,
+                            plan: Optional[ExtractionPlan] = None) -> Document:
         '''
         Extract a single document from a list of rows
 
@@ -126,15 +414,117 @@ class CSVReader(Reader):
             doc_index: the index of this document in the source file. The first document
                 extracted from a file should have index 0, the second should have index 1,
                 and so forth.
+            template: optional document template with the source-invariant fields
+                of the source, from the `source_template` of the extraction plan. If
+                provided, only the other fields are extracted.
         '''
 
-        doc = {
-            field.name: field.extractor.apply(
-                # The extractor is put to work by simply throwing at it
-                # any and all information it might need
-                rows=rows, metadata = metadata, index=doc_index
-            )
-            for field in self.fields if not field.skip
-        }
+        plan = plan or self._extraction_plan()
+        if template is None:
+            return {
+                name: extractor(rows, metadata, doc_index)
+                for name, extractor in plan.extractors
+            }
 
+        doc = plan.document_from_template(template)
+        for name, extractor in plan.document_extractors:
+            doc[name] = extractor(rows, metadata, doc_index)
         return doc
+
+
+def _column_indices(header: List[str]) -> Dict[str, int]:
+    # like csv.DictReader, the last column wins if names are duplicated
+    return {name: i for i, name in enumerate(header)}
+
+
+def _row_value(row: List[str], column: Optional[int]) -> Optional[str]:
+    # like csv.DictReader, values that are missing in short rows are None
+    if column is not None and column < len(row):
+        return row[column]
+
+
+def _read_record(f: BinaryIO) -> bytes:
+    '''
+    Read the lines of a single record from a file opened in binary mode. A record
+    can span multiple lines if it has quoted values that contain line breaks.
+    '''
+    record = f.readline()
+    while record.count(b'"') % 2:
+        line = f.readline()
+        if not line:
+            break
+        record += line
+    return record
+
+
+def _record_boundaries(f: BinaryIO, start: int, chunk_size: int) -> Iterable[int]:
+    '''
+    Yield the byte offsets of record starts, roughly every `chunk_size` bytes after
+    `start`.
+
+    A line break ends a record if the number of quote characters before it is even;
+    otherwise, it is part of a quoted value. Escaped quotes (`""`) do not affect
+    this count.
+    '''
+    block_size = 1024 * 1024
+    f.seek(start)
+    position = start
+    quotes = 0
+    target = start + chunk_size
+    while True:
+        block = f.read(block_size)
+        if not block:
+            return
+        end = position + len(block)
+        counted = 0
+        while target < end:
+            i = max(target - position, 0)
+            newline = block.find(b'\n', i)
+            while newline != -1:
+                if (quotes + block.count(b'"', counted, newline)) % 2 == 0:
+                    break
+                newline = block.find(b'\n', newline + 1)
+            if newline == -1:
+                break
+            quotes += block.count(b'"', counted, newline)
+            counted = newline
+            boundary = position + newline + 1
+            yield boundary
+            f.seek(end)
+            target = boundary + chunk_size
+        quotes += block.count(b'"', counted)
+        position = end
+
+
+class _ByteRange(io.RawIOBase):
+    '''
+    A readable binary stream of a range of bytes in a file.
+    '''
+
+    def __init__(self, file: BinaryIO, start: int, end: int):
+        file.seek(start)
+        self._file = file
+        self._remaining = end - start
+
+    def readable(self) -> bool:
+        return True
+
+    def readinto(self, buffer) -> int:
+        size = min(len(buffer), self._remaining)
+        if size <= 0:
+            return 0
+        read = self._file.readinto(memoryview(buffer)[:size])
+        self._remaining -= read
+        return read
+
+    def close(self) -> None:
+        self._file.close()
+        super().close()
+
+
+def _open_byte_range(filename: str, start: int, end: int) -> io.TextIOWrapper:
+    '''
+    Open a range of bytes in a file as a text stream, like `open(filename, 'r')`.
+    '''
+    raw = _ByteRange(open(filename, 'rb'), start, end)
+    return io.TextIOWrapper(io.BufferedReader(raw))
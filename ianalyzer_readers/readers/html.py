@@ -2,15 +2,17 @@
 This module defines the XML Reader.
 
 The HTML reader is implemented as a subclas of the XML reader, and uses
-BeautifulSoup to parse files.
+BeautifulSoup or lxml to parse files.
 '''
 
 from .. import extract
 from .core import Source, Document
-from .xml import XMLReader
+from .xml import XMLReader, XMLExtractionPlan, _find_next
 import bs4
+import io
 import logging
-from typing import Iterable
+import lxml.html
+from typing import Dict, Iterable, Optional, Sequence
 
 logger = logging.getLogger()
 
@@ -25,59 +27,128 @@ class HTMLReader(XMLReader):
     In addition to generic extractor classes, this reader supports the `XML` extractor.
     '''
 
-    def source2dicts(self, source: Source) -> Iterable[Document]:
+    parser: str = 'html.parser'
+    '''
+    The parser that BeautifulSoup uses to build the tree, e.g. `'html.parser'` (the
+    default), `'lxml'` or `'html5lib'`. See the [BeautifulSoup documentation](https://www.crummy.com/software/BeautifulSoup/bs4/doc/#installing-a-parser)
+    for the differences between parsers. Parsers may build different trees for
+    invalid HTML, which can affect the extracted documents.
+
+    Parsing with `'lxml'` is much faster than with `'html.parser'`. To skip building a
+    BeautifulSoup tree altogether, use `backend = 'lxml'`.
+    '''
+
+    backend: str = 'bs4'
+    '''
+    The library used to parse and query source files. Options are:
+
+    - `'bs4'`: BeautifulSoup (the default), using `parser` to parse the document.
+    - `'lxml'`: lxml's HTML parser. Tags are compiled to XPath queries on the lxml
+        tree, which is much faster than building and searching a BeautifulSoup tree.
+        The document is parsed like BeautifulSoup's `'lxml'` parser would.
+
+    As with the `XMLReader`, sources for which the reader uses tags or extractors that
+    do not support lxml are parsed with BeautifulSoup instead.
+    '''
+
+    def _make_extraction_plan(self, selection=None) -> XMLExtractionPlan:
+        # Make sure that extractors are sensible
+        self._reject_extractors(extract.CSV)
+        return XMLExtractionPlan(
+            self.fields,
+            self.__class__.tag_toplevel,
+            self.__class__.tag_entry,
+            self.__class__.external_file_tag_toplevel,
+            selection=selection,
+            html=True,
+        )
+
+    def _count_source_documents(self, source: Source) -> int:
+        # HTML sources are parsed differently from XML sources
+        return sum(1 for _ in self.source2dicts(source, fields=[]))
+
+    def _parse_filter(self, plan=None) -> Optional[bs4.SoupStrainer]:
+        # entries are searched in the whole document, rather than the top-level tag
+        if self.parse_only is True:
+            plan = plan or self._extraction_plan()
+            return plan.parse_filter(entries_from_top=False)
+        return self.parse_only or None
+
+    def source2dicts(self, source: Source, fields: Optional[Sequence[str]] = None) -> Iterable[Document]:
         '''
         Given an HTML source file, returns an iterable of extracted documents.
 
         Parameters:
-            source: the source file to extract. This can be a string with the path to
-                the file, or a tuple with a path and a dictionary containing metadata.
+            source: the source to extract. This can be a string with the path to the
+                file, the content of the file as bytes, or a tuple of either of these
+                and a dictionary containing metadata.
+            fields: optional list of the names of fields to extract. If omitted, all
+                fields are extracted.
         
         Returns:
             an iterable of document dictionaries. Each of these is a dictionary,
                 where the keys are names of this Reader's `fields`, and the values
                 are based on the extractor of each field.
         '''
-        (filename, metadata) = source
+        filename, data, metadata = self._filename_data_and_metadata_from_source(source)
 
-        self._reject_extractors(extract.CSV)
+        plan = self._extraction_plan(fields)
+        use_lxml = self.backend == 'lxml' and plan.supports_lxml(metadata)
 
         # Loading HTML
-        logger.info('Reading HTML file {} ...'.format(filename))
-        with open(filename, 'rb') as f:
-            data = f.read()
+        if filename:
+            logger.info('Reading HTML file {} ...'.format(filename))
+            with open(filename, 'rb') as f:
+                data = f.read()
         # Parsing HTML
-        soup = bs4.BeautifulSoup(data, 'html.parser')
-        logger.info('Loaded {} into memory ...'.format(filename))
+        parse_only = None if use_lxml else self._parse_filter(plan)
+        soup = self._parse_html(data, use_lxml, parse_only)
+        logger.info('Loaded {} into memory ...'.format(filename or 'HTML data'))
 
         # Extract fields from soup
-        tag0 = self.tag_toplevel
-        tag = self.tag_entry
+        tag0 = self.tag_toplevel and plan.resolve_tag('tag_toplevel', metadata)
+        tag = self.tag_entry and plan.resolve_tag('tag_entry', metadata)
 
-        bowl = tag0.find_next_in_soup(soup) if tag0 else soup
+        bowl = _find_next(tag0, soup, use_lxml) if tag0 else soup
+        found = bowl is not None if use_lxml else bool(bowl)
 
         # if there is a entry level tag; with html this is not always the case
-        if bowl and tag:
-            for i, spoon in enumerate(tag.find_in_soup(soup)):
+        if found and tag:
+            spoonfuls = tag.find_in_lxml(soup) if use_lxml else tag.find_in_soup(soup)
+            for i, spoon in enumerate(spoonfuls):
                 # yield
-                yield {
-                    field.name: field.extractor.apply(
-                        # The extractor is put to work by simply throwing at it
-                        # any and all information it might need
-                        soup_top=bowl,
-                        soup_entry=spoon,
-                        metadata=metadata,
-                        index=i
-                    ) for field in self.fields if not field.skip
-                }
+                yield self._document(plan, bowl, spoon, metadata, i)
         else:
+            if parse_only:
+                # the page content is extracted as a whole
+                soup = self._parse_html(data, use_lxml)
             # yield all page content
-            yield {
-                field.name: field.extractor.apply(
-                    # The extractor is put to work by simply throwing at it
-                    # any and all information it might need
-                    soup_top='',
-                    soup_entry=soup,
-                    metadata=metadata,
-                ) for field in self.fields if not field.skip
-            }
+            yield self._document(plan, '', soup, metadata, None)
+
+        # do not keep the last entry in memory
+        plan.shared_selection.clear()
+
+    def _document(self, plan: XMLExtractionPlan, bowl, spoon, metadata: Dict,
+                  index: Optional[int]) -> Document:
+        '''
+        Extracts a document from an entry, without the `hidden_fields` of the plan.
+        '''
+        document = {
+            name: extractor(bowl, spoon, metadata, index)
+            for name, extractor in plan.extractors
+        }
+        for name in plan.hidden_fields:
+            del document[name]
+        return document
+
+    def _parse_html(self, data: bytes, use_lxml: bool = False,
+                    parse_only: Optional[bs4.SoupStrainer] = None):
+        '''
+        Parses the content of an HTML file as a BeautifulSoup object, or as an lxml
+        element tree if `use_lxml` is `True`.
+        '''
+        if use_lxml:
+            if isinstance(data, str):
+                data = data.encode('utf-8')
+            return lxml.html.parse(io.BytesIO(data))
+        return bs4.BeautifulSoup(data, self.parser, parse_only=parse_only)
@@ -4,12 +4,24 @@ This module defines a Resource Description Framework (RDF) reader.
 Extraction is based on the [rdflib library](https://rdflib.readthedocs.io/en/stable/index.html).
 '''
 
+import hashlib
+import itertools
 import logging
-from typing import Iterable, Union
+import os
+import pickle
+import sys
+import tempfile
+import warnings
+from typing import Callable, Dict, Iterable, Iterator, List, Optional, Sequence, Tuple, Union
 
-from rdflib import BNode, Graph, Literal, URIRef
+from rdflib import BNode, Dataset, Graph, Literal, URIRef
+from rdflib.namespace import RDF
+from rdflib.plugins.stores.memory import Memory
+from rdflib.term import Node
+from rdflib.util import guess_format
 
-from .core import Reader, Document, Source
+from .core import Reader, Document, Source, ExtractionPlan
+from .. import parallel
 import ianalyzer_readers.extract as extract
 
 logger = logging.getLogger('ianalyzer-readers')
@@ -22,20 +34,112 @@ class RDFReader(Reader):
     see [rdflib parsers](https://rdflib.readthedocs.io/en/stable/plugin_parsers.html).
     '''
 
-    def source2dicts(self, source: Source) -> Iterable[Document]:
+    subject_type: Optional[URIRef] = None
+    '''
+    If set, only subjects with this `rdf:type` are extracted as documents. This is
+    used by the default implementation of `document_subjects`.
+    '''
+
+    required_predicates: Sequence[URIRef] = []
+    '''
+    If set, only subjects that have a triple with each of these predicates are
+    extracted as documents. This is used by the default implementation of
+    `document_subjects`.
+    '''
+
+    subject_index: bool = False
+    '''
+    If `True`, the reader builds a `SubjectIndex` of each graph after parsing it.
+    Extractors then receive the index as their `graph`, so `RDF` extractors look up
+    objects in plain dictionaries instead of querying the graph store. Building the
+    index takes about as long as iterating over all triples of the graph, so this
+    is only faster if the extractors look up each triple several times, e.g. when many
+    documents refer to the same nodes. The index also uses memory for a dictionary of
+    predicates per subject (see `SubjectIndex.memory_usage`).
+    '''
+
+    subject_index_max_bytes: Optional[int] = None
+    '''
+    The maximum (estimated) memory size of a `SubjectIndex`, or `None` for no limit.
+    If the index of a graph is larger, the reader uses the graph itself instead.
+    '''
+
+    graph_cache_dir: Optional[str] = None
+    '''
+    If set, parsed graphs are stored in this directory, and loaded from there when the
+    same source file is read again, e.g. in a later run. This is much faster than
+    parsing the file. See `GraphCache`.
+
+    Graphs are stored with `pickle`, so only use a directory that other users cannot
+    write to. Cached graphs are identified by the path, size, modification time and
+    content of the source file. If `parse_graph_from_filename` also parses other files,
+    changes in those files are not detected.
+    '''
+
+    graph_cache_max_bytes: Optional[int] = None
+    '''
+    The maximum total size of the files in `graph_cache_dir`, or `None` for no limit.
+    If the cache is larger, the least recently used graphs are removed.
+    '''
+
+    @property
+    def graph_cache(self) -> Optional['GraphCache']:
+        '''
+        The cache of parsed graphs of this reader, based on `graph_cache_dir` and
+        `graph_cache_max_bytes`, or `None` if `graph_cache_dir` is not set.
+        '''
+        if self.graph_cache_dir is None:
+            return None
+        cache = self.__dict__.get('_graph_cache')
+        if cache is None or cache.directory != self.graph_cache_dir:
+            cache = GraphCache(self.graph_cache_dir, self.graph_cache_max_bytes)
+            self._graph_cache = cache
+        return cache
+
+    streaming: bool = False
+    '''
+    If `True`, N-Triples (`.nt`) and N-Quads (`.nq`) files are read line by line,
+    instead of parsing the complete file into a graph with `parse_graph_from_filename`.
+    Memory usage then only depends on the number of triples per subject. Other formats
+    are parsed as usual.
+
+    The file should be grouped by subject: consecutive triples with the same subject
+    are collected in a small graph, which is passed to `document_subjects` and to the
+    extractors. Extractors can therefore only use the triples of the current subject;
+    predicate chains or collections that refer to other subjects will not find
+    anything. For N-Quads, the graph name of each triple is ignored.
+    '''
+
+    graph_workers: Optional[int] = None
+    '''
+    The default number of worker processes for `parse_graph_from_filenames`. If not
+    set, files are parsed one by one.
+
+    This is not used while reading in a worker process, e.g. when `documents()` is
+    called with `workers`.
+    '''
+
+    def _make_extraction_plan(self, selection=None) -> ExtractionPlan:
+        self._reject_extractors(extract.CSV, extract.XML)
+        return ExtractionPlan(
+            self.fields, ('graph', 'subject', 'metadata'), selection=selection
+        )
+
+    def source2dicts(self, source: Source, fields: Optional[Sequence[str]] = None) -> Iterable[Document]:
         '''
         Given a RDF source file, returns an iterable of extracted documents.
 
         Parameters:
             source: the source file to extract. This can be a string of the file path, or a tuple of the file path and metadata.
+            fields: optional list of the names of fields to extract. If omitted, all fields are extracted.
 
         Returns:
             an iterable of document dictionaries. Each of these is a dictionary,
                 where the keys are names of this Reader's `fields`, and the values
                 are based on the extractor of each field.
         '''
-        self._reject_extractors(extract.CSV, extract.XML)
-        
+        plan = self._extraction_plan(fields)
+
         if type(source) == bytes:
             raise Exception('The current reader cannot handle sources of bytes type, provide a file path as string instead')
         try:
@@ -44,16 +148,65 @@ class RDFReader(Reader):
             filename = source
             metadata = None
 
+        if self._use_streaming(filename):
+            logger.info(f"streaming {filename}")
+            for g in _subject_graphs(filename):
+                for subject in self.document_subjects(g):
+                    yield self._document_from_subject(g, subject, metadata, plan)
+            return
+
         logger.info(f"parsing {filename}")
-        g = self.parse_graph_from_filename(filename)
+        g = self._parse_graph(filename)
+        graph = self._graph_for_extractors(g)
         
         document_subjects = self.document_subjects(g)
         for subject in document_subjects:
-            yield self._document_from_subject(g, subject, metadata)
+            yield self._document_from_subject(graph, subject, metadata, plan)
+
+    def _use_streaming(self, filename: str) -> bool:
+        return self.streaming and guess_format(filename) in _LINE_FORMATS
+
+    def _graph_for_extractors(self, graph: Graph) -> Union[Graph, 'SubjectIndex']:
+        '''
+        The graph that is passed on to extractors: a `SubjectIndex` if `subject_index`
+        is enabled, or the graph itself.
+        '''
+        if not self.subject_index:
+            return graph
+        try:
+            index = SubjectIndex(graph, max_bytes=self.subject_index_max_bytes)
+        except MemoryError as error:
+            logger.warning(f'{error}; extracting from the graph instead')
+            return graph
+        logger.info(f'subject index uses {index.memory_usage} bytes')
+        return index
     
+    def _count_source_documents(self, source: Source) -> int:
+        # documents are based on subjects in the graph, so the graph must be parsed
+        if type(source) == bytes:
+            raise Exception('The current reader cannot handle sources of bytes type, provide a file path as string instead')
+        filename = source if isinstance(source, str) else source[0]
+        if self._use_streaming(filename):
+            return sum(
+                1 for g in _subject_graphs(filename) for _ in self.document_subjects(g)
+            )
+        g = self._parse_graph(filename)
+        return sum(1 for _ in self.document_subjects(g))
+
+    def _parse_graph(self, filename: str) -> Graph:
+        '''
+        Parse a graph with `parse_graph_from_filename`, using the `graph_cache` if it
+        is enabled.
+        '''
+        cache = self.graph_cache
+        if cache is None:
+            return self.parse_graph_from_filename(filename)
+        return cache.get(filename, self.parse_graph_from_filename)
+
     def parse_graph_from_filename(self, filename: str) -> Graph:
         ''' Read a RDF file as indicated by source, return a graph 
-        Override this function to parse multiple source files into one graph
+        Override this function to parse multiple source files into one graph;
+        `parse_graph_from_filenames` can be used to parse them in parallel.
 
         Parameters:
             filename: the name of the file to be parsed
@@ -65,10 +218,65 @@ class RDFReader(Reader):
         g.parse(filename)
         return g
             
+    def parse_graph_from_filenames(self, filenames: Sequence[str],
+                                   workers: Optional[int] = None) -> Graph:
+        '''
+        Parse several RDF files into one graph.
+
+        Blank nodes are scoped to the file they are in: a blank node label that is
+        used in two files refers to two different nodes. Blank nodes from different
+        files are therefore given new identifiers when they are merged.
+
+        Parameters:
+            filenames: the paths of the files. The format of each file is guessed
+                from its extension.
+            workers: if set, files are parsed in parallel in a pool of this many
+                worker processes. Defaults to `graph_workers`. The triples are still
+                added to the graph in the main process, which takes roughly a third
+                of the time of parsing them, so this does not help for a single
+                large file.
+
+        Returns:
+            rdflib Graph object
+        '''
+        workers = workers or self.graph_workers
+
+        if workers and len(filenames) > 1 and not parallel.in_worker():
+            graph = Graph()
+            results = parallel.map_reader_method(
+                self, '_pickled_file_triples', ((filename,) for filename in filenames),
+                workers=workers,
+            )
+            for result in results:
+                for data in result:
+                    triples, namespaces = pickle.loads(data)
+                    _add_triples(graph, triples, namespaces)
+            return graph
+
+        graph = None
+        for filename in filenames:
+            part = _parse_file(filename)
+            if graph is None:
+                graph = part
+            else:
+                _add_triples(graph, _scoped_triples(part), part.namespaces())
+        return graph if graph is not None else Graph()
+
+    def _pickled_file_triples(self, filename: str) -> List[bytes]:
+        # the triples are sent as a single pickle, rather than converting each term
+        # into a plain value in the pool
+        part = _parse_file(filename)
+        result = (list(_scoped_triples(part)), list(part.namespaces()))
+        return [pickle.dumps(result, protocol=pickle.HIGHEST_PROTOCOL)]
+
     def document_subjects(self, graph: Graph) -> Iterable[Union[BNode, Literal, URIRef]]:
         ''' Override this function to return all subjects (i.e., first part of RDF triple) 
         with which to search for data in the RDF graph.
         Typically, such subjects are identifiers or urls.
+
+        By default, this returns each subject in the graph once, in the order in which
+        the graph lists them. Subjects are filtered based on `subject_type` and
+        `required_predicates`.
         
         Parameters:
             graph: the graph to parse
@@ -76,10 +284,343 @@ class RDFReader(Reader):
         Returns:
             generator or list of nodes
         '''
-        return graph.subjects()
+        if self.subject_type is not None:
+            subjects = graph.subjects(RDF.type, self.subject_type)
+        else:
+            subjects = graph.subjects()
+        # a dictionary keeps the order of subjects
+        subjects = dict.fromkeys(subjects)
+
+        for predicate in self.required_predicates:
+            with_predicate = set(graph.subjects(predicate))
+            subjects = {
+                subject: None for subject in subjects if subject in with_predicate
+            }
+
+        return list(subjects)
+
+    def _document_from_subject(self, graph: Union[Graph, 'SubjectIndex'], subject: Union[BNode, Literal, URIRef], metadata: dict,
+                               plan: Optional[ExtractionPlan] = None) -> dict:
+        plan = plan or self._extraction_plan()
+        return {
+            name: extractor(graph, subject, metadata)
+            for name, extractor in plan.extractors
+        }
+
+
+class SubjectIndex:
+    '''
+    An index of the triples in a graph, by subject and predicate.
+
+    The index supports the parts of the `Graph` interface that the `RDF` extractor
+    uses: `objects(subject, predicate)`, `value(subject, predicate)` and
+    `items(list)`. Other attributes are looked up on the graph, so custom extractors
+    can use the index like a graph.
+
+    The index is built in a single pass over the triples of the graph. Nodes are
+    shared with the graph; the index itself stores a dictionary of predicates for
+    each subject, and a list of objects for each predicate. Its estimated size is
+    stored in `memory_usage`.
+
+    Parameters:
+        graph: the graph to index.
+        max_bytes: optional maximum for `memory_usage`.
+
+    Raises:
+        MemoryError: if the index uses more than `max_bytes`.
+    '''
+
+    def __init__(self, graph: Graph, max_bytes: Optional[int] = None):
+        self.graph = graph
+
+        index = {}
+        last_subject = predicates = None
+        for subject, predicate, object in graph.triples((None, None, None)):
+            # triples of the same subject are often consecutive
+            if subject is not last_subject:
+                predicates = index.get(subject)
+                if predicates is None:
+                    predicates = index[subject] = {}
+                last_subject = subject
+            objects = predicates.get(predicate)
+            if objects is None:
+                predicates[predicate] = [object]
+            else:
+                objects.append(object)
+
+        self.memory_usage: int = _index_size(index)
+        '''
+        The estimated memory used by the index in bytes, excluding the nodes
+        themselves, which are shared with the graph.
+        '''
+        if max_bytes is not None and self.memory_usage > max_bytes:
+            raise MemoryError(
+                f'Subject index of {self.memory_usage} bytes exceeds the maximum '
+                f'size of {max_bytes} bytes'
+            )
+        self._index = index
 
-    def _document_from_subject(self, graph: Graph, subject: Union[BNode, Literal, URIRef], metadata: dict) -> dict:
-        return {field.name: field.extractor.apply(graph=graph, subject=subject, metadata=metadata) for field in self.fields}
+    def __getattr__(self, name: str):
+        return getattr(self.graph, name)
+
+    def __len__(self) -> int:
+        return len(self.graph)
+
+    def __iter__(self):
+        return iter(self.graph)
+
+    def objects(self, subject: Node, predicate: Node) -> Iterator[Node]:
+        '''
+        Iterate over the objects of triples with a subject and predicate.
+        '''
+        return iter(self._index.get(subject, _NO_PREDICATES).get(predicate, ()))
+
+    def value(self, subject: Node, predicate: Node, default: Optional[Node] = None) -> Optional[Node]:
+        '''
+        The first object of a subject and predicate, or `default` if there is none.
+        '''
+        objects = self._index.get(subject, _NO_PREDICATES).get(predicate, ())
+        return next(iter(objects), default)
+
+    def items(self, list: Node) -> Iterator[Node]:
+        '''
+        Iterate over the items in an RDF collection, like `Graph.items`.
+        '''
+        chain = set([list])
+        while list:
+            item = self.value(list, RDF.first)
+            if item is not None:
+                yield item
+            list = self.value(list, RDF.rest)
+            if list in chain:
+                raise ValueError("List contains a recursive rdf:rest reference")
+            chain.add(list)
+
+
+_NO_PREDICATES = {}
+
+
+class GraphCache(object):
+    '''
+    A cache of parsed graphs on disk.
+
+    Graphs are stored with `pickle`. A cached graph is identified by the absolute path,
+    size, modification time and SHA-256 hash of its source file, so a file that
+    changes is parsed again.
+
+    Parameters:
+        directory: the directory in which graphs are stored. It is created if it does
+            not exist.
+        max_bytes: the maximum total size of the cached graphs. If `None`, the size is
+            not limited. When a graph is added, graphs that were used least recently
+            are removed until the cache fits.
+
+    Attributes:
+        hits: the number of times a graph was loaded from the cache.
+        misses: the number of times a graph had to be parsed.
+    '''
+
+    def __init__(self, directory: str, max_bytes: Optional[int] = None):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, filename: str, parse: Callable[[str], Graph]) -> Graph:
+        '''
+        Load a parsed graph from the cache, or parse it and add it to the cache.
+
+        Parameters:
+            filename: the path to the source file.
+            parse: a function that parses the file, given its path.
+        '''
+        path = os.path.join(self.directory, self._key(filename) + _GRAPH_CACHE_SUFFIX)
+
+        try:
+            with open(path, 'rb') as f:
+                graph = pickle.load(f)
+        except FileNotFoundError:
+            pass
+        except Exception:
+            logger.warning(f'Could not load cached graph {path}; parsing {filename}')
+        else:
+            self.hits += 1
+            # the modification time of cached graphs is their last use
+            os.utime(path)
+            return graph
+
+        self.misses += 1
+        graph = parse(filename)
+        self._store(path, graph)
+        self._evict()
+        return graph
+
+    def clear(self) -> None:
+        '''
+        Remove all graphs from the cache. This does not reset `hits` and `misses`.
+        '''
+        for path, _, _ in self._entries():
+            os.remove(path)
+
+    def _key(self, filename: str) -> str:
+        stat = os.stat(filename)
+        content = hashlib.sha256()
+        with open(filename, 'rb') as f:
+            for block in iter(lambda: f.read(1024 * 1024), b''):
+                content.update(block)
+        key = '\0'.join([
+            os.path.abspath(filename), str(stat.st_size), str(stat.st_mtime_ns),
+            content.hexdigest(),
+        ])
+        return hashlib.sha256(key.encode()).hexdigest()
+
+    def _store(self, path: str, graph: Graph) -> None:
+        os.makedirs(self.directory, exist_ok=True)
+        # write to a temporary file first, so other processes never read partial files
+        f = tempfile.NamedTemporaryFile(dir=self.directory, suffix='.tmp', delete=False)
+        try:
+            with f:
+                pickle.dump(graph, f, protocol=pickle.HIGHEST_PROTOCOL)
+            os.replace(f.name, path)
+        except Exception:
+            os.remove(f.name)
+            raise
+
+    def _entries(self) -> List[Tuple[str, float, int]]:
+        '''
+        The cached graphs, as `(path, last used, size)` tuples.
+        '''
+        if not os.path.isdir(self.directory):
+            return []
+        entries = []
+        for name in os.listdir(self.directory):
+            if name.endswith(_GRAPH_CACHE_SUFFIX):
+                path = os.path.join(self.directory, name)
+                stat = os.stat(path)
+                entries.append((path, stat.st_mtime, stat.st_size))
+        return entries
+
+    def _evict(self) -> None:
+        if self.max_bytes is None:
+            return
+        entries = sorted(self._entries(), key=lambda entry: entry[1])
+        total = sum(size for _, _, size in entries)
+        for path, _, size in entries:
+            if total <= self.max_bytes:
+                break
+            os.remove(path)
+            total -= size
+
+
+_GRAPH_CACHE_SUFFIX = '.graph.pickle'
+
+
+_LINE_FORMATS = {'nt', 'nquads'}
+
+_STREAMING_BATCH_LINES = 10000
+'''
+The number of lines that are parsed at once when streaming a file.
+'''
+
+
+class _RecordingStore(Memory):
+    '''
+    A store that records the triples that are added to it, in the order in which they
+    are added, instead of storing them.
+    '''
+
+    def __init__(self):
+        super().__init__()
+        self.added = []
+
+    def add(self, triple: Tuple[Node, Node, Node], context: Graph, quoted: bool = False) -> None:
+        self.added.append(triple)
+
+
+def _subject_graphs(filename: str) -> Iterator[Graph]:
+    '''
+    Parse an N-Triples or N-Quads file in batches of lines. Yields a graph for each
+    group of consecutive triples with the same subject.
+    '''
+    format = guess_format(filename)
+    # blank node labels refer to the same node throughout the file
+    bnodes = {}
+
+    with open(filename, 'r', encoding='utf-8', newline='') as f:
+        graph = Graph()
+        subject = None
+        while True:
+            lines = list(itertools.islice(f, _STREAMING_BATCH_LINES))
+            if not lines:
+                break
+            for triple in _parse_lines(''.join(lines), format, bnodes):
+                if triple[0] != subject and subject is not None:
+                    yield graph
+                    graph = Graph()
+                subject = triple[0]
+                graph.add(triple)
+
+        if subject is not None:
+            yield graph
+
+
+def _parse_lines(data: str, format: str, bnodes: Dict) -> List[Tuple[Node, Node, Node]]:
+    '''
+    Parse N-Triples or N-Quads data, and return its triples in order. The graph names
+    of quads are ignored.
+    '''
+    store = _RecordingStore()
+    graph = Dataset(store=store) if format == 'nquads' else Graph(store=store)
+    with warnings.catch_warnings():
+        # the N-Quads parser of rdflib uses its own deprecated API for every batch
+        warnings.simplefilter('ignore', DeprecationWarning)
+        graph.parse(data=data, format=format, bnode_context=bnodes)
+    return store.added
+
+
+def _parse_file(filename: str) -> Graph:
+    logger.info(f"parsing {filename}")
+    graph = Graph()
+    graph.parse(filename)
+    return graph
+
+
+def _scoped_triples(graph: Graph) -> Iterator[Tuple[Node, Node, Node]]:
+    '''
+    The triples of a graph, with each blank node replaced by a new one, so they do not
+    collide with blank nodes from other files.
+    '''
+    bnodes = {}
+    def scoped(node: Node) -> Node:
+        if not isinstance(node, BNode):
+            return node
+        if node not in bnodes:
+            bnodes[node] = BNode()
+        return bnodes[node]
+
+    for s, p, o in graph:
+        yield scoped(s), p, scoped(o)
+
+
+def _add_triples(graph: Graph, triples: Iterable[Tuple[Node, Node, Node]],
+                 namespaces: Iterable[Tuple[str, URIRef]]) -> None:
+    for prefix, namespace in namespaces:
+        graph.bind(prefix, namespace, override=False)
+    store = graph.store
+    for triple in triples:
+        store.add(triple, graph)
+
+
+def _index_size(index: Dict[Node, Dict[Node, List[Node]]]) -> int:
+    '''
+    The memory size of the dictionaries and lists of an index.
+    '''
+    size = sys.getsizeof(index)
+    for predicates in index.values():
+        size += sys.getsizeof(predicates)
+        for objects in predicates.values():
+            size += sys.getsizeof(objects)
+    return size
 
 
 def get_uri_value(node: URIRef) -> str:
@@ -1,10 +1,23 @@
+from collections import OrderedDict
+import io
 import logging
+from lxml import etree
 import openpyxl
+from openpyxl.formula.translate import Translator
+from openpyxl.styles.numbers import builtin_format_code, is_date_format, is_timedelta_format
+from openpyxl.utils.cell import column_index_from_string, range_boundaries
+from openpyxl.utils.datetime import CALENDAR_MAC_1904, CALENDAR_WINDOWS_1900, from_excel, from_ISO8601
 from openpyxl.worksheet.worksheet import Worksheet
-from typing import Iterable
+import os
+import posixpath
+import shutil
+import tempfile
+from typing import BinaryIO, Dict, Iterable, Iterator, List, Optional, Sequence, Set, Tuple, Union
+import warnings
+import zipfile
 
-from .core import Reader, Document, Source
-from .. import extract
+from .core import Reader, Document, Source, ExtractionPlan
+from .. import extract, parallel
 
 logger = logging.getLogger()
 
@@ -23,7 +36,8 @@ class XLSXReader(Reader):
     - each document spans a number of consecutive rows. In this case, there should be a
         column that indicates the identity of the document.
 
-    The XLSXReader will only look at the _first_ sheet in each file.
+    By default, the XLSXReader will only look at the _first_ sheet in each file. Use
+    `sheets` to read other sheets.
 
     In addition to generic extractor classes, this reader supports the `CSV` extractor.
     '''
@@ -47,14 +61,73 @@ class XLSXReader(Reader):
     use a fixed "preamble", e.g. to describe metadata or provenance.
     '''
 
+    streaming: bool = False
+    '''
+    If `True`, workbooks are opened in read-only mode, which reads rows on demand
+    instead of loading all cells into memory first. Memory usage then does not depend
+    on the size of the sheet, and the first document is extracted sooner.
+
+    Read-only workbooks do not include information about cell formatting or merged
+    cells, but this information is not used by the `CSV` extractor.
+    '''
+
+    engine: str = 'openpyxl'
+    '''
+    The library used to read workbooks. Options are:
+
+    - `'openpyxl'` (default): workbooks are loaded with openpyxl.
+    - `'xml'`: the reader parses the XML files in the workbook archive directly. Values
+        are converted in the same way as openpyxl does in read-only mode, but without
+        creating cell objects or reading styles other than number formats, which is
+        much faster. Array formulas are returned as strings, like other formulas.
+        This engine always streams rows, regardless of `streaming`.
+    '''
+
+    sheets: Optional[Union[str, List[str]]] = None
+    '''
+    The sheets to read in each file. Options are:
+
+    - `None` (default): only the first sheet.
+    - `'*'`: all sheets, in the order of the workbook.
+    - a list of sheet names, which are read in the order of the list.
 
-    def source2dicts(self, source: Source) -> Iterable[Document]:
+    All sheets should have the same layout. The name of the sheet is added to the
+    metadata of each document as `'sheet'`, so it can be extracted with
+    `Metadata('sheet')`. With the default `None`, this does not replace a `'sheet'`
+    in the metadata of the source. The `Order` of documents starts at 0 for each sheet.
+    '''
+
+    sheet_workers: Optional[int] = None
+    '''
+    If set, the sheets of a file are extracted in parallel, in a pool of this many
+    worker processes. Each worker opens the workbook itself, so this works best with
+    `streaming` or the `'xml'` engine, which do not load all sheets when opening a
+    file. Sources that are not a path are written to a temporary file, which the
+    workers open. Documents are returned in the same order as without workers.
+
+    This is not used while reading in a worker process, e.g. when `documents()` is
+    called with `workers`.
+    '''
+
+
+    def _make_extraction_plan(self, selection=None) -> ExtractionPlan:
+        self._reject_extractors(extract.XML)
+        return ExtractionPlan(
+            self.fields, ('rows', 'metadata', 'index'), source_arguments=('metadata',),
+            selection=selection,
+        )
+
+    def source2dicts(self, source: Source, fields: Optional[Sequence[str]] = None) -> Iterable[Document]:
         '''
         Given an XLSX source file, returns an iterable of extracted documents.
 
         Parameters:
             source: the source file to extract. This can be a string with the path to
-                the file, or a tuple with a path and a dictionary containing metadata.
+                the file, the contents of the file as bytes, or a binary file-like
+                object. It can also be a tuple of one of these and a dictionary
+                containing metadata.
+            fields: optional list of the names of fields to extract. If omitted, all
+                fields are extracted.
         
         Returns:
             an iterable of document dictionaries. Each of these is a dictionary,
@@ -62,24 +135,119 @@ class XLSXReader(Reader):
                 are based on the extractor of each field.
         '''
 
-        self._reject_extractors(extract.XML)
+        plan = self._extraction_plan(fields)
+        file, metadata = self._file_and_metadata_from_source(source)
+        # if only metadata and index are needed, documents are counted
+        count_only = plan.uses_only(['metadata', 'index'])
 
-        if isinstance(source, str):
-            filename = source
-            metadata = {}
-        elif isinstance(source, bytes):
-            raise NotImplementedError()
-        else:
-            filename, metadata = source
+        wb = self._load_workbook(file, read_only=self.streaming or count_only)
+        logger.info('Reading XLSX file {}...'.format(_file_name(file)))
+
+        try:
+            names = self._sheet_names(wb)
+        except Exception:
+            wb.close()
+            raise
+
+        if len(names) > 1 and self.sheet_workers and not parallel.in_worker():
+            wb.close()
+            yield from self._parallel_sheets2dicts(file, metadata, names, fields)
+            return
+
+        try:
+            for name in names:
+                yield from self._extract_sheet(wb, name, metadata, plan, count_only)
+        finally:
+            wb.close()
+
+    def _sheet_names(self, wb) -> List[str]:
+        '''
+        The names of the sheets to read in a workbook, based on `sheets`.
+        '''
+        if self.sheets is None:
+            return wb.sheetnames[:1]
+        if self.sheets == '*':
+            return wb.sheetnames
+        return list(self.sheets)
+
+    def _extract_sheet(self, wb, name: str, metadata: Dict, plan: ExtractionPlan,
+                       count_only: bool = False) -> Iterable[Document]:
+        sheet = wb[name]
+        if self.sheets is not None or 'sheet' not in metadata:
+            metadata = dict(metadata, sheet=name)
+        if count_only:
+            # the content of rows is not needed, only the number of documents
+            return self._documents_from_count(
+                self._count_sheet_documents(sheet), metadata, plan
+            )
+        return self._sheet2dicts(sheet, metadata, plan)
+
+    def _parallel_sheets2dicts(self, file: Union[str, BinaryIO], metadata: Dict,
+                               names: List[str],
+                               fields: Optional[Sequence[str]]) -> Iterable[Document]:
+        '''
+        Extract the sheets of a file in parallel. See `sheet_workers`.
+        '''
+        temporary = None
+        if not isinstance(file, str):
+            # file objects cannot be sent to workers, and sending the content with
+            # every task would copy the workbook for each sheet
+            file.seek(0)
+            with tempfile.NamedTemporaryFile(suffix='.xlsx', delete=False) as f:
+                shutil.copyfileobj(file, f)
+            file = temporary = f.name
+        selection = None if fields is None else tuple(fields)
+
+        try:
+            results = parallel.map_reader_method(
+                self, '_sheet2dicts_from_source',
+                (((file, metadata), name, selection) for name in names),
+                workers=self.sheet_workers,
+            )
+            for documents in results:
+                yield from documents
+        finally:
+            if temporary:
+                os.remove(temporary)
+
+    def _sheet2dicts_from_source(self, source: Source, name: str,
+                                 fields: Optional[Sequence[str]]) -> List[Document]:
+        plan = self._extraction_plan(fields)
+        file, metadata = self._file_and_metadata_from_source(source)
+        count_only = plan.uses_only(['metadata', 'index'])
+        wb = self._load_workbook(file, read_only=self.streaming or count_only)
+        try:
+            return list(self._extract_sheet(wb, name, metadata, plan, count_only))
+        finally:
+            wb.close()
 
-        wb = openpyxl.load_workbook(filename)
-        logger.info('Reading XLSX file {}...'.format(filename))
+    def _load_workbook(self, file: Union[str, BinaryIO], read_only: bool):
+        '''
+        Load a workbook with the configured `engine`. For both engines, worksheets
+        can be accessed by their name, and provide the `values` of their rows.
+        '''
+        if self.engine == 'xml':
+            return XLSXArchive(file)
+        if self.engine == 'openpyxl':
+            return openpyxl.load_workbook(file, read_only=read_only)
+        raise ValueError('Unknown XLSX engine: {}'.format(self.engine))
+
+    def _file_and_metadata_from_source(self, source: Source) -> Tuple[Union[str, BinaryIO], Dict]:
+        '''
+        Get a filename or binary file object that `openpyxl` can load from a source,
+        and the metadata of the source.
+        '''
+        if isinstance(source, tuple):
+            file, metadata = source
+        else:
+            file, metadata = source, {}
 
-        sheets = wb.sheetnames
-        sheet = wb[sheets[0]]
-        return self._sheet2dicts(sheet, metadata)
+        if isinstance(file, bytes):
+            file = io.BytesIO(file)
+        return file, metadata or {}
 
-    def _sheet2dicts(self, sheet: Worksheet, metadata):
+    def _sheet2dicts(self, sheet: Union[Worksheet, 'XLSXSheet'], metadata,
+                     plan: Optional[ExtractionPlan] = None):
         '''
         Extract documents from a single worksheet
         '''
@@ -90,6 +258,8 @@ class XLSXReader(Reader):
             next(data)
 
         header = list(next(data))
+        plan = plan or self._extraction_plan()
+        template = plan.source_template(None, metadata, None)
 
         index = 0
         document_id = None
@@ -110,16 +280,71 @@ class XLSXReader(Reader):
             document_id = identifier
 
             if is_new_document and rows:
-                yield self._document_from_rows(rows, metadata, index)
+                yield self._document_from_rows(rows, metadata, index, template, plan)
                 rows = [values]
                 index += 1
             else:
                 rows.append(values)
 
         if rows:
-            yield self._document_from_rows(rows, metadata, index)
+            yield self._document_from_rows(rows, metadata, index, template, plan)
+
+    def _count_source_documents(self, source: Source) -> int:
+        file, _ = self._file_and_metadata_from_source(source)
+        return self._count_documents_in_file(file)
+
+    def _count_documents_in_file(self, file: Union[str, BinaryIO]) -> int:
+        '''
+        Count the documents in an XLSX file, without extracting any fields.
+
+        The workbook is opened in read-only mode, which reads rows on demand.
+        '''
+        wb = self._load_workbook(file, read_only=True)
+        logger.info('Counting documents in XLSX file {}...'.format(_file_name(file)))
+        try:
+            return sum(
+                self._count_sheet_documents(wb[name]) for name in self._sheet_names(wb)
+            )
+        finally:
+            wb.close()
+
+    def _count_sheet_documents(self, sheet) -> int:
+        '''
+        Count the documents in a worksheet, based on `field_entry` and
+        `required_field`, in the same way as `_sheet2dicts`.
+        '''
+        data = (row for row in sheet.values)
+
+        for _ in range(self.skip_lines):
+            next(data)
+
+        header = list(next(data))
+        count = 0
+        document_id = None
+        has_rows = False
+
+        for row in data:
+            values = dict(zip(header, row))
+
+            if self.required_field and not values.get(self.required_field):
+                continue
+
+            identifier = values.get(self.field_entry, None)
+            is_new_document = identifier == None or identifier != document_id
+            document_id = identifier
+
+            if is_new_document and has_rows:
+                count += 1
+            has_rows = True
+
+        return count + 1 if has_rows else 0
 
-    def _document_from_rows(self, rows, metadata, doc_index):
+    def _documents_from_count(self, count: int, metadata, plan: ExtractionPlan):
+        template = plan.source_template(None, metadata, None)
+        for index in range(count):
+            yield self._document_from_rows(None, metadata, index, template, plan)
+
+    def _document_from_rows(self, rows, metadata, doc_index, template=None, plan=None):
         '''
         Extract a single document from a list of row data
 
@@ -129,13 +354,383 @@ class XLSXReader(Reader):
             doc_index: the index of this document in the source file. The first document
                 extracted from a file should have index 0, the second should have index 1,
                 and so forth.
+            template: optional document template with the source-invariant fields
+                of the source, from the `source_template` of the extraction plan. If
+                provided, only the other fields are extracted.
+        '''
+
+        plan = plan or self._extraction_plan()
+        if template is None:
+            return {
+                name: extractor(rows, metadata, doc_index)
+                for name, extractor in plan.extractors
+            }
+
+        doc = plan.document_from_template(template)
+        for name, extractor in plan.document_extractors:
+            doc[name] = extractor(rows, metadata, doc_index)
+        return doc
+
+
+def _file_name(file: Union[str, BinaryIO]) -> str:
+    if isinstance(file, str):
+        return file
+    return getattr(file, 'name', '<file object>')
+
+
+class XLSXArchive:
+    '''
+    A workbook that is read by parsing the XML files in the .xlsx archive directly.
+    This is used by `XLSXReader` when its `engine` is `'xml'`.
+
+    The archive provides the same interface as an openpyxl workbook for reading values:
+    `archive[name].values` iterates over the rows of a worksheet as tuples of values.
+    Shared strings and number formats are read when the archive is opened; rows are
+    parsed on demand.
+
+    Parameters:
+        file: the path to the file, or a binary file object.
+    '''
+
+    def __init__(self, file: Union[str, BinaryIO]):
+        self._zip = zipfile.ZipFile(file)
+        try:
+            self._read_workbook()
+        except Exception:
+            self._zip.close()
+            raise
+
+    @property
+    def sheetnames(self) -> List[str]:
+        '''
+        The names of the worksheets in the workbook, in order.
         '''
+        return list(self._sheet_paths)
 
-        doc = {
-            field.name: field.extractor.apply(
-                rows=rows, metadata=metadata, index=doc_index
+    def __getitem__(self, name: str) -> 'XLSXSheet':
+        return XLSXSheet(self, self._sheet_paths[name])
+
+    def close(self) -> None:
+        self._zip.close()
+
+    def _read_workbook(self) -> None:
+        package = self._relationships('_rels/.rels')
+        workbook_path = _relationship_target(package, 'officeDocument')
+        relationships = self._relationships(
+            posixpath.join(
+                posixpath.dirname(workbook_path),
+                '_rels',
+                posixpath.basename(workbook_path) + '.rels',
             )
-            for field in self.fields if not field.skip
+        )
+
+        workbook = etree.fromstring(self._zip.read(workbook_path))
+        properties = workbook.find(_sheet_tag('workbookPr'))
+        if properties is not None and properties.get('date1904') in ('1', 'true'):
+            self.epoch = CALENDAR_MAC_1904
+        else:
+            self.epoch = CALENDAR_WINDOWS_1900
+
+        self._sheet_paths = OrderedDict(
+            (sheet.get('name'), relationships[sheet.get(_RELATIONSHIP_ID)][1])
+            for sheet in workbook.iter(_sheet_tag('sheet'))
+        )
+
+        shared_strings_path = _relationship_target(relationships, 'sharedStrings')
+        self.shared_strings = self._read_shared_strings(shared_strings_path)
+
+        styles_path = _relationship_target(relationships, 'styles')
+        self.date_formats, self.timedelta_formats = self._read_number_formats(styles_path)
+
+    def _relationships(self, path: str) -> Dict[str, Tuple[str, str]]:
+        '''
+        Read a relationships file. Returns a dictionary that maps the ID of each
+        relationship to a tuple of its type and the path of its target in the archive.
+        '''
+        if path not in self._zip.namelist():
+            return {}
+
+        base = posixpath.dirname(posixpath.dirname(path))
+        tree = etree.fromstring(self._zip.read(path))
+        relationships = {}
+        for relationship in tree.iter('{%s}Relationship' % _PACKAGE_RELATIONSHIPS_NS):
+            if relationship.get('TargetMode') == 'External':
+                continue
+            target = relationship.get('Target')
+            if target.startswith('/'):
+                target = target[1:]
+            else:
+                target = posixpath.normpath(posixpath.join(base, target))
+            relationships[relationship.get('Id')] = (relationship.get('Type'), target)
+        return relationships
+
+    def _read_shared_strings(self, path: Optional[str]) -> List[str]:
+        if path is None:
+            return []
+
+        strings = []
+        with self._zip.open(path) as source:
+            for _, element in etree.iterparse(source, tag=_sheet_tag('si')):
+                # like openpyxl, this ignores phonetic text
+                strings.append(_text_content(element).replace('x005F_', ''))
+                _free_element(element)
+        return strings
+
+    def _read_number_formats(self, path: Optional[str]) -> Tuple[Set[int], Set[int]]:
+        '''
+        Find the cell styles that have a date or timedelta number format. Returns a
+        tuple of two sets of style indices.
+        '''
+        date_formats = set()
+        timedelta_formats = set()
+        if path is None:
+            return date_formats, timedelta_formats
+
+        styles = etree.fromstring(self._zip.read(path))
+        custom_formats = {
+            int(number_format.get('numFmtId')): number_format.get('formatCode')
+            for number_format in styles.iter(_sheet_tag('numFmt'))
         }
+        cell_formats = styles.find(_sheet_tag('cellXfs'))
+        if cell_formats is None:
+            return date_formats, timedelta_formats
 
-        return doc
+        for index, style in enumerate(cell_formats.iterchildren(_sheet_tag('xf'))):
+            format_id = int(style.get('numFmtId', 0))
+            if format_id in custom_formats:
+                number_format = custom_formats[format_id]
+            else:
+                number_format = builtin_format_code(format_id)
+            if is_date_format(number_format):
+                date_formats.add(index)
+            if is_timedelta_format(number_format):
+                timedelta_formats.add(index)
+        return date_formats, timedelta_formats
+
+
+class XLSXSheet:
+    '''
+    A worksheet in an `XLSXArchive`.
+    '''
+
+    def __init__(self, archive: XLSXArchive, path: str):
+        self._archive = archive
+        self._path = path
+
+    @property
+    def values(self) -> Iterator[tuple]:
+        '''
+        Iterate over the values in each row of the worksheet.
+
+        Like openpyxl in read-only mode, rows start at the first row and column of the
+        sheet, and missing rows and cells are filled with `None`, based on the
+        dimensions that are stored in the worksheet.
+        '''
+        with self._archive._zip.open(self._path) as source:
+            yield from self._parse_rows(source)
+
+    def _parse_rows(self, source: BinaryIO) -> Iterator[tuple]:
+        max_column = max_row = None
+        next_row = 1
+        row_index = 0
+        parse_cell = _CellParser(self._archive)
+
+        elements = etree.iterparse(
+            source, tag=(_sheet_tag('dimension'), _sheet_tag('row'))
+        )
+        for _, element in elements:
+            if element.tag != _ROW_TAG:
+                if element.get('ref'):
+                    _, _, max_column, max_row = range_boundaries(element.get('ref'))
+                continue
+
+            row_number = element.get('r')
+            row_index = _row_number(row_number) if row_number else row_index + 1
+            cells = parse_cell.row(element, row_index)
+            _free_element(element)
+
+            if max_row is not None and row_index > max_row:
+                break
+
+            # some rows are missing
+            while next_row < row_index:
+                next_row += 1
+                yield _empty_row(max_column)
+
+            if next_row <= row_index:
+                next_row += 1
+                yield _row_values(cells, max_column)
+
+        if max_row is not None:
+            while next_row <= max_row:
+                next_row += 1
+                yield _empty_row(max_column)
+
+
+class _CellParser:
+    '''
+    Converts cells in worksheet XML to values, in the same way as openpyxl.
+    '''
+
+    def __init__(self, archive: XLSXArchive):
+        self.shared_strings = archive.shared_strings
+        self.date_formats = archive.date_formats
+        self.timedelta_formats = archive.timedelta_formats
+        self.epoch = archive.epoch
+        self.shared_formulae = {}
+        self.columns = {}
+
+    def row(self, element: etree._Element, row_index: int) -> List[Tuple[int, object]]:
+        '''
+        Parse the cells of a row. Returns a list of `(column, value)` tuples.
+        '''
+        cells = []
+        column = 0
+        columns = self.columns
+        value = self.value
+        for cell in element.iterchildren(_CELL_TAG):
+            coordinate = cell.get('r')
+            if coordinate:
+                letters = coordinate.rstrip('0123456789')
+                column = columns.get(letters)
+                if column is None:
+                    column = columns[letters] = column_index_from_string(letters)
+            else:
+                column += 1
+            cells.append((column, value(cell, coordinate)))
+        return cells
+
+    def value(self, cell: etree._Element, coordinate: Optional[str]):
+        data_type = cell.get('t', 'n')
+        is_inline_string = data_type == 'inlineStr'
+        value = None
+        for child in cell:
+            tag = child.tag
+            if tag == _VALUE_TAG and not is_inline_string:
+                value = child.text or None
+            elif tag == _FORMULA_TAG:
+                return self.formula(child, coordinate)
+            elif tag == _INLINE_STRING_TAG and is_inline_string:
+                value = _text_content(child)
+
+        if value is None or is_inline_string:
+            return value
+        if data_type == 'n':
+            value = _cast_number(value)
+            style = cell.get('s')
+            style = int(style) if style else 0
+            if style in self.date_formats:
+                try:
+                    return from_excel(
+                        value, self.epoch, timedelta=style in self.timedelta_formats
+                    )
+                except (OverflowError, ValueError):
+                    warnings.warn(
+                        'Cell {} is marked as a date but the serial value {} is outside '
+                        'the limits for dates. The cell will be treated as an error.'
+                        .format(coordinate, value)
+                    )
+                    return '#VALUE!'
+            return value
+        if data_type == 's':
+            return self.shared_strings[int(value)]
+        if data_type == 'b':
+            return bool(int(value))
+        if data_type == 'd':
+            return from_ISO8601(value)
+        return value
+
+    def formula(self, formula: etree._Element, coordinate: Optional[str]) -> str:
+        value = '='
+        if formula.text is not None:
+            value += formula.text
+
+        if formula.get('t') == 'shared':
+            index = formula.get('si')
+            if index in self.shared_formulae:
+                return self.shared_formulae[index].translate_formula(coordinate)
+            if value != '=':
+                self.shared_formulae[index] = Translator(value, coordinate)
+        return value
+
+
+_SHEET_NS = 'http://schemas.openxmlformats.org/spreadsheetml/2006/main'
+_PACKAGE_RELATIONSHIPS_NS = 'http://schemas.openxmlformats.org/package/2006/relationships'
+_RELATIONSHIP_ID = '{http://schemas.openxmlformats.org/officeDocument/2006/relationships}id'
+
+
+def _sheet_tag(name: str) -> str:
+    return '{%s}%s' % (_SHEET_NS, name)
+
+
+_ROW_TAG = _sheet_tag('row')
+_CELL_TAG = _sheet_tag('c')
+_VALUE_TAG = _sheet_tag('v')
+_FORMULA_TAG = _sheet_tag('f')
+_INLINE_STRING_TAG = _sheet_tag('is')
+_TEXT_TAG = _sheet_tag('t')
+_RICH_TEXT_TAG = _sheet_tag('r')
+
+
+def _relationship_target(relationships: Dict[str, Tuple[str, str]],
+                         relationship_type: str) -> Optional[str]:
+    for type, target in relationships.values():
+        if type.endswith('/' + relationship_type):
+            return target
+
+
+def _text_content(element: etree._Element) -> str:
+    '''
+    The text of a string item (shared or inline), without formatting.
+    '''
+    snippets = []
+    for child in element:
+        if child.tag == _TEXT_TAG:
+            snippets.append(child.text or '')
+        elif child.tag == _RICH_TEXT_TAG:
+            text = child.find(_TEXT_TAG)
+            if text is not None:
+                snippets.append(text.text or '')
+    return ''.join(snippets)
+
+
+def _cast_number(value: str) -> Union[int, float]:
+    if '.' in value or 'E' in value or 'e' in value:
+        return float(value)
+    return int(value)
+
+
+def _row_number(value: str) -> int:
+    try:
+        return int(value)
+    except ValueError:
+        number = float(value)
+        if number.is_integer():
+            return int(number)
+        raise ValueError('{} is not a valid row number'.format(value))
+
+
+def _empty_row(width: Optional[int]) -> tuple:
+    return (None,) * (width or 0)
+
+
+def _row_values(cells: List[Tuple[int, object]], width: Optional[int]) -> tuple:
+    if not cells and not width:
+        return ()
+    width = width or cells[-1][0]
+    values = [None] * width
+    for column, value in cells:
+        if column <= width:
+            values[column - 1] = value
+    return tuple(values)
+
+
+def _free_element(element: etree._Element) -> None:
+    '''
+    Free the memory used by an element and its preceding siblings, while parsing
+    with `iterparse`.
+    '''
+    element.clear(keep_tail=False)
+    parent = element.getparent()
+    while parent is not None and element.getprevious() is not None:
+        del parent[0]
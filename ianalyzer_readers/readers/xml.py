@@ -5,13 +5,21 @@ Extraction is based on BeautifulSoup.
 '''
 
 import bs4
+from collections import OrderedDict
+import copy
+import io
+import itertools
 import logging
+from lxml import etree
+import os
 from os.path import isfile
-from typing import Dict, Iterable, Tuple, List
+from typing import Any, Callable, Dict, Iterable, Tuple, List, Optional, Sequence, Set, Union
 
 from .. import extract
-from .core import Reader, Source, Document, Field
-from ..xml_tag import CurrentTag, resolve_tag_specification, TagSpecification
+from .core import Reader, Source, Document, Field, ExtractionPlan
+from ..xml_tag import (
+    CurrentTag, Tag, TagIndex, resolve_tag_specification, TagSpecification
+)
 
 
 logger = logging.getLogger()
@@ -72,36 +80,136 @@ class XMLReader(Reader):
         the document.
     '''
 
-    def source2dicts(self, source: Source) -> Iterable[Document]:
+    streaming: bool = False
+    '''
+    If `True`, source files are parsed incrementally, so memory usage does not depend
+    on the size of the file. This is useful for large files that contain many entries.
+
+    Streaming requires that `tag_entry` is a `Tag` that only specifies a tag name, e.g.
+    `Tag('record')`. If it is not, the reader will parse the complete file instead.
+
+    When streaming, each entry is parsed as a separate tree, so tags that look outside
+    of the entry (like `ParentTag` or `NextTag`) will not find anything. The tree for
+    `tag_toplevel` only contains the content of the file up to the first entry, with
+    the entry removed. Entries nested inside other entries are only extracted as part
+    of the outer entry.
+    '''
+
+    backend: str = 'bs4'
+    '''
+    The library used to parse and query source files. Options are:
+
+    - `'bs4'`: BeautifulSoup (the default).
+    - `'lxml'`: lxml. Tags are compiled to XPath queries, which is much faster than
+        searching a BeautifulSoup tree. The extracted documents are the same.
+
+    Not all tags and extractors can be used with lxml: this includes `TransformTag`,
+    tags that filter on a function or on string content, and XML extractors that use
+    `extract_soup_func`. If a reader uses any of these for a source, that source is
+    parsed with BeautifulSoup instead.
+    '''
+
+    parse_only: Union[bool, bs4.SoupStrainer] = False
+    '''
+    Limits which parts of a source are parsed with BeautifulSoup. Skipping the rest of
+    the document saves both parsing time and memory. Options are:
+
+    - `False`: parse the complete document (the default).
+    - `True`: derive a filter from `tag_toplevel`, `tag_entry` and the `XML`
+        extractors of the fields, so only the elements that they can reach are parsed.
+        This requires that all tags are static, and that queries which start from the
+        document (like `tag_toplevel`, or the first tag of a field with
+        `toplevel=True` if `tag_toplevel` is `CurrentTag()`) are `Tag`s that select
+        descendants by name. Other tags must be `Tag` or `CurrentTag` queries, and
+        fields cannot use `extract_soup_func` or custom extractors. If the reader does
+        not meet these conditions, the complete document is parsed.
+    - A `bs4.SoupStrainer`, which is passed on to BeautifulSoup as `parse_only`. The
+        parsed document then only contains the elements that match the strainer, so
+        make sure that it includes everything that the reader needs.
+
+    This does not affect sources that are parsed with lxml or streamed.
+    '''
+
+    tag_index: bool = False
+    '''
+    If `True`, the reader builds a `TagIndex` of each source that it parses with
+    BeautifulSoup. `Tag` queries that only filter on a tag name and attribute values
+    are then answered from the index, instead of searching the tree. This is faster
+    for readers with many fields, at the cost of one pass over the document and the
+    memory for the index.
+
+    This has no effect when `streaming`, or for sources that are parsed with lxml,
+    which searches the tree much faster.
+    '''
+
+    external_file_cache_size: int = 0
+    '''
+    The maximum number of parsed external files that the reader keeps in memory. This
+    is useful if many sources refer to the same external file. By default, caching is
+    disabled, and the external file is parsed again for each source.
+
+    A cached file is shared by all sources that refer to it, so only enable caching if
+    fields with `external_file=True` do not modify the tree (e.g. with `decompose()`
+    or `extract()` in an `extract_soup_func` or `transform`): later sources would see
+    the modified tree.
+    '''
+
+    external_file_cache_bytes: Optional[int] = 64 * 1024 * 1024
+    '''
+    The maximum total size (on disk, in bytes) of external files that the reader keeps
+    in memory, or `None` for no limit. Note that a parsed document uses several times
+    more memory than the file itself. Files that are larger than this are not cached.
+    '''
+
+    _cached_attributes = Reader._cached_attributes + ('_external_file_cache',)
+
+    @property
+    def external_file_cache(self) -> 'ExternalFileCache':
+        '''
+        The cache of parsed external files of this reader, based on
+        `external_file_cache_size` and `external_file_cache_bytes`.
+        '''
+        cache = self.__dict__.get('_external_file_cache')
+        if cache is None:
+            cache = ExternalFileCache(
+                self.external_file_cache_size, self.external_file_cache_bytes
+            )
+            self._external_file_cache = cache
+        return cache
+
+    def source2dicts(self, source: Source, fields: Optional[Sequence[str]] = None) -> Iterable[Document]:
         '''
         Given an XML source file, returns an iterable of extracted documents.
 
         Parameters:
             source: the source file to extract. This can be a string with the path to
                 the file, or a tuple with a path and a dictionary containing metadata.
+            fields: optional list of the names of fields to extract. If omitted, all
+                fields are extracted.
         
         Returns:
             an iterable of document dictionaries. Each of these is a dictionary,
                 where the keys are names of this Reader's `fields`, and the values
                 are based on the extractor of each field.
         '''
-        # Make sure that extractors are sensible
-        self._reject_extractors(extract.CSV)
-
-        filename, soup, metadata = self._filename_soup_and_metadata_from_source(source)
+        plan = self._extraction_plan(fields)
+
+        filename, data, metadata = self._filename_data_and_metadata_from_source(source)
+        use_lxml = self.backend == 'lxml' and plan.supports_lxml(metadata)
+        if plan.uses_only(['metadata', 'index'], plan.regular_fields):
+            # the content of entries is not needed, only their number
+            count = self._count_entries(filename, data, metadata)
+            entries = itertools.repeat((None, None), count)
+        else:
+            entries = self._entries_from_source(filename, data, metadata, use_lxml, plan)
 
-        # split fields that read an external file from regular fields
-        external_fields = [field for field in self.fields if
-            isinstance(field.extractor, extract.XML) and field.extractor.external_file
-        ]
-        regular_fields = [field for field in self.fields if
-            field not in external_fields
-        ]
+        external_fields = plan.external_fields
 
         # extract information from external xml files first, if applicable
         if len(external_fields):
             if  metadata and 'external_file' in metadata:
-                external_soup = self._soup_from_xml(metadata['external_file'])
+                external_file = self._external_file(metadata['external_file'], use_lxml)
+                external_soup = external_file.tree
             else:
                 logger.warn(
                     'Some fields have external_file property, but no external file is '
@@ -109,86 +217,327 @@ class XMLReader(Reader):
                 )
                 external_soup = None        
 
-        required_fields = [
-            field.name for field in self.fields if field.required]
+        required_fields = plan.required_fields
 
         # iterate through entries
-        top_tag = resolve_tag_specification(self.__class__.tag_toplevel, metadata)
-        bowl = top_tag.find_next_in_soup(soup)
-
-        if bowl:
-            entry_tag = resolve_tag_specification(self.__class__.tag_entry, metadata)
-            spoonfuls = entry_tag.find_in_soup(bowl)
-            for i, spoon in enumerate(spoonfuls):
-                # Extract fields from the soup
-                field_dict = {
-                    field.name: field.extractor.apply(
-                        soup_top=bowl,
-                        soup_entry=spoon,
-                        metadata=metadata,
-                        index=i,
-                    ) for field in regular_fields if not field.skip
+        template = None
+        for i, (bowl, spoon) in enumerate(entries):
+            # source-invariant fields only need to be extracted once
+            if template is None:
+                template = plan.source_template(bowl, None, metadata, None)
+
+            # Extract fields from the soup
+            field_dict = plan.document_from_template(template)
+            for name, extractor in plan.document_extractors:
+                field_dict[name] = extractor(bowl, spoon, metadata, i)
+
+            if external_fields and external_soup:
+                metadata.update(field_dict)
+                external_dict = self._external_source2dict(
+                    external_file, plan.external_extractors, metadata)
+            else:
+                external_dict = {
+                    field.name: None
+                    for field in external_fields
                 }
 
-                if external_fields and external_soup:
-                    metadata.update(field_dict)
-                    external_dict = self._external_source2dict(
-                        external_soup, external_fields, metadata)
-                else:
-                    external_dict = {
-                        field.name: None
-                        for field in external_fields
-                    }
-
-                # yield the union of external fields and document fields
-                field_dict.update(external_dict)
-                if all(field_name in field_dict for field_name in required_fields):
-                    yield field_dict
+            # yield the union of external fields and document fields
+            field_dict.update(external_dict)
+            if all(field_name in field_dict for field_name in required_fields):
+                for field_name in plan.hidden_fields:
+                    del field_dict[field_name]
+                yield field_dict
+
+        # do not keep the last entry in memory
+        plan.shared_selection.clear()
+
+    def _make_extraction_plan(self, selection=None) -> 'XMLExtractionPlan':
+        # Make sure that extractors are sensible
+        self._reject_extractors(extract.CSV)
+        return XMLExtractionPlan(
+            self.fields,
+            self.__class__.tag_toplevel,
+            self.__class__.tag_entry,
+            self.__class__.external_file_tag_toplevel,
+            selection=selection,
+        )
+
+    def _entries_from_source(self, filename: Optional[str], data: Optional[bytes],
+                             metadata: Dict, use_lxml: bool = False,
+                             plan: Optional['XMLExtractionPlan'] = None,
+                             ) -> Iterable[Tuple[bs4.PageElement, bs4.PageElement]]:
+        '''
+        Iterate over the entries in a source.
+
+        If `tag_index` is enabled, the `TagIndex` of the source is passed on to the
+        shared selection of `plan`, which extracts the documents.
+
+        Returns:
+            an iterable of `(bowl, spoon)` tuples, where `bowl` is the top-level
+                element and `spoon` the entry element of each document.
+        '''
+        if self.streaming:
+            entry_tag = self._extraction_plan().resolve_tag('tag_entry', metadata)
+            entry_name = _plain_tag_name(entry_tag)
+            if entry_name:
+                return self._stream_entries(filename, data, metadata, entry_name, use_lxml)
+            logger.warning(
+                'Cannot stream entries of `{}`: tag_entry is not a plain tag name'.format(
+                    filename)
+            )
+
+        if use_lxml:
+            if filename:
+                soup = self._tree_from_xml(filename)
+            else:
+                soup = self._tree_from_data(data)
+        elif filename:
+            soup = self._soup_from_xml(filename, self._parse_filter())
         else:
+            soup = self._soup_from_data(data, self._parse_filter())
+        index = None
+        if self.tag_index and not use_lxml:
+            index = TagIndex(soup)
+            if plan is not None:
+                plan.shared_selection.index = index
+        return self._soup_entries(soup, filename, metadata, use_lxml, index)
+
+    def _soup_entries(self, soup: bs4.BeautifulSoup, filename: Optional[str], metadata: Dict,
+                      use_lxml: bool = False, index: Optional[TagIndex] = None):
+        top_tag = self._extraction_plan().resolve_tag('tag_toplevel', metadata)
+        bowl = _find_next(top_tag, soup, use_lxml, index)
+
+        if bowl is None if use_lxml else not bowl:
             logger.warning(
                 'Top-level tag not found in `{}`'.format(filename))
+            return
+
+        entry_tag = self._extraction_plan().resolve_tag('tag_entry', metadata)
+        for spoon in _find_all(entry_tag, bowl, use_lxml, index):
+            yield bowl, spoon
+
+    def _stream_entries(self, filename: Optional[str], data: Optional[bytes],
+                        metadata: Dict, entry_name: str, use_lxml: bool = False,
+                        copy_entries: bool = True):
+        '''
+        Iterate over the entries in a source without parsing the complete file.
+
+        Each entry is copied into a separate tree; afterwards, the entry is removed from
+        the tree that lxml builds while parsing. If `copy_entries` is `False`, the
+        entries are not copied, and `None` is returned for each entry instead.
+        '''
+        logger.info('Streaming XML file {} ...'.format(filename))
+        is_entry = _tag_name_matcher(entry_name)
+
+        context = etree.iterparse(
+            filename or io.BytesIO(data),
+            events=('end',),
+            tag=_iterparse_tag(entry_name),
+            recover=True,
+            huge_tree=True,
+        )
+
+        bowl = None
+
+        for _, element in context:
+            if not is_entry(element):
+                continue
+            if any(is_entry(ancestor) for ancestor in element.iterancestors()):
+                continue
+
+            if bowl is None:
+                bowl = self._stream_toplevel(element, is_entry, metadata, use_lxml)
+                if bowl is None:
+                    logger.warning(
+                        'Top-level tag not found in `{}`'.format(filename))
+                    return
+
+            if copy_entries:
+                yield bowl, self._stream_entry(element, use_lxml)
+            else:
+                yield bowl, None
+            _free_element(element)
+
+        del context
+
+    def _count_source_documents(self, source: Source) -> int:
+        filename, data, metadata = self._filename_data_and_metadata_from_source(source)
+        return self._count_entries(filename, data, metadata)
+
+    def _count_entries(self, filename: Optional[str], data: Optional[bytes],
+                       metadata: Dict) -> int:
+        '''
+        Count the entries in a source, without extracting any fields.
+
+        If `tag_toplevel` and `tag_entry` only specify tag names, the file is scanned
+        without building a complete tree. Otherwise, the source is parsed as usual.
+        '''
+        plan = self._extraction_plan()
+        top_tag = plan.resolve_tag('tag_toplevel', metadata)
+        entry_tag = plan.resolve_tag('tag_entry', metadata)
+        entry_name = _plain_tag_name(entry_tag)
+        if type(top_tag) is CurrentTag:
+            top_name = None
+        else:
+            top_name = _plain_tag_name(top_tag)
+
+        if not entry_name or not (top_name or type(top_tag) is CurrentTag):
+            return sum(1 for _ in self._entries_from_source(filename, data, metadata))
+        if self.streaming:
+            entries = self._stream_entries(
+                filename, data, metadata, entry_name, use_lxml=True, copy_entries=False
+            )
+            return sum(1 for _ in entries)
+        return self._scan_entries(filename, data, top_name, entry_name)
+
+    def _scan_entries(self, filename: Optional[str], data: Optional[bytes],
+                      top_name: Optional[str], entry_name: str) -> int:
+        '''
+        Count entries by scanning the source with lxml.
+
+        Parameters:
+            top_name: the name of the top-level tag, or `None` if the top level is the
+                document itself.
+            entry_name: the name of the entry tag.
+        '''
+        is_entry = _tag_name_matcher(entry_name)
+        is_top = _tag_name_matcher(top_name) if top_name else None
+        tags = {_iterparse_tag(entry_name)}
+        if top_name:
+            tags.add(_iterparse_tag(top_name))
+
+        context = etree.iterparse(
+            filename or io.BytesIO(data),
+            events=('start', 'end'),
+            tag=list(tags),
+            recover=True,
+            huge_tree=True,
+        )
+
+        # entries are counted inside the first top-level element, including nested
+        # entries
+        inside = top_name is None
+        bowl = None
+        open_entries = 0
+        count = 0
+
+        for event, element in context:
+            if event == 'start':
+                if not inside and is_top(element):
+                    bowl = element
+                    inside = True
+                elif inside and is_entry(element):
+                    count += 1
+                    open_entries += 1
+            else:
+                if element is bowl:
+                    break
+                if inside and is_entry(element):
+                    open_entries -= 1
+                    if not open_entries:
+                        _free_element(element)
+
+        del context
+
+        if not inside:
+            logger.warning('Top-level tag not found in `{}`'.format(filename))
+            return 0
+        return count
+
+    def _stream_toplevel(self, first_entry: etree._Element, is_entry: Callable,
+                         metadata: Dict, use_lxml: bool = False) -> Optional[bs4.PageElement]:
+        '''
+        Find the top-level element while streaming, based on the content of the file
+        up to the first entry.
+        '''
+        root = copy.deepcopy(first_entry.getroottree().getroot())
+        for element in list(root.iter()):
+            if is_entry(element) and element.getparent() is not None:
+                element.getparent().remove(element)
+        if use_lxml:
+            soup = root.getroottree()
+        else:
+            soup = self._soup_from_data(etree.tostring(root))
+        top_tag = self._extraction_plan().resolve_tag('tag_toplevel', metadata)
+        return _find_next(top_tag, soup, use_lxml)
+
+    def _stream_entry(self, element: etree._Element, use_lxml: bool = False) -> bs4.PageElement:
+        if use_lxml:
+            return copy.deepcopy(element)
+        soup = self._soup_from_data(etree.tostring(element, with_tail=False))
+        return soup.find(True)
+
+    def _external_file(self, filename: str, use_lxml: bool = False) -> 'ExternalFile':
+        '''
+        Returns the parsed external file, from the cache if possible.
+        '''
+        if use_lxml:
+            return self.external_file_cache.get(filename, 'lxml', self._tree_from_xml)
+        return self.external_file_cache.get(filename, 'bs4', self._soup_from_xml)
 
-    def _external_source2dict(self, soup, external_fields: List[Field], metadata: Dict):
+    def _external_source2dict(self, external_file: 'ExternalFile',
+                              external_extractors: List[Tuple[str, Callable]],
+                              metadata: Dict):
         '''
         given an external xml file with metadata,
         return a dictionary with tags which were found in that metadata
         wrt to the current source.
+
+        `external_extractors` is a list of `(name, extractor)` tuples with compiled
+        extractors, as in `XMLExtractionPlan.external_extractors`.
         '''
-        tag = resolve_tag_specification(self.__class__.external_file_tag_toplevel, metadata)
-        bowl = tag.find_next_in_soup(soup)
+        soup = external_file.tree
+        use_lxml = isinstance(soup, etree._ElementTree)
+        plan = self._extraction_plan()
+        if plan.static_tag('external_file_tag_toplevel'):
+            # the top-level element is the same for every entry
+            bowl = external_file.toplevel(
+                lambda: _find_next(plan.resolve_tag('external_file_tag_toplevel', None),
+                                   soup, use_lxml)
+            )
+        else:
+            tag = plan.resolve_tag('external_file_tag_toplevel', metadata)
+            bowl = _find_next(tag, soup, use_lxml)
 
-        if not bowl:
+        if bowl is None if use_lxml else not bowl:
             logger.warning(
                 'Top-level tag not found in `{}`'.format(metadata['external_file']))
-            return {field.name: None for field in external_fields}
+            return {name: None for name, _ in external_extractors}
 
         return {
-            field.name: field.extractor.apply(
-                soup_top=bowl, soup_entry=bowl, metadata=metadata
-            )
-            for field in external_fields
+            name: extractor(bowl, bowl, metadata)
+            for name, extractor in external_extractors
         }
 
-    def _filename_soup_and_metadata_from_source(self, source: Source) -> Tuple[str, bs4.BeautifulSoup, Dict]:
+    def _filename_data_and_metadata_from_source(self, source: Source) -> Tuple[Optional[str], Optional[bytes], Dict]:
         if isinstance(source, str):
             filename = source
-            soup = self._soup_from_xml(filename)
+            data = None
             metadata = {}
         elif isinstance(source, bytes):
-            soup = self._soup_from_data(source)
             filename = None
+            data = source
             metadata = {}
         else:
             if isfile(source[0]):
                 filename = source[0]
-                soup = self._soup_from_xml(filename)
+                data = None
             else:
                 filename = None
-                soup = self._soup_from_data(source[0])
+                data = source[0]
             metadata = source[1] or None
-        return filename, soup, metadata
+        return filename, data, metadata
 
-    def _soup_from_xml(self, filename):
+    def _parse_filter(self, plan: Optional['XMLExtractionPlan'] = None
+                      ) -> Optional[bs4.SoupStrainer]:
+        '''
+        The `parse_only` filter for BeautifulSoup, based on the `parse_only` setting.
+        '''
+        if self.parse_only is True:
+            return (plan or self._extraction_plan()).parse_filter()
+        return self.parse_only or None
+
+    def _soup_from_xml(self, filename, parse_only: Optional[bs4.SoupStrainer] = None):
         '''
         Returns beatifulsoup soup object for a given xml file
         '''
@@ -197,10 +546,446 @@ class XMLReader(Reader):
         with open(filename, 'rb') as f:
             data = f.read()
         logger.info('Loaded {} into memory...'.format(filename))
-        return self._soup_from_data(data)
+        return self._soup_from_data(data, parse_only)
 
-    def _soup_from_data(self, data):
+    def _soup_from_data(self, data, parse_only: Optional[bs4.SoupStrainer] = None):
         '''
         Parses content of a xml file
         '''
-        return bs4.BeautifulSoup(data, 'lxml-xml')
+        return bs4.BeautifulSoup(data, 'lxml-xml', parse_only=parse_only)
+
+    def _tree_from_xml(self, filename) -> etree._ElementTree:
+        '''
+        Returns an lxml element tree for a given xml file
+        '''
+        logger.info('Reading XML file {} ...'.format(filename))
+        return etree.parse(filename, _xml_parser())
+
+    def _tree_from_data(self, data) -> etree._ElementTree:
+        '''
+        Parses content of a xml file as an lxml element tree
+        '''
+        if isinstance(data, str):
+            data = data.encode('utf-8')
+        return etree.parse(io.BytesIO(data), _xml_parser())
+
+
+class XMLExtractionPlan(ExtractionPlan):
+    '''
+    The extraction plan of an XMLReader.
+
+    In addition to the general extraction plan, this splits up fields that read from an
+    external file, and keeps track of the tag specifications of the reader. Whether the
+    reader can use lxml is only checked once, unless it depends on the metadata of the
+    source.
+
+    Parameters:
+        fields: the fields of the reader.
+        tag_toplevel: the `tag_toplevel` specification of the reader.
+        tag_entry: the `tag_entry` specification of the reader.
+        external_file_tag_toplevel: the `external_file_tag_toplevel` specification of
+            the reader.
+        selection: optional list of the names of fields that should be extracted.
+        html: whether the sources are HTML documents. This affects which tags can be
+            used with lxml.
+
+    `XML` extractors are compiled with a `SharedSelection`, so fields that start with
+    the same tags share their results for each entry.
+
+    Extractors of external fields can use the values of all regular fields (through
+    the metadata), so if the selection includes an external field, all regular fields
+    are extracted. Regular fields that were not selected are listed in `hidden_fields`.
+
+    Extractors are compiled with the arguments `soup_top`, `soup_entry`, `metadata` and
+    `index`; extractors of external fields are compiled without `index`. The source
+    template only contains regular fields. Since the values of regular fields are added
+    to the metadata when a reader uses external fields, the metadata only counts as
+    source-invariant if there are no external fields.
+
+    Attributes:
+        external_fields: fields that are extracted from an external file.
+        regular_fields: fields that are extracted from the source.
+        external_extractors: compiled extractors of `external_fields`.
+        regular_extractors: compiled extractors of `regular_fields`.
+        tags: the tag specifications of the reader, by attribute name.
+        shared_selection: the `SharedSelection` of the compiled extractors.
+        html: whether the sources are HTML documents.
+    '''
+
+    def __init__(self, fields: List[Field], tag_toplevel: TagSpecification,
+                 tag_entry: TagSpecification, external_file_tag_toplevel: TagSpecification,
+                 selection: Optional[Sequence[str]] = None, html: bool = False):
+        hidden_fields = []
+        if selection is not None and any(
+            _is_external_field(field) and field.name in selection for field in fields
+        ):
+            hidden_fields = [
+                field.name for field in fields if not field.skip
+                and not _is_external_field(field) and field.name not in selection
+            ]
+            selection = list(selection) + hidden_fields
+
+        self.shared_selection = extract.SharedSelection()
+        super().__init__(
+            fields, ('soup_top', 'soup_entry', 'metadata', 'index'), selection=selection
+        )
+        self.hidden_fields = hidden_fields
+        self.external_fields = [
+            field for field in self.fields if _is_external_field(field)
+        ]
+        self.regular_fields = [
+            field for field in self.fields if not _is_external_field(field)
+        ]
+        self.external_extractors = self.compile(
+            self.external_fields, ('soup_top', 'soup_entry', 'metadata')
+        )
+        self.regular_extractors = [
+            (field.name, extractor)
+            for field, (_, extractor) in zip(self.fields, self.extractors)
+            if not _is_external_field(field)
+        ]
+        if self.external_fields:
+            source_arguments = ('soup_top',)
+        else:
+            source_arguments = ('soup_top', 'metadata')
+        self._split_extractors(self.regular_fields, self.regular_extractors, source_arguments)
+        self.tags = {
+            'tag_toplevel': tag_toplevel,
+            'tag_entry': tag_entry,
+            'external_file_tag_toplevel': external_file_tag_toplevel,
+        }
+        self._static_tags = not any(
+            callable(tag) for tag in self._tag_specifications()
+        )
+        self.html = html
+        self._lxml_support = None
+
+    def compile(self, fields: List[Field], arguments: Sequence[str],
+                columns: Optional[Dict[str, int]] = None) -> List[Tuple[str, Callable]]:
+        with self.shared_selection.sharing():
+            return super().compile(fields, arguments, columns)
+
+    def resolve_tag(self, name: str, metadata: Dict) -> Tag:
+        '''
+        Resolve one of the tag specifications of the reader for a source.
+
+        Parameters:
+            name: the name of the tag specification, e.g. `'tag_entry'`.
+            metadata: the metadata of the source.
+        '''
+        return resolve_tag_specification(self.tags[name], metadata)
+
+    def static_tag(self, name: str) -> bool:
+        '''
+        Whether one of the tag specifications of the reader is the same for every
+        source, i.e. not a callable.
+        '''
+        return not callable(self.tags[name])
+
+    def supports_lxml(self, metadata: Dict) -> bool:
+        '''
+        Whether the tags and extractors of the reader can be used with lxml for a
+        source.
+        '''
+        if not self._static_tags:
+            return self._check_lxml_support(metadata)
+        if self._lxml_support is None:
+            self._lxml_support = self._check_lxml_support(metadata)
+        return self._lxml_support
+
+    def _check_lxml_support(self, metadata: Dict) -> bool:
+        try:
+            tags = [self.resolve_tag(name, metadata) for name in self.tags]
+        except Exception:
+            return False
+        if not all(tag.supports_lxml(self.html) for tag in tags):
+            return False
+
+        for field in self.fields:
+            for extractor in field.extractor.walk():
+                if isinstance(extractor, extract.XML):
+                    if not extractor.supports_lxml(metadata, self.html):
+                        return False
+                elif type(extractor).__module__ != extract.__name__:
+                    # custom extractors may expect BeautifulSoup elements
+                    return False
+        return True
+
+    def parse_filter(self, entries_from_top: bool = True) -> Optional[bs4.SoupStrainer]:
+        '''
+        A filter for BeautifulSoup that only parses the elements that the reader can
+        reach, or `None` if the complete document should be parsed. See
+        `XMLReader.parse_only` for the conditions.
+
+        Parameters:
+            entries_from_top: whether entries are searched within the top-level tag,
+                rather than in the whole document.
+        '''
+        cache = self.__dict__.setdefault('_parse_filters', {})
+        if entries_from_top not in cache:
+            names = self._reachable_names(entries_from_top)
+            cache[entries_from_top] = bs4.SoupStrainer(sorted(names)) if names else None
+        return cache[entries_from_top]
+
+    def _reachable_names(self, entries_from_top: bool) -> Optional[Set[str]]:
+        '''
+        The names of the elements that contain everything the reader uses, if these
+        can be determined.
+
+        Since BeautifulSoup keeps each matching element with its complete subtree,
+        queries that only look within an element that is kept give the same results
+        as in the complete document. Queries from the document itself need to select
+        descendants by name; these names are added to the filter.
+        '''
+        if not self._static_tags:
+            return None
+
+        top_tag = self.tags['tag_toplevel']
+        top_is_document = type(top_tag) is CurrentTag
+        names = _reachable_names([top_tag], from_document=not top_is_document)
+
+        entry_tag = self.tags['tag_entry']
+        entry_from_document = top_is_document or not entries_from_top
+        entry_is_document = entry_from_document and type(entry_tag) is CurrentTag
+        if not entry_is_document:
+            names = _union(names, _reachable_names([entry_tag], entry_from_document))
+
+        for field in self.regular_fields:
+            for extractor in field.extractor.walk():
+                if isinstance(extractor, extract.XML):
+                    if extractor.extract_soup_func:
+                        return None
+                    from_document = top_is_document if extractor.toplevel \
+                        else entry_is_document
+                    names = _union(names, _reachable_names(extractor.tags, from_document))
+                elif type(extractor).__module__ != extract.__name__:
+                    # custom extractors may search anywhere in the document
+                    return None
+        return names
+
+    def _tag_specifications(self) -> Iterable[TagSpecification]:
+        yield from self.tags.values()
+        for field in self.fields:
+            for extractor in field.extractor.walk():
+                if isinstance(extractor, extract.XML):
+                    yield from extractor.tags
+
+
+class ExternalFile(object):
+    '''
+    A parsed external file, as stored in an `ExternalFileCache`.
+
+    Parameters:
+        tree: the parsed file: a BeautifulSoup document or an lxml element tree.
+
+    Attributes:
+        tree: the parsed file.
+    '''
+
+    def __init__(self, tree: Any):
+        self.tree = tree
+        self._toplevel = None
+        self._has_toplevel = False
+
+    def toplevel(self, find: Callable[[], Any]) -> Any:
+        '''
+        Returns the top-level element of the file. It is looked up with `find` the first
+        time, and stored for later calls. This should only be used if the top-level tag
+        does not depend on the source.
+        '''
+        if not self._has_toplevel:
+            self._toplevel = find()
+            self._has_toplevel = True
+        return self._toplevel
+
+
+class ExternalFileCache(object):
+    '''
+    A least-recently-used cache of parsed external files.
+
+    Files are identified by their path, modification time and size, so a file that
+    changes on disk is parsed again.
+
+    The cache returns the same parsed tree each time, so callers must not modify it.
+
+    Parameters:
+        max_entries: the maximum number of files in the cache.
+        max_bytes: the maximum total size of the files in the cache, based on their
+            size on disk. If `None`, the size is not limited.
+
+    Attributes:
+        hits: the number of times a file was found in the cache.
+        misses: the number of times a file had to be parsed.
+    '''
+
+    def __init__(self, max_entries: int = 8, max_bytes: Optional[int] = None):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._bytes = 0
+
+    def __len__(self):
+        return len(self._entries)
+
+    def get(self, filename: str, parser: str, parse: Callable[[str], Any]) -> ExternalFile:
+        '''
+        Returns a parsed file from the cache, or parse it.
+
+        Parameters:
+            filename: the path to the file.
+            parser: the name of the parser, which is part of the cache key, since the
+                same file can be parsed in different ways.
+            parse: a function that parses the file, given its path.
+        '''
+        stat = os.stat(filename)
+        key = (os.path.abspath(filename), stat.st_mtime_ns, stat.st_size, parser)
+
+        if key in self._entries:
+            self.hits += 1
+            self._entries.move_to_end(key)
+            return self._entries[key]
+
+        self.misses += 1
+        external_file = ExternalFile(parse(filename))
+        if self._fits(stat.st_size):
+            self._entries[key] = external_file
+            self._bytes += stat.st_size
+            self._evict()
+        return external_file
+
+    def clear(self) -> None:
+        '''
+        Remove all files from the cache. This does not reset `hits` and `misses`.
+        '''
+        self._entries.clear()
+        self._bytes = 0
+
+    def _fits(self, size: int) -> bool:
+        if self.max_entries <= 0:
+            return False
+        return self.max_bytes is None or size <= self.max_bytes
+
+    def _evict(self) -> None:
+        while len(self._entries) > self.max_entries or \
+                (self.max_bytes is not None and self._bytes > self.max_bytes):
+            key, _ = self._entries.popitem(last=False)
+            self._bytes -= key[2]
+
+
+def _is_external_field(field: Field) -> bool:
+    return isinstance(field.extractor, extract.XML) and bool(field.extractor.external_file)
+
+
+def _plain_tag_name(tag: Tag) -> Optional[str]:
+    '''
+    Returns the tag name if a Tag only selects descendants based on their name,
+    otherwise `None`.
+    '''
+    if type(tag) is Tag and not tag.kwargs and len(tag.args) == 1 \
+        and isinstance(tag.args[0], str):
+        return tag.args[0]
+
+
+def _reachable_names(tags: Sequence[TagSpecification], from_document: bool
+                     ) -> Optional[Set[str]]:
+    '''
+    Returns the names of the elements that a chain of tags needs to be parsed, or
+    `None` if the chain may need any part of the document.
+
+    Parameters:
+        tags: the chain of tags.
+        from_document: whether the chain starts from the document, rather than from
+            an element that is parsed completely.
+    '''
+    tags = list(tags)
+    names = set()
+    if from_document:
+        first = _descendant_names(tags.pop(0)) if tags else None
+        if first is None:
+            return None
+        names |= first
+    if not all(type(tag) in (Tag, CurrentTag) for tag in tags):
+        return None
+    return names
+
+
+def _union(names: Optional[Set[str]], other: Optional[Set[str]]) -> Optional[Set[str]]:
+    if names is None or other is None:
+        return None
+    return names | other
+
+
+def _descendant_names(tag: Tag) -> Optional[Set[str]]:
+    '''
+    Returns the tag names that a Tag can match, if it selects descendants based on
+    their name (and possibly other conditions), otherwise `None`.
+    '''
+    if type(tag) is not Tag:
+        return None
+    arguments = tag._filter()
+    if not arguments['recursive']:
+        return None
+    name = arguments['name']
+    names = [name] if isinstance(name, str) else name
+    if not isinstance(names, (list, tuple, set)) or not names:
+        return None
+    if not all(isinstance(name, str) and ':' not in name for name in names):
+        return None
+    return set(names)
+
+
+def _tag_name_matcher(name: str) -> Callable[[etree._Element], bool]:
+    '''
+    Returns a function that checks whether an lxml element matches a tag name. Like
+    BeautifulSoup, a name without a prefix matches elements in any namespace.
+    '''
+    prefix, _, local_name = name.rpartition(':')
+
+    def matches(element):
+        return etree.QName(element).localname == local_name and \
+            (not prefix or element.prefix == prefix)
+
+    return matches
+
+
+def _iterparse_tag(name: str) -> str:
+    '''
+    The `tag` argument for lxml's `iterparse` that selects elements with a tag name,
+    in any namespace.
+    '''
+    return '{*}' + name.rpartition(':')[2]
+
+
+def _free_element(element: etree._Element) -> None:
+    '''
+    Free the memory used by an element and everything before it in the tree, while
+    parsing with `iterparse`.
+    '''
+    element.clear(keep_tail=False)
+    for node in itertools.chain([element], element.iterancestors()):
+        parent = node.getparent()
+        while parent is not None and node.getprevious() is not None:
+            del parent[0]
+
+
+def _find_next(tag: Tag, soup, use_lxml: bool, index: Optional[TagIndex] = None):
+    if use_lxml:
+        return tag.find_next_in_lxml(soup)
+    matches = tag.find_in_index(index, soup) if index is not None else None
+    if matches is not None:
+        return next(iter(matches), None)
+    return tag.find_next_in_soup(soup)
+
+
+def _find_all(tag: Tag, soup, use_lxml: bool, index: Optional[TagIndex] = None):
+    if use_lxml:
+        return tag.find_in_lxml(soup)
+    matches = tag.find_in_index(index, soup) if index is not None else None
+    return tag.find_in_soup(soup) if matches is None else matches
+
+
+def _xml_parser() -> etree.XMLParser:
+    # like BeautifulSoup, recover from errors in the document
+    return etree.XMLParser(recover=True, huge_tree=True)
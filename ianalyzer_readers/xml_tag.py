@@ -6,10 +6,21 @@ This class is used in the `XML` extractor to read XML/HTML documents.
 Each `Tag` describes a query for one or more XML tags based on their
 characteristics. It implements a method `find_in_soup` that takes an
 element as input and iterates over matching tags.
+
+Tags can also be used on lxml elements, which is used by the `lxml` backend of the
+`XMLReader`. The built-in tags are then compiled to XPath queries. Tags that cannot be
+compiled (like a `TransformTag`, or a `Tag` that filters with a function) report this
+through `supports_lxml()`, so the reader can use BeautifulSoup instead.
 '''
 
-from typing import Iterable, Optional, Callable, Union, Dict, Any
+from typing import Iterable, Optional, Callable, Union, Dict, Any, List, Tuple
+import bisect
+import itertools
+import re
 import bs4
+from bs4.builder import HTMLTreeBuilder
+from lxml import etree
+import lxml.html
 
 
 
@@ -39,6 +50,13 @@ class Tag:
     def __init__(self, *args: Any, **kwargs: Any):
         self.args = args
         self.kwargs = kwargs
+
+    def __getstate__(self) -> Dict[str, Any]:
+        # compiled queries are not pickled; they are created again when needed
+        return {
+            key: value for key, value in self.__dict__.items()
+            if key not in ('_xpath_cache', '_index_query_cache', '_soup_filter_cache')
+        }
     
     def find_next_in_soup(self, soup: bs4.PageElement) -> Optional[bs4.PageElement]:
         '''
@@ -71,6 +89,170 @@ class Tag:
         '''
         return soup.find_all(*self.args, **self.kwargs)
 
+    def find_in_index(self, index: 'TagIndex', soup: bs4.PageElement
+                      ) -> Optional[Iterable[bs4.PageElement]]:
+        '''
+        Find all results for this tag with a `TagIndex` of the document.
+
+        Parameters:
+            index: the index of the document that contains `soup`.
+            soup: The element to search from.
+
+        Returns:
+            An iterable of matching tags, like `find_in_soup`, or `None` if the query
+                cannot be answered from the index. In that case, use `find_in_soup`.
+        '''
+        if type(self).find_in_soup is not Tag.find_in_soup:
+            # subclasses that implement their own query
+            return None
+        query = self._index_query()
+        if query is None:
+            return None
+        name, attributes, recursive, limit = query
+        matches = index.find(soup, name, attributes, recursive)
+        if matches is None:
+            return None
+        return itertools.islice(matches, limit) if limit else matches
+
+    def supports_lxml(self, html: bool = False) -> bool:
+        '''
+        Whether this tag can be used on lxml elements.
+
+        Parameters:
+            html: whether the elements are HTML elements. This affects how attributes
+                like `class` are matched.
+        '''
+        return _implements_lxml(self) and self._xpath_condition(html) is not None
+
+    def find_next_in_lxml(self, element: 'LxmlNode') -> Optional['LxmlNode']:
+        '''
+        Find the first match for the tag in an lxml tree, if any.
+
+        Parameters:
+            element: The element (or element tree) to search from.
+
+        Returns:
+            The first matching element. Returns `None` if there is no match.
+        '''
+        return next(iter(self.find_in_lxml(element)), None)
+
+    def find_in_lxml(self, element: 'LxmlNode') -> Iterable['LxmlNode']:
+        '''
+        Find all results for this tag in an lxml tree.
+
+        This is the equivalent of `find_in_soup()` for the `lxml` backend. It should only
+        be used if `supports_lxml()` is true.
+
+        Parameters:
+            element: The element (or element tree) to search from.
+
+        Returns:
+            An iterable of matching elements.
+        '''
+        arguments = self._filter()
+        name = arguments['name']
+        # iterate lazily with lxml's own tag filter, so the first match is found
+        # without searching the whole tree
+        if isinstance(name, str):
+            tag = '{*}' + name.rpartition(':')[2]
+        else:
+            tag = etree.Element
+
+        if isinstance(element, etree._ElementTree):
+            # the root element is a descendant (or child) of the document
+            root = element.getroot()
+            if root is None:
+                return []
+            if not arguments['recursive']:
+                return self._limit(self._xpath('self::*', root)(root))
+            candidates = root.iter(tag)
+        elif arguments['recursive']:
+            candidates = element.iterdescendants(tag)
+        else:
+            candidates = element.iterchildren(tag)
+
+        check = self._lxml_check(element)
+        if check:
+            candidates = (candidate for candidate in candidates if check(candidate))
+        return self._limit(candidates)
+
+    def _lxml_check(self, element: 'LxmlNode') -> Optional[etree.XPath]:
+        '''
+        An XPath query to check candidates for the conditions of this tag that are
+        not checked by lxml's tag filter.
+        '''
+        html = _is_html(element)
+        cache = self.__dict__.setdefault('_xpath_cache', {})
+        key = ('check', html)
+        if key not in cache:
+            arguments = self._filter()
+            name = arguments['name']
+            if isinstance(name, str):
+                arguments['name'] = None
+            condition = _compile_filter(arguments, html)
+            if isinstance(name, str) and ':' in name:
+                condition = ' and '.join(filter(None, [_name_condition(name), condition]))
+            cache[key] = condition and etree.XPath(
+                'self::*[{}]'.format(condition), namespaces=_XPATH_NAMESPACES
+            )
+        return cache[key]
+
+    _arguments: Tuple[str] = ('name', 'attrs', 'recursive', 'string', 'limit')
+    '''
+    Names of the positional arguments of the BeautifulSoup method used by this tag.
+    '''
+
+    def _filter(self) -> Dict[str, Any]:
+        '''
+        The arguments of this tag as keyword arguments for BeautifulSoup.
+        '''
+        return _filter_arguments(self.args, self.kwargs, self._arguments)
+
+    def _limit(self, matches: Iterable['LxmlNode']) -> Iterable['LxmlNode']:
+        limit = self._filter()['limit']
+        if limit:
+            return itertools.islice(matches, limit)
+        return matches
+
+    def _index_query(self) -> Optional[Tuple[str, Dict[str, Any], bool, Optional[int]]]:
+        '''
+        The arguments for `TagIndex.find()` to answer this query and its limit, or
+        `None` if the query cannot be answered with an index.
+        '''
+        if '_index_query_cache' not in self.__dict__:
+            self._index_query_cache = None
+            arguments = self._filter()
+            name = arguments['name']
+            attributes = arguments['attributes']
+            if isinstance(name, str) and ':' not in name \
+                    and arguments['string'] is None \
+                    and all(_indexable_attribute(key, value)
+                            for key, value in attributes.items()):
+                self._index_query_cache = (
+                    name, attributes, arguments['recursive'], arguments['limit']
+                )
+        return self._index_query_cache
+
+    def _xpath_condition(self, html: bool) -> Optional[str]:
+        '''
+        The filter of this tag as an XPath condition, or `None` if the filter cannot be
+        expressed in XPath.
+        '''
+        return _compile_filter(self._filter(), html)
+
+    def _xpath(self, path: str, element: 'LxmlNode') -> etree.XPath:
+        '''
+        The compiled XPath query to find matches in a path.
+        '''
+        html = _is_html(element)
+        cache = self.__dict__.setdefault('_xpath_cache', {})
+        key = (path, html)
+        if key not in cache:
+            condition = self._xpath_condition(html)
+            predicate = '[{}]'.format(condition) if condition else ''
+            cache[key] = etree.XPath(path + predicate, namespaces=_XPATH_NAMESPACES)
+        return cache[key]
+
 
 class CurrentTag(Tag):
     '''
@@ -85,6 +267,12 @@ class CurrentTag(Tag):
     def find_in_soup(self, soup: bs4.PageElement) -> Iterable[bs4.PageElement]:
         return [soup]
 
+    def find_in_lxml(self, element: 'LxmlNode') -> Iterable['LxmlNode']:
+        return [element]
+
+    def _xpath_condition(self, html: bool) -> Optional[str]:
+        return ''
+
 
 class ParentTag(Tag):
     '''
@@ -107,6 +295,14 @@ class ParentTag(Tag):
             count += 1
         return [soup]
 
+    def find_in_lxml(self, element: 'LxmlNode') -> Iterable['LxmlNode']:
+        for _ in range(self.level):
+            element = _lxml_parent(element)
+        return [element]
+
+    def _xpath_condition(self, html: bool) -> Optional[str]:
+        return ''
+
 
 class FindParentTag(Tag):
     '''
@@ -124,73 +320,180 @@ class FindParentTag(Tag):
 
     def find_in_soup(self, soup: bs4.PageElement):
         return soup.find_parents(*self.args, **self.kwargs)
+
+    _arguments = ('name', 'attrs', 'limit')
+
+    def find_in_lxml(self, element: 'LxmlNode') -> Iterable['LxmlNode']:
+        if isinstance(element, etree._ElementTree):
+            return []
+        matches = self._xpath('ancestor::*', element)(element)
+        return self._limit(reversed(matches))
     
 
-class SiblingTag(Tag):
+class _ScanningTag(Tag):
+    '''
+    Base class for tags that scan the elements before or after an element, like
+    `PreviousTag` and `NextSiblingTag`.
+
+    Elements are checked one by one, so the scan stops as soon as enough matches are
+    found: if an extractor only uses the first match, the time it takes depends on the
+    distance to that match, rather than the size of the document.
+    '''
+
+    def __init__(self, *args: Any, max_distance: Optional[int] = None, **kwargs: Any):
+        super().__init__(*args, **kwargs)
+        self.max_distance = max_distance
+
+    _arguments = ('name', 'attrs', 'string', 'limit')
+
+    def _scan_soup(self, elements: Iterable[bs4.PageElement]) -> Iterable[bs4.PageElement]:
+        '''
+        Filter a sequence of BeautifulSoup elements, taking `limit` and `max_distance`
+        into account.
+        '''
+        if self.max_distance is not None:
+            elements = _within_distance(elements, self.max_distance)
+        matches = filter(self._soup_filter(), elements)
+        return self._limit(matches)
+
+    def _soup_filter(self) -> Callable[[bs4.PageElement], bool]:
+        '''
+        A function that checks whether an element matches this tag, like BeautifulSoup's
+        search methods do.
+        '''
+        if '_soup_filter_cache' not in self.__dict__:
+            self._soup_filter_cache = _compile_soup_filter(self._filter())
+        return self._soup_filter_cache
+
+    def _scan_lxml(self, elements: Iterable['LxmlNode'],
+                   element: 'LxmlNode') -> Iterable['LxmlNode']:
+        '''
+        Filter a sequence of lxml elements, taking `limit` and `max_distance` into
+        account.
+
+        Parameters:
+            elements: the elements to check, excluding comments and processing
+                instructions.
+            element: the element from which the search started.
+        '''
+        if self.max_distance is not None:
+            elements = itertools.islice(elements, self.max_distance)
+        html = _is_html(element)
+        cache = self.__dict__.setdefault('_xpath_cache', {})
+        key = ('scan', html)
+        if key not in cache:
+            cache[key] = self._xpath_condition(html) and self._xpath('self::*', element)
+        check = cache[key]
+        if check:
+            elements = (candidate for candidate in elements if check(candidate))
+        return self._limit(elements)
+
+
+class SiblingTag(_ScanningTag):
     '''
     A Tag that will look in an element's siblings.
 
     Parameters:
         *args: positional arguments to pass on to `soup.find_previous_siblings()`
             and `soup.find_next_siblings()`
+        max_distance: if set, only this many siblings are checked on either side of
+            the element. Text between them is not counted.
         **kwargs: named arguments to pass on to `soup.find_previous_siblings()`
-            and `soup.find_next_siblings()`
+            and `soup.find_next_siblings()`. A `limit` applies to either side.
     '''
 
     def find_in_soup(self, soup: bs4.PageElement):
-        for tag in soup.find_next_siblings(*self.args, **self.kwargs):
-            yield tag
-        
-        for tag in soup.find_previous_siblings(*self.args, **self.kwargs):
-            yield tag
-
-class PreviousSiblingTag(Tag):
+        yield from self._scan_soup(soup.next_siblings)
+        yield from self._scan_soup(soup.previous_siblings)
+
+    def find_in_lxml(self, element: 'LxmlNode') -> Iterable['LxmlNode']:
+        if isinstance(element, etree._ElementTree):
+            return
+        yield from self._scan_lxml(element.itersiblings(etree.Element), element)
+        yield from self._scan_lxml(
+            element.itersiblings(etree.Element, preceding=True), element
+        )
+
+class PreviousSiblingTag(_ScanningTag):
     '''
     A Tag that will look in an element's previous siblings.
 
     Parameters:
         *args: positional arguments to pass on to `soup.find_previous_siblings()`
+        max_distance: if set, only this many previous siblings are checked. Text
+            between them is not counted.
         **kwargs: named arguments to pass on to `soup.find_previous_siblings()`
     '''
 
     def find_in_soup(self, soup: bs4.PageElement):
-        return soup.find_previous_siblings(*self.args, **self.kwargs)
+        return self._scan_soup(soup.previous_siblings)
 
-class NextSiblingTag(Tag):
+    def find_in_lxml(self, element: 'LxmlNode') -> Iterable['LxmlNode']:
+        if isinstance(element, etree._ElementTree):
+            return []
+        return self._scan_lxml(
+            element.itersiblings(etree.Element, preceding=True), element
+        )
+
+class NextSiblingTag(_ScanningTag):
     '''
     A Tag that will look in an element's next siblings.
 
     Parameters:
         *args: positional arguments to pass on to `soup.find_next_siblings()`
+        max_distance: if set, only this many next siblings are checked. Text between
+            them is not counted.
         **kwargs: named arguments to pass on to `soup.find_next_siblings()`
     '''
 
     def find_in_soup(self, soup: bs4.PageElement):
-        return soup.find_next_siblings(*self.args, **self.kwargs)
+        return self._scan_soup(soup.next_siblings)
+
+    def find_in_lxml(self, element: 'LxmlNode') -> Iterable['LxmlNode']:
+        if isinstance(element, etree._ElementTree):
+            return []
+        return self._scan_lxml(element.itersiblings(etree.Element), element)
     
-class PreviousTag(Tag):
+class PreviousTag(_ScanningTag):
     '''
-    A Tag that will look in an element's previous siblings.
+    A Tag that will look in the elements before an element, including its ancestors.
 
     Parameters:
         *args: positional arguments to pass on to `soup.find_all_previous()`
+        max_distance: if set, only this many tags before the element are checked.
+            Text between them is not counted.
         **kwargs: named arguments to pass on to `soup.find_all_previous()`
     '''
 
     def find_in_soup(self, soup: bs4.PageElement):
-        return soup.find_all_previous(*self.args, **self.kwargs)
+        return self._scan_soup(soup.previous_elements)
+
+    def find_in_lxml(self, element: 'LxmlNode') -> Iterable['LxmlNode']:
+        if isinstance(element, etree._ElementTree):
+            return []
+        # like BeautifulSoup, this includes the ancestors of the element
+        return self._scan_lxml(_lxml_preceding(element), element)
     
-class NextTag(Tag):
+class NextTag(_ScanningTag):
     '''
-    A Tag that will look in an element's previous siblings.
+    A Tag that will look in the elements after an element, including its descendants.
 
     Parameters:
         *args: positional arguments to pass on to `soup.find_all_next()`
+        max_distance: if set, only this many tags after the element are checked.
+            Text between them is not counted.
         **kwargs: named arguments to pass on to `soup.find_all_next()`
     '''
 
     def find_in_soup(self, soup: bs4.PageElement):
-        return soup.find_all_next(*self.args, **self.kwargs)
+        return self._scan_soup(soup.next_elements)
+
+    def find_in_lxml(self, element: 'LxmlNode') -> Iterable['LxmlNode']:
+        if isinstance(element, etree._ElementTree):
+            # BeautifulSoup finds nothing after the document itself
+            return []
+        # like BeautifulSoup, this includes the descendants of the element
+        return self._scan_lxml(_lxml_following(element), element)
 
 
 class TransformTag(Tag):
@@ -215,10 +518,354 @@ class TransformTag(Tag):
         return self.transform(soup)
 
 
+class TagIndex:
+    '''
+    An index of the tags in a BeautifulSoup document, by name.
+
+    `Tag` queries that only filter on a tag name and attribute values (e.g.
+    `Tag('title')` or `Tag('date', type='issued')`) can be answered from the index with
+    `Tag.find_in_index`, instead of searching the tree.
+
+    Tags are stored in document order, with the range of positions of their
+    descendants, so the matches within an element are found with a binary search.
+    The index is only valid as long as the document is not modified.
+
+    Parameters:
+        soup: the document to index.
+    '''
+
+    def __init__(self, soup: bs4.BeautifulSoup):
+        self.tags: List[bs4.Tag] = [soup]
+        self.positions: Dict[int, int] = {id(soup): 0}
+        self.ends: List[int] = [0]
+        self.names: Dict[str, List[int]] = {}
+        self._attribute_positions: Dict[Tuple[str, frozenset], List[int]] = {}
+
+        # ancestors of the current tag that are still open
+        stack = [0]
+        for element in soup.descendants:
+            if not isinstance(element, bs4.Tag):
+                continue
+            parent = self.positions[id(element.parent)]
+            while stack[-1] != parent:
+                self.ends[stack.pop()] = len(self.tags)
+            position = len(self.tags)
+            self.tags.append(element)
+            self.positions[id(element)] = position
+            self.ends.append(position)
+            self.names.setdefault(element.name, []).append(position)
+            stack.append(position)
+        for position in stack:
+            self.ends[position] = len(self.tags)
+
+    def find(self, element: bs4.PageElement, name: str, attributes: Dict[str, Any],
+             recursive: bool = True) -> Optional[Iterable[bs4.Tag]]:
+        '''
+        Find tags within an element.
+
+        Parameters:
+            element: the element to search in.
+            name: the name of the tags.
+            attributes: required values of attributes. Values can be strings, or `True`
+                to require that the attribute is present.
+            recursive: if `False`, only children of the element are returned.
+
+        Returns:
+            An iterable of matching tags in document order, or `None` if the element is
+                not in the index.
+        '''
+        start = self.positions.get(id(element))
+        if start is None:
+            return None
+        end = self.ends[start]
+
+        if attributes:
+            positions = self._with_attributes(name, attributes)
+        else:
+            positions = self.names.get(name, [])
+        low = bisect.bisect_right(positions, start)
+        high = bisect.bisect_left(positions, end, low)
+
+        matches = (self.tags[positions[i]] for i in range(low, high))
+        if not recursive:
+            return (tag for tag in matches if tag.parent is element)
+        return matches
+
+    def _with_attributes(self, name: str, attributes: Dict[str, Any]) -> List[int]:
+        '''
+        The positions of tags that match a name and attribute values. These are
+        computed when first used and stored in the index.
+        '''
+        key = (name, frozenset(attributes.items()))
+        if key not in self._attribute_positions:
+            self._attribute_positions[key] = [
+                position for position in self.names.get(name, [])
+                if all(_has_attribute_value(self.tags[position], attribute, value)
+                       for attribute, value in attributes.items())
+            ]
+        return self._attribute_positions[key]
+
+
 TagSpecification = Union[Tag, Callable[[Dict], Tag]]
 
 def resolve_tag_specification(tag: TagSpecification, metadata: Dict) -> Tag:
     if callable(tag):
         return tag(metadata)
     else:
-        return tag
\ No newline at end of file
+        return tag
+
+LxmlNode = Union[etree._Element, etree._ElementTree]
+'''
+Type definition for nodes in an lxml tree. The document itself is represented by its
+element tree.
+'''
+
+_XPATH_NAMESPACES = {'re': 'http://exslt.org/regular-expressions'}
+
+_MULTI_VALUED_ATTRIBUTES = set(itertools.chain.from_iterable(
+    HTMLTreeBuilder.DEFAULT_CDATA_LIST_ATTRIBUTES.values()
+))
+
+_SIMPLE_NAME = re.compile(r'[A-Za-z_][\w.-]*')
+
+_REGEX_FLAGS = {0: '', re.IGNORECASE: 'i'}
+
+
+def _implements_lxml(tag: Tag) -> bool:
+    '''
+    Checks that a tag implements `find_in_lxml()` in the same class as `find_in_soup()`,
+    so subclasses that only override `find_in_soup()` are not used on lxml elements.
+    '''
+    for cls in type(tag).__mro__:
+        if 'find_in_soup' in vars(cls):
+            return 'find_in_lxml' in vars(cls)
+    return False
+
+
+def _is_html(element: LxmlNode) -> bool:
+    if isinstance(element, etree._ElementTree):
+        element = element.getroot()
+    return isinstance(element, lxml.html.HtmlMixin)
+
+
+def _lxml_parent(node: Optional[LxmlNode]) -> Optional[LxmlNode]:
+    if node is None or isinstance(node, etree._ElementTree):
+        return None
+    parent = node.getparent()
+    if parent is None:
+        return node.getroottree()
+    return parent
+
+
+def _lxml_following(element: etree._Element) -> Iterable[etree._Element]:
+    '''
+    The descendants of an element and the elements after it, in document order.
+    '''
+    yield from element.iterdescendants(etree.Element)
+    node = element
+    while node is not None:
+        for sibling in node.itersiblings(etree.Element):
+            yield from sibling.iter(etree.Element)
+        node = node.getparent()
+
+
+def _lxml_preceding(element: etree._Element) -> Iterable[etree._Element]:
+    '''
+    The ancestors of an element and the elements before it, in reverse document order.
+    '''
+    node = element
+    while node is not None:
+        for sibling in node.itersiblings(etree.Element, preceding=True):
+            yield from _lxml_reversed_subtree(sibling)
+        node = node.getparent()
+        if node is not None:
+            yield node
+
+
+def _lxml_reversed_subtree(element: etree._Element) -> Iterable[etree._Element]:
+    '''
+    An element and its descendants, in reverse document order.
+    '''
+    children = reversed(element) if len(element) else ()
+    for child in children:
+        if isinstance(child.tag, str):
+            yield from _lxml_reversed_subtree(child)
+    yield element
+
+
+def _within_distance(elements: Iterable[bs4.PageElement],
+                     max_distance: int) -> Iterable[bs4.PageElement]:
+    '''
+    The elements of a BeautifulSoup sequence up to (and not including) tag number
+    `max_distance + 1`. Strings are not counted.
+    '''
+    tags = 0
+    for element in elements:
+        if isinstance(element, bs4.Tag):
+            tags += 1
+            if tags > max_distance:
+                return
+        yield element
+
+
+def _compile_soup_filter(arguments: Dict[str, Any]) -> Callable[[bs4.PageElement], bool]:
+    '''
+    Compile the filter arguments of a BeautifulSoup search to a function that checks
+    a single element.
+    '''
+    strainer = bs4.SoupStrainer(
+        arguments['name'], arguments['attributes'], string=arguments['string']
+    )
+    if hasattr(strainer, 'match'):
+        # beautifulsoup 4.13 and later
+        return strainer.match
+    # like BeautifulSoup's search methods, skip empty strings
+    return lambda element: bool(element) and bool(strainer.search(element))
+
+
+def _indexable_attribute(attribute: Any, value: Any) -> bool:
+    '''
+    Whether a `TagIndex` can filter on an attribute value. Attributes that
+    BeautifulSoup may split into a list of values (like `class`) are not supported.
+    '''
+    return isinstance(attribute, str) and attribute not in _MULTI_VALUED_ATTRIBUTES \
+        and (isinstance(value, str) or value is True)
+
+
+def _has_attribute_value(tag: bs4.Tag, attribute: str, value: Any) -> bool:
+    if value is True:
+        return tag.attrs.get(attribute) is not None
+    return tag.attrs.get(attribute) == value
+
+
+def _filter_arguments(args: Tuple, kwargs: Dict, names: Tuple[str]) -> Dict[str, Any]:
+    '''
+    Normalise the arguments for a BeautifulSoup search method.
+
+    Parameters:
+        args: the positional arguments.
+        kwargs: the named arguments.
+        names: the names of the positional arguments of the search method.
+
+    Returns:
+        A dictionary with the `name`, `string`, `recursive` and `limit` arguments, and
+            all attribute filters in `attributes`.
+    '''
+    kwargs = dict(kwargs)
+    arguments = {
+        'name': None, 'attrs': None, 'recursive': True, 'string': None, 'limit': None,
+    }
+    arguments.update(zip(names, args))
+    for key in names:
+        if key in kwargs:
+            arguments[key] = kwargs.pop(key)
+    if 'text' in kwargs:
+        text = kwargs.pop('text')
+        if arguments['string'] is None:
+            arguments['string'] = text
+
+    attrs = arguments.pop('attrs')
+    if isinstance(attrs, dict):
+        attributes = dict(attrs)
+    elif attrs is not None:
+        # BeautifulSoup treats a non-dict value as a filter for the class
+        attributes = {'class': attrs}
+    else:
+        attributes = {}
+    for key, value in kwargs.items():
+        attributes['class' if key == 'class_' else key] = value
+    arguments['attributes'] = attributes
+
+    return arguments
+
+
+def _compile_filter(arguments: Dict[str, Any], html: bool) -> Optional[str]:
+    '''
+    Compile the filter arguments of a BeautifulSoup search to an XPath condition.
+
+    Returns:
+        An XPath condition, an empty string if all elements match, or `None` if the
+            filter cannot be expressed in XPath.
+    '''
+    if arguments['string'] is not None:
+        return None
+
+    conditions = []
+
+    name = arguments['name']
+    if name is not None and name is not True:
+        conditions.append(_name_condition(name))
+
+    for attribute, value in arguments['attributes'].items():
+        conditions.append(_attribute_condition(attribute, value, html))
+
+    if None in conditions:
+        return None
+    return ' and '.join(conditions)
+
+
+def _name_condition(name: Any) -> Optional[str]:
+    if isinstance(name, str):
+        if ':' in name:
+            return 'name() = {}'.format(_xpath_literal(name))
+        return 'local-name() = {}'.format(_xpath_literal(name))
+    if isinstance(name, re.Pattern):
+        return _regex_condition('local-name()', name)
+    if isinstance(name, (list, tuple, set)) and name:
+        return _any_condition(_name_condition(option) for option in name)
+
+
+def _attribute_condition(attribute: str, value: Any, html: bool) -> Optional[str]:
+    if not isinstance(attribute, str):
+        return None
+    if _SIMPLE_NAME.fullmatch(attribute):
+        node = '@' + attribute
+    else:
+        node = '@*[name() = {}]'.format(_xpath_literal(attribute))
+    multi_valued = html and attribute in _MULTI_VALUED_ATTRIBUTES
+
+    if value is True:
+        return node
+    if value is None:
+        return 'not({})'.format(node)
+    if isinstance(value, str):
+        if not multi_valued:
+            return '{} = {}'.format(node, _xpath_literal(value))
+        conditions = ['normalize-space({}) = {}'.format(node, _xpath_literal(value))]
+        if value and not any(char.isspace() for char in value):
+            conditions.append('contains(concat(" ", normalize-space({}), " "), {})'.format(
+                node, _xpath_literal(' ' + value + ' ')
+            ))
+        return _any_condition(conditions)
+    if isinstance(value, re.Pattern) and not multi_valued:
+        regex = _regex_condition(node, value)
+        return regex and '{} and {}'.format(node, regex)
+    if isinstance(value, (list, tuple, set)) and value:
+        return _any_condition(
+            _attribute_condition(attribute, option, html) for option in value
+        )
+
+
+def _regex_condition(node: str, pattern: re.Pattern) -> Optional[str]:
+    if not isinstance(pattern.pattern, str):
+        return None
+    flags = _REGEX_FLAGS.get(pattern.flags & ~re.UNICODE)
+    if flags is None:
+        return None
+    return 're:test({}, {}, "{}")'.format(node, _xpath_literal(pattern.pattern), flags)
+
+
+def _any_condition(conditions: Iterable[Optional[str]]) -> Optional[str]:
+    conditions = list(conditions)
+    if None in conditions:
+        return None
+    return '(' + ' or '.join(conditions) + ')'
+
+
+def _xpath_literal(value: str) -> str:
+    if '"' not in value:
+        return '"' + value + '"'
+    if "'" not in value:
+        return "'" + value + "'"
+    parts = ('"' + part + '"' for part in value.split('"'))
+    return 'concat(' + ', \'"\', '.join(parts) + ')'
@@ -1,6 +1,8 @@
+import csv
+import pytest
 from ianalyzer_readers.readers.csv import CSVReader
 from ianalyzer_readers.readers.core import Field
-from ianalyzer_readers.extract import CSV, Metadata
+from ianalyzer_readers.extract import CSV, Metadata, Order
 import os
 
 def format_name(name):
@@ -63,4 +65,114 @@ def test_csv_example_reader():
         'lines': 'My hour is almost come,\n'
             'When I to sulph\'rous and tormenting flames\n'
             'Must render up myself.'
-    }
\ No newline at end of file
+    }
+
+def test_csv_reader_extraction_plan_reused():
+    reader = ShakespeareReader()
+    calls = []
+    make_plan = reader._make_extraction_plan
+
+    def counting_make_plan(*args):
+        calls.append(None)
+        return make_plan(*args)
+
+    reader._make_extraction_plan = counting_make_plan
+    docs = list(reader.documents())
+    assert len(docs) == 26
+    assert len(calls) == 1
+
+
+def test_csv_reader_select_fields():
+    reader = ShakespeareReader()
+    docs = list(reader.documents(fields=['character', 'play']))
+    assert len(docs) == 26
+    hamlet_lines = list(filter(lambda doc: doc['play'] == 'Hamlet', docs))
+    assert hamlet_lines[1] == {'play': 'Hamlet', 'character': 'Hamlet'}
+    assert list(hamlet_lines[1].keys()) == ['play', 'character']
+
+
+def test_csv_reader_select_unknown_field():
+    reader = ShakespeareReader()
+    with pytest.raises(ValueError):
+        reader.documents(fields=['character', 'speaker'])
+
+
+def test_csv_reader_metadata_only(monkeypatch):
+    class IndexedShakespeareReader(ShakespeareReader):
+        fields = ShakespeareReader.fields + [Field('index', Order())]
+
+    reader = IndexedShakespeareReader()
+    expected = [
+        {'play': doc['play'], 'index': doc['index']} for doc in reader.documents()
+    ]
+
+    # rows should not be converted to dictionaries
+    monkeypatch.setattr(csv, 'DictReader', None)
+    docs = list(reader.documents(fields=['play', 'index']))
+    assert docs == expected
+
+
+def test_csv_reader_compact_rows(monkeypatch, tmp_path):
+    class CompactShakespeareReader(ShakespeareReader):
+        compact_rows = True
+        required_field = 'line'
+        fields = ShakespeareReader.fields + [
+            Field('index', Order()),
+            Field('stage_direction', CSV('direction', convert_to_none=['', '-'])),
+            Field('directions', CSV('direction', multiple=True)),
+            Field('missing', CSV('not_a_column')),
+        ]
+
+    filename = tmp_path / 'play.csv'
+    filename.write_text(
+        'act,scene,character,line,direction\n'
+        'I,1,BERNARDO,Who\'s there?,-\n'
+        'I,1,FRANCISCO,"Nay, answer me: stand,",\n'
+        'I,1,FRANCISCO,and unfold yourself.\n'
+        '\n'
+        'I,1,BERNARDO,,Exit\n'
+        'I,1,BERNARDO,Long live the king!,Enter\n'
+    )
+    source = (str(filename), {'title': 'Hamlet'})
+
+    reader = CompactShakespeareReader()
+    reader.compact_rows = False
+    expected = list(reader.source2dicts(source))
+
+    reader = CompactShakespeareReader()
+    # rows should not be converted to dictionaries
+    monkeypatch.setattr(csv, 'DictReader', None)
+    docs = list(reader.source2dicts(source))
+    assert docs == expected
+    assert docs[1]['directions'] == [None, None]
+    assert docs[0]['stage_direction'] is None
+
+
+@pytest.mark.parametrize('compact_rows', [False, True])
+def test_csv_reader_chunks(tmp_path, compact_rows):
+    class ChunkedShakespeareReader(ShakespeareReader):
+        fields = ShakespeareReader.fields + [Field('index', Order())]
+
+    filename = tmp_path / 'play.csv'
+    filename.write_text(
+        'act,scene,character,line\n'
+        'I,1,BERNARDO,Who\'s there?\n'
+        'I,1,FRANCISCO,"Nay, answer me:\nstand, and unfold yourself."\n'
+        'I,1,BERNARDO,"Long live the ""king""!"\n'
+        'I,1,BERNARDO,"He."\n'
+        'I,1,FRANCISCO,"You come most carefully\nupon your hour."\n'
+        'I,1,FRANCISCO,"For this relief much thanks"\n'
+    )
+    source = (str(filename), {'title': 'Hamlet'})
+
+    reader = ChunkedShakespeareReader()
+    reader.compact_rows = compact_rows
+    expected = list(reader.source2dicts(source))
+
+    reader.chunk_workers = 2
+    reader.chunk_size = 10
+    _, chunks = reader._file_chunks(str(filename))
+    assert len(chunks) == 3
+    docs = list(reader.source2dicts(source))
+    assert docs == expected
+    assert [doc['index'] for doc in docs] == [0, 1, 2, 3]
@@ -1,7 +1,13 @@
 import pytest
-from rdflib import URIRef
+from rdflib import Graph, Literal, URIRef
+from rdflib.namespace import RDF
 
-from tests.rdf.rdf_reader import TestRDFReader, get_uri_value
+from ianalyzer_readers.readers.core import Field
+from ianalyzer_readers.readers import rdf
+from ianalyzer_readers.readers.rdf import RDFReader, SubjectIndex
+from tests.rdf.rdf_reader import (
+    TestRDFReader, get_uri_value, ns_character, ns_line_id, ns_speaker, ns_text
+)
 
 target_documents = [
     {
@@ -71,8 +77,174 @@ def test_rdf_document_content():
             assert doc.get(key) == target.get(key)
 
 
+def test_rdf_skip_field():
+    class SkipOpacityReader(TestRDFReader):
+        fields = [
+            TestRDFReader.identifier,
+            TestRDFReader.character,
+            Field('opacity', TestRDFReader.character_opacity.extractor, skip=True),
+        ]
+
+    docs = list(SkipOpacityReader().documents())
+    assert len(docs) == 7
+    assert all(set(doc.keys()) == {'id', 'character'} for doc in docs)
+
+
 def test_get_node_value():
     input = URIRef("https://purl.org/mynamespace#ernie")
     assert get_uri_value(input) == "ernie"
     input = URIRef("https://purl.org/mynamespace/ernie")
     assert get_uri_value(input) == "ernie"
+
+
+def test_rdf_document_subjects():
+    reader = RDFReader()
+    graph = Graph()
+    play = URIRef('http://example.org/shakespeare/hamlet')
+    lines = [URIRef(f'http://example.org/shakespeare/line/{i}') for i in range(3)]
+    for i, line in enumerate(lines):
+        graph.add((line, RDF.type, URIRef(ns_line_id)))
+        graph.add((line, URIRef(ns_text), Literal(f'line {i}')))
+        graph.add((line, URIRef(ns_text), Literal(f'more of line {i}')))
+    graph.add((lines[0], URIRef(ns_speaker), URIRef(f'{ns_character}/HAMLET')))
+    graph.add((play, URIRef(ns_text), Literal('Hamlet')))
+
+    subjects = list(reader.document_subjects(graph))
+    assert len(subjects) == 4
+    assert set(subjects) == set(lines + [play])
+
+    reader.subject_type = URIRef(ns_line_id)
+    assert set(reader.document_subjects(graph)) == set(lines)
+
+    reader.required_predicates = [URIRef(ns_speaker)]
+    assert list(reader.document_subjects(graph)) == [lines[0]]
+
+
+def test_rdf_subject_index():
+    reader = TestRDFReader()
+    expected = list(reader.documents())
+
+    reader.subject_index = True
+    assert list(reader.documents()) == expected
+
+    graph = reader.parse_graph_from_filename(next(reader.sources()))
+    index = SubjectIndex(graph)
+    for subject, predicate in graph.subject_predicates():
+        objects = list(graph.objects(subject, predicate))
+        assert list(index.objects(subject, predicate)) == objects
+    for subject in reader.document_subjects(graph):
+        assert list(index.items(subject)) == list(graph.items(subject))
+    assert list(index.objects(URIRef(ns_character), URIRef(ns_text))) == []
+    assert len(index) == len(graph)
+    assert index.memory_usage > 0
+
+    # the index is not affected by later changes to the graph
+    triples = list(graph)
+    graph.remove((None, None, None))
+    assert all(object in index.objects(subject, predicate)
+               for subject, predicate, object in triples)
+
+    with pytest.raises(MemoryError):
+        SubjectIndex(graph, max_bytes=0)
+
+    # if the index is too large, the reader extracts from the graph
+    reader.subject_index_max_bytes = index.memory_usage - 1
+    graph = reader.parse_graph_from_filename(next(reader.sources()))
+    assert reader._graph_for_extractors(graph) is graph
+    assert list(reader.documents()) == expected
+
+
+@pytest.mark.parametrize('extension', ['nt', 'nq'])
+def test_rdf_streaming(tmp_path, monkeypatch, extension):
+    reader = TestRDFReader()
+    graph = reader.parse_graph_from_filename(next(reader.sources()))
+    fields = ['id', 'character']
+    expected = list(reader.documents(fields=fields))
+
+    # N-Triples lines are valid N-Quads lines; sort them to group them by subject
+    lines = sorted(graph.serialize(format='nt').splitlines())
+    filename = tmp_path / f'hamlet.{extension}'
+    filename.write_text('\n'.join(lines) + '\n', encoding='utf-8')
+
+    monkeypatch.setattr(TestRDFReader, 'parse_graph_from_filename', None)
+    reader.streaming = True
+    docs = list(reader.documents([str(filename)], fields=fields))
+    assert docs == expected
+    assert reader.count_documents([str(filename)]) == len(expected)
+
+    # subjects can span several batches of lines
+    monkeypatch.setattr(rdf, '_STREAMING_BATCH_LINES', 2)
+    assert list(reader.documents([str(filename)], fields=fields)) == expected
+
+
+def test_rdf_streaming_blank_nodes(tmp_path):
+    filename = tmp_path / 'nodes.nt'
+    filename.write_text(
+        '_:a <http://example.org/next> _:b .\n'
+        '_:b <http://example.org/next> _:a .\n',
+        encoding='utf-8',
+    )
+    first, second = rdf._subject_graphs(str(filename))
+    (a, _, b), = first
+    (b2, _, a2), = second
+    assert (a, b) == (a2, b2)
+
+
+def test_rdf_graph_cache(tmp_path):
+    source = tmp_path / 'hamlet.ttl'
+    source.write_bytes(open(next(TestRDFReader().sources()), 'rb').read())
+    cache_dir = tmp_path / 'cache'
+
+    reader = TestRDFReader()
+    reader.graph_cache_dir = str(cache_dir)
+    expected = list(reader.documents([str(source)]))
+    assert reader.graph_cache.misses == 1
+
+    # a new reader loads the graph from the cache
+    reader = TestRDFReader()
+    reader.graph_cache_dir = str(cache_dir)
+    assert list(reader.documents([str(source)])) == expected
+    assert reader.graph_cache.hits == 1
+    assert reader.graph_cache.misses == 0
+
+    # a changed file is parsed again
+    source.write_text(source.read_text(encoding='utf-8') + '\n', encoding='utf-8')
+    assert list(reader.documents([str(source)])) == expected
+    assert reader.graph_cache.misses == 1
+    assert len(list(cache_dir.glob('*.pickle'))) == 2
+
+    # least recently used graphs are removed when a new graph is added
+    size = max(path.stat().st_size for path in cache_dir.glob('*.pickle'))
+    source.write_text(source.read_text(encoding='utf-8') + '\n', encoding='utf-8')
+    reader = TestRDFReader()
+    reader.graph_cache_dir = str(cache_dir)
+    reader.graph_cache_max_bytes = size
+    list(reader.documents([str(source)]))
+    assert reader.graph_cache.misses == 1
+    assert len(list(cache_dir.glob('*.pickle'))) == 1
+
+
+@pytest.mark.parametrize('workers', [None, 2])
+def test_rdf_parse_graph_from_filenames(tmp_path, workers):
+    reader = TestRDFReader()
+    source = next(reader.sources())
+    first = tmp_path / 'first.jsonld'
+    second = tmp_path / 'second.jsonld'
+    first.write_text(
+        '{"@id": "_:b0", "http://example.org/name": "first"}', encoding='utf-8'
+    )
+    second.write_text(
+        '{"@id": "_:b0", "http://example.org/name": "second"}', encoding='utf-8'
+    )
+
+    graph = reader.parse_graph_from_filenames(
+        [source, str(first), str(second)], workers=workers
+    )
+
+    expected = reader.parse_graph_from_filename(source)
+    assert len(graph) == len(expected) + 2
+    names = list(graph.subject_objects(URIRef('http://example.org/name')))
+    assert sorted(str(name) for _, name in names) == ['first', 'second']
+    # blank nodes with the same label in different files are different nodes
+    assert names[0][0] != names[1][0]
+    assert dict(graph.namespaces())['ns2'] == URIRef('http://example.org/vision/')
@@ -0,0 +1,37 @@
+import pytest
+
+from ianalyzer_readers.extract import Extractor
+
+from tests.csv.test_csv_reader import ShakespeareReader
+from tests.html_reader import HamletHTMLReader
+from tests.rdf.rdf_reader import TestRDFReader
+from tests.xlsx_reader import HamletXLSXReader
+from tests.xml.test_xml_reader import HamletXMLReader, StreamingHamletXMLReader
+
+
+class RequiredLineShakespeareReader(ShakespeareReader):
+    required_field = 'line'
+
+
+readers = [
+    HamletXMLReader,
+    StreamingHamletXMLReader,
+    HamletHTMLReader,
+    ShakespeareReader,
+    RequiredLineShakespeareReader,
+    HamletXLSXReader,
+    TestRDFReader,
+]
+
+
+@pytest.mark.parametrize('reader_class', readers)
+def test_count_documents(reader_class, monkeypatch):
+    reader = reader_class()
+    expected = len(list(reader.documents()))
+
+    def fail(*args, **kwargs):
+        raise AssertionError('extractor should not be used')
+
+    monkeypatch.setattr(Extractor, 'apply', fail)
+    monkeypatch.setattr(Extractor, 'compile', fail)
+    assert reader.count_documents() == expected
@@ -10,4 +10,16 @@ def test_csv_export(tmpdir):
         csv_reader = csv.DictReader(csv_file)
         assert csv_reader.fieldnames == reader.fieldnames
         rows = list(row for row in csv_reader)
-        assert len(rows) == 7
\ No newline at end of file
+        assert len(rows) == 7
+
+def test_csv_export_fields(tmpdir):
+    reader = html_reader.HamletHTMLReader()
+    path = tmpdir / 'hamlet.csv'
+    fields = reader.fieldnames[:1]
+    reader.export_csv(path, fields=fields)
+
+    with open(path) as csv_file:
+        csv_reader = csv.DictReader(csv_file)
+        assert csv_reader.fieldnames == fields
+        rows = list(row for row in csv_reader)
+        assert len(rows) == 7
@@ -1,6 +1,6 @@
 import pytest
 from ianalyzer_readers.extract import (
-    Constant, Combined, Backup, Choice, Metadata, Pass, Order
+    Extractor, Constant, Combined, Backup, Choice, Metadata, Pass, Order
 )
 
 def test_constant_extractor():
@@ -85,3 +85,76 @@ def test_extractor_applicable_callable():
         extractor = Constant('test', applicable=lambda metadata: metadata['testing'])
     assert extractor.apply(metadata={'testing': True}) == 'test'
     assert extractor.apply(metadata={'testing': False}) == None
+
+
+compile_cases = [
+    Constant('test'),
+    Metadata('test', transform=str.upper),
+    Order(),
+    Combined(Constant(1), Metadata('test'), Order()),
+    Backup(Constant(None), Metadata('missing'), Metadata('test')),
+    Choice(
+        Constant('first', applicable=Metadata('check')),
+        Constant('second'),
+    ),
+    Pass(Pass(Metadata('test'), transform=str.upper), transform=str.lower),
+    Constant('test', applicable=Metadata('check')),
+    Metadata('test', transform=int),
+]
+
+
+@pytest.mark.parametrize('extractor', compile_cases)
+@pytest.mark.parametrize('metadata', [
+    {'test': 'testing', 'check': True},
+    {'test': 'testing', 'check': False},
+])
+def test_compiled_extractor(extractor, metadata):
+    compiled = extractor.compile(['metadata', 'index'])
+    expected = extractor.apply(metadata=metadata, index=3)
+    assert compiled(metadata, 3) == expected
+
+
+class CountingExtractor(Extractor):
+    def __init__(self, value, *nargs, **kwargs):
+        self.value = value
+        self.calls = 0
+        super().__init__(*nargs, **kwargs)
+
+    def _apply(self, *nargs, **kwargs):
+        self.calls += 1
+        return self.value
+
+
+def test_compiled_choice_evaluates_condition_once():
+    condition = CountingExtractor(True)
+    extractor = Choice(
+        Constant('first', applicable=condition),
+        Constant('second'),
+    )
+    compiled = extractor.compile(['metadata'])
+    assert compiled({}) == 'first'
+    assert condition.calls == 1
+
+
+def test_compiled_custom_extractor():
+    class MetadataKeys(Extractor):
+        def _apply(self, metadata, *nargs, **kwargs):
+            return sorted(metadata.keys())
+
+    extractor = MetadataKeys(applicable=Metadata('check'))
+    compiled = extractor.compile(['index', 'metadata'])
+    assert compiled(0, {'check': True}) == ['check']
+    assert compiled(0, {'check': False}) == None
+
+
+@pytest.mark.parametrize('extractor,dependencies', [
+    (Constant('test'), set()),
+    (Metadata('test'), {'metadata'}),
+    (Order(), {'index'}),
+    (Combined(Constant(1), Metadata('test')), {'metadata'}),
+    (Choice(Constant('first', applicable=Order()), Constant('second')), {'index'}),
+    (Pass(Metadata('test'), applicable=Constant(True)), {'metadata'}),
+    (Backup(Constant(None), CountingExtractor('test')), None),
+])
+def test_extractor_dependencies(extractor, dependencies):
+    assert extractor.dependencies() == dependencies
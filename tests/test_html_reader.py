@@ -1,3 +1,9 @@
+import pytest
+
+from ianalyzer_readers.readers.core import Field
+from ianalyzer_readers.extract import XML
+from ianalyzer_readers.xml_tag import Tag, NextSiblingTag
+
 from .html_reader import HamletHTMLReader
 
 target_documents = [
@@ -52,3 +58,107 @@ def test_html():
 
     for doc, target in zip(docs, target_documents):
         assert doc == target
+
+
+class PageHTMLReader(HamletHTMLReader):
+    # the top-level tag is not found, so each page is extracted as a whole
+    tag_toplevel = Tag('missing')
+    fields = [HamletHTMLReader.character, HamletHTMLReader.lines]
+
+
+@pytest.mark.parametrize('reader_class', [HamletHTMLReader, PageHTMLReader])
+def test_html_clears_shared_selection(reader_class):
+    reader = reader_class()
+    assert list(reader.documents())
+    # the last page is not kept in memory
+    shared_selection = reader._extraction_plan().shared_selection
+    assert shared_selection._entry is None and not shared_selection._results
+
+
+author = Field('author', XML(Tag('author'), external_file=True))
+
+
+@pytest.mark.parametrize('reader_class', [HamletHTMLReader, PageHTMLReader])
+def test_html_select_external_field(reader_class):
+    class ExternalHTMLReader(reader_class):
+        fields = reader_class.fields + [author]
+
+    reader = ExternalHTMLReader()
+    docs = list(reader.documents(fields=['author']))
+
+    assert docs
+    assert all(doc == {'author': None} for doc in docs)
+
+
+def test_html_parse_only():
+    reader = HamletHTMLReader()
+    reader.parse_only = True
+    assert reader._parse_filter() is not None
+
+    docs = list(reader.documents())
+    assert docs == target_documents
+
+
+parsers = [('html.parser', 'bs4'), ('lxml', 'bs4'), ('html.parser', 'lxml')]
+
+
+@pytest.mark.parametrize('parser,backend', parsers)
+def test_html_parser(parser, backend):
+    reader = HamletHTMLReader()
+    reader.parser = parser
+    reader.backend = backend
+    assert reader._extraction_plan().supports_lxml({})
+
+    docs = list(reader.documents())
+    assert docs == target_documents
+
+    path, _ = next(reader.sources())
+    with open(path, 'rb') as f:
+        data = f.read()
+    assert list(reader.source2dicts(path)) == target_documents
+    assert list(reader.source2dicts(data)) == target_documents
+    assert list(reader.source2dicts((data, {}))) == target_documents
+
+
+class CatalogueHTMLReader(HamletHTMLReader):
+    tag_toplevel = Tag('body')
+    tag_entry = Tag('div', class_='item')
+
+    fields = [
+        Field('page', XML(Tag('h1'), toplevel=True, attribute='class')),
+        Field('id', XML(attribute='id')),
+        Field('heading', XML(Tag('h2'))),
+        Field('note', XML(Tag('p', class_='note'))),
+        Field('code', XML(Tag('pre'))),
+        Field('text', XML(flatten=True)),
+        Field('next', XML(NextSiblingTag('div'), attribute='id')),
+    ]
+
+
+catalogue = b'''<!DOCTYPE html>
+<html><head><title>Catalogue</title></head>
+<body>
+  <h1 class="title main">Catalogue</h1>
+  <div class="item" id="a">
+    <h2>First <em>item</em></h2>
+    <p class="note">A &amp; B</p>
+    <pre>  keep
+   spaces </pre>
+  </div>
+  <div class="item featured" id="b"><h2>Second</h2><p>text<br>more</p></div>
+</body></html>
+'''
+
+
+def test_html_parser_conformance():
+    results = []
+    for parser, backend in parsers:
+        reader = CatalogueHTMLReader()
+        reader.parser = parser
+        reader.backend = backend
+        assert reader._extraction_plan().supports_lxml({})
+        results.append(list(reader.source2dicts(catalogue)))
+
+    assert results[0][1]['page'] == ['title', 'main']
+    assert results[0][0]['code'] == '  keep\n   spaces '
+    assert all(result == results[0] for result in results)
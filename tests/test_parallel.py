@@ -0,0 +1,160 @@
+import multiprocessing
+
+import openpyxl
+import pytest
+from rdflib import URIRef
+
+from ianalyzer_readers import parallel
+from ianalyzer_readers.readers.core import Field
+from ianalyzer_readers.extract import CSV, RDF, Order
+
+from tests.csv.test_csv_reader import ShakespeareReader
+from tests.html_reader import HamletHTMLReader
+from tests.rdf.rdf_reader import TestRDFReader
+from tests.xlsx_reader import HamletXLSXReader
+from tests.xml.test_xml_reader import HamletXMLReader
+
+
+class UpperCaseShakespeareReader(ShakespeareReader):
+    character = Field(
+        name='character',
+        extractor=CSV('character', transform=lambda value: value.upper())
+    )
+    fields = [ShakespeareReader.play, character]
+
+
+readers = [
+    HamletXMLReader,
+    HamletHTMLReader,
+    ShakespeareReader,
+    HamletXLSXReader,
+    TestRDFReader,
+    UpperCaseShakespeareReader,
+]
+
+
+@pytest.mark.parametrize('reader_class', readers)
+def test_parallel_documents_ordered(reader_class):
+    reader = reader_class()
+    expected = list(reader.documents())
+    docs = list(reader.documents(workers=2))
+    assert docs == expected
+
+
+@pytest.mark.parametrize('reader_class', readers)
+def test_parallel_documents_unordered(reader_class):
+    reader = reader_class()
+    expected = list(reader.documents())
+    docs = list(reader.documents(workers=2, ordered=False))
+    assert len(docs) == len(expected)
+    assert all(doc in expected for doc in docs)
+
+
+def test_parallel_documents_plain_strings():
+    reader = HamletXMLReader()
+    doc = next(iter(reader.documents(workers=2)))
+    assert type(doc['title']) is str
+
+
+class SubjectRDFReader(TestRDFReader):
+    fields = [Field('id', RDF())]
+
+
+def test_parallel_documents_rdf_terms():
+    reader = SubjectRDFReader()
+    expected = list(reader.documents())
+    docs = list(reader.documents(workers=2))
+    assert docs == expected
+    assert type(docs[0]['id']) is URIRef
+
+
+@pytest.mark.parametrize('reader_class', [HamletXMLReader, UpperCaseShakespeareReader])
+def test_parallel_documents_spawn(reader_class, monkeypatch):
+    monkeypatch.setattr(
+        parallel, '_pool_context', lambda: multiprocessing.get_context('spawn')
+    )
+    reader = reader_class()
+    fields = reader.fieldnames[:2]
+    expected = list(reader.documents(fields=fields))
+    # the reader has cached extraction plans, which cannot be pickled
+    assert reader._plans
+    docs = list(reader.documents(workers=2, fields=fields))
+    assert docs == expected
+
+
+@pytest.fixture
+def no_nested_pools(monkeypatch):
+    map_reader_method = parallel.map_reader_method
+
+    def checked_map_reader_method(*args, **kwargs):
+        assert multiprocessing.parent_process() is None, 'started a pool in a worker'
+        return map_reader_method(*args, **kwargs)
+
+    # worker processes are forked, so they use the patched function as well
+    monkeypatch.setattr(parallel, 'map_reader_method', checked_map_reader_method)
+
+
+def chunked_csv_reader(tmp_path):
+    reader = ShakespeareReader()
+    reader.chunk_workers = 2
+    reader.chunk_size = 200
+    return reader
+
+
+class IndexedShakespeareReader(ShakespeareReader):
+    fields = ShakespeareReader.fields + [Field('index', Order())]
+
+
+def chunked_indexed_csv_reader(tmp_path):
+    reader = IndexedShakespeareReader()
+    reader.chunk_workers = 2
+    reader.chunk_size = 200
+    return reader
+
+
+def sheet_xlsx_reader(tmp_path):
+    wb = openpyxl.Workbook()
+    for i, name in enumerate(['Act I', 'Act II']):
+        sheet = wb.active if i == 0 else wb.create_sheet(name)
+        sheet.title = name
+        sheet.append(['Character', 'Lines'])
+        sheet.append(['HAMLET', name])
+    path = str(tmp_path / 'sheets.xlsx')
+    wb.save(path)
+
+    class SheetsXLSXReader(HamletXLSXReader):
+        sheets = '*'
+        sheet_workers = 2
+
+        def sources(self, **kwargs):
+            yield path
+            yield path
+
+    return SheetsXLSXReader()
+
+
+def multi_file_rdf_reader(tmp_path):
+    extra = tmp_path / 'extra.ttl'
+    extra.write_text('<http://example.org/a> <http://example.org/b> "c" .\n')
+
+    class MultiFileRDFReader(TestRDFReader):
+        graph_workers = 2
+
+        def sources(self, **kwargs):
+            yield from super().sources(**kwargs)
+            yield from super().sources(**kwargs)
+
+        def parse_graph_from_filename(self, filename):
+            return self.parse_graph_from_filenames([filename, str(extra)])
+
+    return MultiFileRDFReader()
+
+
+@pytest.mark.parametrize('make_reader', [
+    chunked_csv_reader, chunked_indexed_csv_reader, sheet_xlsx_reader,
+    multi_file_rdf_reader,
+])
+def test_parallel_documents_no_nested_pools(make_reader, tmp_path, no_nested_pools):
+    reader = make_reader(tmp_path)
+    expected = list(reader.documents())
+    assert list(reader.documents(workers=2)) == expected
@@ -1,3 +1,11 @@
+import datetime
+import io
+import openpyxl
+import pytest
+
+from ianalyzer_readers.readers.core import Field
+from ianalyzer_readers.extract import Order, Metadata
+from ianalyzer_readers.readers.xlsx import XLSXArchive
 from .xlsx_reader import HamletXLSXReader
 
 target_documents = [
@@ -43,3 +51,146 @@ def test_xlsx():
 
     for doc, target in zip(docs, target_documents):
         assert doc == target
+
+
+def test_xlsx_reader_metadata_only(monkeypatch):
+    class IndexedHamletXLSXReader(HamletXLSXReader):
+        fields = HamletXLSXReader.fields + [
+            Field('index', Order()),
+            Field('filename', Metadata('filename')),
+        ]
+
+    reader = IndexedHamletXLSXReader()
+    expected = [
+        {'index': doc['index'], 'filename': doc['filename']}
+        for doc in reader.documents()
+    ]
+
+    # the worksheet content should not be read
+    monkeypatch.setattr(IndexedHamletXLSXReader, '_sheet2dicts', None)
+    docs = list(reader.documents(fields=['index', 'filename']))
+    assert docs == expected
+    assert [doc['index'] for doc in docs] == list(range(len(target_documents)))
+
+
+def test_xlsx_reader_streaming(monkeypatch):
+    reader = HamletXLSXReader()
+    expected = list(reader.documents())
+
+    closed = []
+    close = openpyxl.workbook.Workbook.close
+    def close_and_record(workbook):
+        closed.append(workbook.read_only)
+        close(workbook)
+    monkeypatch.setattr(openpyxl.workbook.Workbook, 'close', close_and_record)
+
+    reader.streaming = True
+    docs = list(reader.documents())
+    assert docs == expected
+    assert closed == [True]
+
+
+def test_xlsx_reader_file_contents():
+    reader = HamletXLSXReader()
+    path, metadata = next(reader.sources())
+    expected = list(reader.source2dicts(path))
+
+    with open(path, 'rb') as f:
+        data = f.read()
+    assert list(reader.source2dicts(data)) == expected
+    assert list(reader.source2dicts((data, metadata))) == expected
+    assert list(reader.source2dicts(io.BytesIO(data))) == expected
+    assert reader.count_documents([data]) == len(expected)
+
+
+def test_xlsx_reader_xml_engine():
+    reader = HamletXLSXReader()
+    expected = list(reader.documents())
+
+    reader.engine = 'xml'
+    assert list(reader.documents()) == expected
+    assert reader.count_documents() == len(expected)
+
+
+def test_xlsx_archive_values(tmp_path):
+    wb = openpyxl.Workbook()
+    sheet = wb.active
+    sheet.append(['text', 'integer', 'float', 'boolean', 'date', 'time', 'formula'])
+    sheet.append([
+        'Hamlet', 1, 1.5, True, datetime.date(1600, 1, 2),
+        datetime.time(3, 4), '=B2+1'
+    ])
+    sheet.append(['Ophelia', -3, 1e20, False, None, None, '=SUM(B2:B3)'])
+    sheet['A6'] = 'after a gap'
+    sheet['I6'] = 5
+    path = tmp_path / 'values.xlsx'
+    wb.save(path)
+
+    expected = list(openpyxl.load_workbook(path, read_only=True).active.values)
+    archive = XLSXArchive(str(path))
+    try:
+        values = list(archive[archive.sheetnames[0]].values)
+    finally:
+        archive.close()
+    assert values == expected
+    assert values[1][4] == datetime.datetime(1600, 1, 2)
+
+
+class SheetsXLSXReader(HamletXLSXReader):
+    fields = HamletXLSXReader.fields + [
+        Field('sheet', Metadata('sheet')),
+        Field('index', Order()),
+    ]
+
+
+@pytest.fixture
+def workbook_with_sheets(tmp_path):
+    wb = openpyxl.Workbook()
+    for i, name in enumerate(['Act I', 'Act II', 'Act III']):
+        sheet = wb.active if i == 0 else wb.create_sheet(name)
+        sheet.title = name
+        sheet.append(['Character', 'Lines'])
+        for line in range(i + 1):
+            sheet.append(['HAMLET', '{} {}'.format(name, line)])
+    path = tmp_path / 'sheets.xlsx'
+    wb.save(path)
+    return str(path)
+
+
+def test_xlsx_reader_sheets(workbook_with_sheets):
+    reader = SheetsXLSXReader()
+    docs = list(reader.source2dicts(workbook_with_sheets))
+    assert [doc['sheet'] for doc in docs] == ['Act I']
+
+    # the first sheet does not replace a sheet in the metadata of the source
+    docs = list(reader.source2dicts((workbook_with_sheets, {'sheet': 'Hamlet'})))
+    assert [doc['sheet'] for doc in docs] == ['Hamlet']
+
+    reader.sheets = '*'
+    docs = list(reader.source2dicts(workbook_with_sheets))
+    assert [(doc['sheet'], doc['index']) for doc in docs] == [
+        ('Act I', 0), ('Act II', 0), ('Act II', 1),
+        ('Act III', 0), ('Act III', 1), ('Act III', 2),
+    ]
+    assert docs[2]['lines'] == 'Act II 1'
+    assert reader.count_documents([workbook_with_sheets]) == 6
+
+    reader.sheets = ['Act III', 'Act I']
+    docs = list(reader.source2dicts(workbook_with_sheets))
+    assert [doc['sheet'] for doc in docs] == ['Act III'] * 3 + ['Act I']
+
+
+@pytest.mark.parametrize('engine', ['openpyxl', 'xml'])
+def test_xlsx_reader_sheet_workers(workbook_with_sheets, engine):
+    reader = SheetsXLSXReader()
+    reader.sheets = '*'
+    reader.engine = engine
+    expected = list(reader.source2dicts(workbook_with_sheets))
+
+    reader.sheet_workers = 2
+    assert list(reader.source2dicts(workbook_with_sheets)) == expected
+    with open(workbook_with_sheets, 'rb') as f:
+        assert list(reader.source2dicts(f)) == expected
+        f.seek(0)
+        data = f.read()
+    assert list(reader.source2dicts(data)) == expected
@@ -0,0 +1,130 @@
+import re
+
+import pytest
+
+from ianalyzer_readers.extract import XML, Backup, Combined
+from ianalyzer_readers.xml_tag import (
+    Tag, CurrentTag, ParentTag, FindParentTag, SiblingTag, PreviousSiblingTag,
+    NextSiblingTag, PreviousTag, NextTag, TransformTag
+)
+
+from tests.xml.test_xml_extraction import make_test_reader, doc_nested
+from tests.xml.test_xml_reader import HamletXMLReader, target_documents
+
+
+def make_readers(extractor, toplevel_tag, entry_tag, doc, tmpdir):
+    bs4_reader = make_test_reader(extractor, toplevel_tag, entry_tag, doc, tmpdir)
+    lxml_reader = make_test_reader(extractor, toplevel_tag, entry_tag, doc, tmpdir)
+    lxml_reader.backend = 'lxml'
+    return bs4_reader, lxml_reader
+
+
+doc_mixed = '''<?xml version="1.0" encoding="UTF-8"?>
+<play xmlns:tei="http://www.tei-c.org/ns/1.0">
+    <act n="I">
+        <scene n="V" type="exterior">
+            <lines character="HAMLET" xml:id="l1">
+                <l>Whither wilt thou <emph>lead</emph> me?</l>
+                <tei:note>stage direction</tei:note>
+            </lines>
+            <lines character="GHOST" xml:id="l2"><l>Mark me.</l></lines>
+            <empty/>
+            <pi><?target some data?></pi>
+            <pi><?target?></pi>
+        </scene>
+    </act>
+</play>
+'''
+
+cases = [
+    (XML(Tag('l')), Tag('play'), Tag('lines')),
+    (XML(Tag('l'), multiple=True), Tag('play'), Tag('scene')),
+    (XML(Tag('l'), flatten=True), Tag('play'), Tag('lines')),
+    (XML(flatten=True), Tag('play'), Tag('lines')),
+    (XML(Tag('lines', character='GHOST'), Tag('l')), Tag('play'), Tag('scene')),
+    (XML(Tag('lines', {'character': 'GHOST'}), Tag('l')), Tag('play'), Tag('scene')),
+    (XML(Tag('lines', character=re.compile('^GH'))), Tag('play'), Tag('scene')),
+    (XML(Tag(re.compile('^le|^l$')), multiple=True), Tag('play'), Tag('scene')),
+    (XML(Tag(['location', 'l']), multiple=True), Tag('play'), Tag('scene')),
+    (XML(Tag('l', recursive=False)), Tag('play'), Tag('scene')),
+    (XML(Tag('lines', limit=1), multiple=True), Tag('play'), Tag('scene')),
+    (XML(Tag('note')), Tag('play'), Tag('lines')),
+    (XML(Tag('tei:note')), Tag('play'), Tag('lines')),
+    (XML(attribute='xml:id'), Tag('play'), Tag('lines')),
+    (XML(attribute='name'), Tag('play'), Tag('lines')),
+    (XML(Tag('lines'), attribute='character', multiple=True), Tag('play'), Tag('scene')),
+    (XML(ParentTag(), attribute='n'), Tag('play'), Tag('lines')),
+    (XML(ParentTag(3), attribute='name'), Tag('play'), Tag('lines')),
+    (XML(FindParentTag('act'), attribute='n'), Tag('play'), Tag('lines')),
+    (XML(SiblingTag('lines'), attribute='character', multiple=True), Tag('play'), Tag('lines')),
+    (XML(PreviousSiblingTag('lines'), attribute='character'), Tag('play'), Tag('lines')),
+    (XML(NextSiblingTag(), attribute='name', multiple=True), Tag('play'), Tag('lines')),
+    (XML(PreviousTag(attrs={'n': True}), attribute='n', multiple=True), Tag('play'), Tag('lines')),
+    (XML(NextTag('l'), multiple=True), Tag('play'), Tag('lines')),
+    (XML(PreviousTag('lines', max_distance=3), attribute='character'), Tag('play'), Tag('lines')),
+    (XML(NextTag('l', max_distance=1), multiple=True), Tag('play'), Tag('lines')),
+    (XML(SiblingTag(max_distance=1), attribute='name', multiple=True), Tag('play'), Tag('lines')),
+    (XML(Tag('act'), toplevel=True, attribute='n'), CurrentTag(), Tag('lines')),
+    (XML(Tag('empty')), Tag('play'), Tag('scene')),
+    (XML(Tag('pi'), multiple=True), Tag('play'), Tag('scene')),
+    (XML(ParentTag(), NextTag('lines'), toplevel=True, multiple=True, attribute='character'),
+     Tag('play'), Tag('lines')),
+    (XML(ParentTag(), PreviousTag('lines'), toplevel=True, multiple=True, attribute='character'),
+     Tag('play'), Tag('lines')),
+    (XML(CurrentTag(), attribute='missing'), Tag('play'), Tag('lines')),
+    (Backup(XML(Tag('missing')), XML(Tag('l'))), Tag('play'), Tag('lines')),
+    (Combined(XML(Tag('l')), XML(attribute='character')), Tag('play'), Tag('lines')),
+]
+
+
+@pytest.mark.parametrize('extractor,toplevel_tag,entry_tag', cases)
+@pytest.mark.parametrize('doc', [doc_mixed, doc_nested])
+def test_lxml_backend_conformance(extractor, toplevel_tag, entry_tag, doc, tmpdir):
+    bs4_reader, lxml_reader = make_readers(extractor, toplevel_tag, entry_tag, doc, tmpdir)
+    assert lxml_reader._extraction_plan().supports_lxml({})
+    assert list(lxml_reader.documents()) == list(bs4_reader.documents())
+
+
+def test_lxml_backend_fallback(tmpdir):
+    extractor = XML(
+        TransformTag(lambda soup: soup.find_all('l')),
+        transform=str.upper,
+    )
+    bs4_reader, lxml_reader = make_readers(
+        extractor, Tag('play'), Tag('lines'), doc_mixed, tmpdir)
+    assert not lxml_reader._extraction_plan().supports_lxml({})
+    assert list(lxml_reader.documents()) == list(bs4_reader.documents())
+
+    extractor = XML(Tag('l'), extract_soup_func=lambda soup: soup.name)
+    reader = make_test_reader(extractor, Tag('play'), Tag('lines'), doc_mixed, tmpdir)
+    reader.backend = 'lxml'
+    assert not reader._extraction_plan().supports_lxml({})
+    assert next(reader.documents())['test'] == 'l'
+
+
+def test_lxml_backend_unsupported_tags():
+    assert not Tag(lambda tag: tag.name == 'l').supports_lxml()
+    assert not Tag('l', string='Mark me.').supports_lxml()
+    assert not TransformTag(lambda soup: [soup]).supports_lxml()
+
+    class CustomTag(Tag):
+        def find_in_soup(self, soup):
+            return soup.find_all('l')
+
+    assert not CustomTag().supports_lxml()
+
+
+class LxmlHamletXMLReader(HamletXMLReader):
+    backend = 'lxml'
+
+
+class StreamingLxmlHamletXMLReader(HamletXMLReader):
+    backend = 'lxml'
+    streaming = True
+
+
+@pytest.mark.parametrize('reader_class', [LxmlHamletXMLReader, StreamingLxmlHamletXMLReader])
+def test_lxml_backend_reader(reader_class):
+    reader = reader_class()
+    docs = list(reader.documents())
+    assert docs == target_documents
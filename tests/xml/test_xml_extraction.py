@@ -2,10 +2,11 @@ import os
 import re
 
 from ianalyzer_readers.readers.xml import XMLReader
-from ianalyzer_readers.extract import XML
+from ianalyzer_readers.extract import XML, Backup, Combined
 from ianalyzer_readers.readers.core import Field
 from ianalyzer_readers.xml_tag import (
-    Tag, ParentTag, FindParentTag, SiblingTag, CurrentTag, TransformTag
+    Tag, ParentTag, FindParentTag, SiblingTag, CurrentTag, TransformTag, PreviousTag,
+    NextSiblingTag
 ) 
 
 
@@ -269,6 +270,62 @@ def test_xml_sibling_tag(tmpdir):
     assert_extractor_output(reader, 'Mark me.')
 
 
+def test_xml_bounded_tags(tmpdir):
+    extractor = XML(PreviousTag('character', max_distance=1))
+    reader = make_test_reader(extractor, Tag('play'), Tag('l'), doc_longer, tmpdir)
+    assert [doc['test'] for doc in reader.documents()] == ['HAMLET', 'GHOST', 'HAMLET']
+
+    extractor = XML(NextSiblingTag('lines', max_distance=1), Tag('character'))
+    reader = make_test_reader(extractor, Tag('play'), Tag('lines'), doc_longer, tmpdir)
+    assert [doc['test'] for doc in reader.documents()] == ['GHOST', 'HAMLET', None]
+
+    extractor = XML(SiblingTag('lines', max_distance=1), Tag('character'), multiple=True)
+    reader = make_test_reader(extractor, Tag('play'), Tag('lines'), doc_longer, tmpdir)
+    assert [doc['test'] for doc in reader.documents()] == [
+        ['GHOST'], ['HAMLET', 'HAMLET'], ['GHOST']
+    ]
+
+
+doc_with_meta = '''
+<?xml version="1.0" encoding="UTF-8"?>
+<play>
+    <lines>
+        <meta><title>Hamlet</title><date>1600</date><author id="shakespeare"/></meta>
+        <l>Whither wilt thou lead me? Speak, I'll go no further.</l>
+    </lines>
+    <lines>
+        <meta><title>Hamlet</title><author id="shakespeare"/></meta>
+        <l>Mark me.</l>
+    </lines>
+</play>
+'''
+
+
+def test_xml_shared_prefix(tmpdir):
+    calls = []
+
+    def find_meta(soup):
+        calls.append(soup)
+        return soup.find_all('meta')
+
+    extractor = Combined(
+        XML(TransformTag(find_meta), Tag('title')),
+        XML(TransformTag(find_meta), Tag('date')),
+        Backup(
+            XML(TransformTag(find_meta), Tag('missing')),
+            XML(TransformTag(find_meta), Tag('author'), attribute='id'),
+        ),
+    )
+    reader = make_test_reader(extractor, Tag('play'), Tag('lines'), doc_with_meta, tmpdir)
+    docs = list(reader.documents())
+    assert [doc['test'] for doc in docs] == [
+        ('Hamlet', '1600', 'shakespeare'),
+        ('Hamlet', None, 'shakespeare'),
+    ]
+    # the meta tag is only searched once per entry
+    assert len(calls) == 2
+
+
 doc_with_title = '''
 <?xml version="1.0" encoding="UTF-8"?>
 <play>
@@ -1,9 +1,11 @@
 import os
+import bs4
+import pytest
 
-from ianalyzer_readers.readers.xml import XMLReader
+from ianalyzer_readers.readers.xml import XMLReader, ExternalFileCache
 from ianalyzer_readers.readers.core import Field
-from ianalyzer_readers.extract import XML
-from ianalyzer_readers.xml_tag import Tag, CurrentTag
+from ianalyzer_readers.extract import XML, Metadata, Order
+from ianalyzer_readers.xml_tag import Tag, CurrentTag, TagIndex
 
 class HamletXMLReader(XMLReader):
     """
@@ -94,3 +96,252 @@ def test_xml_reader():
 
     for doc, target in zip(docs, target_documents):
         assert doc == target
+
+
+class StreamingHamletXMLReader(HamletXMLReader):
+    streaming = True
+
+
+def test_xml_reader_streaming():
+    reader = StreamingHamletXMLReader()
+    docs = list(reader.documents())
+
+    assert docs == target_documents
+
+
+def test_xml_reader_tag_index(monkeypatch):
+    reader = HamletXMLReader()
+    reader.tag_index = True
+
+    # tag queries should not search the tree
+    monkeypatch.setattr(bs4.Tag, 'find_all', None)
+    docs = list(reader.documents())
+    assert docs == target_documents
+
+
+def test_tag_index():
+    soup = bs4.BeautifulSoup(
+        '<doc><meta><title>A</title><date type="issued">1</date></meta>'
+        '<entry><title>B</title><note><title>C</title></note>'
+        '<date type="written">2</date><date>3</date></entry></doc>',
+        'lxml-xml',
+    )
+    index = TagIndex(soup)
+    other = bs4.BeautifulSoup('<doc/>', 'lxml-xml')
+    assert Tag('doc').find_in_index(index, other) is None
+    assert CurrentTag().find_in_index(index, soup) is None
+    assert Tag(string='A').find_in_index(index, soup) is None
+
+    queries = [
+        Tag('title'),
+        Tag('title', recursive=False),
+        Tag('title', limit=1),
+        Tag('date', type='written'),
+        Tag('date', attrs={'type': True}),
+        Tag('missing'),
+    ]
+    for element in [soup] + soup.find_all(True):
+        for tag in queries:
+            assert tag._index_query() is not None
+            expected = element.find_all(*tag.args, **tag.kwargs)
+            assert list(tag.find_in_index(index, element)) == expected
+
+
+class PartialXMLReader(XMLReader):
+    tag_toplevel = CurrentTag()
+    tag_entry = Tag('entry')
+
+    fields = [
+        Field('title', XML(Tag('meta'), Tag('title'), toplevel=True)),
+        Field('text', XML(Tag('p'), multiple=True)),
+        Field('date', XML(Tag('date'), attribute='when')),
+    ]
+
+
+partial_xml = (
+    b'<doc><meta><title>A</title></meta><notes><p>note</p></notes>'
+    b'<body><entry><date when="1900"/><p>one</p></entry>'
+    b'<entry><p>two</p><p>three</p></entry></body></doc>'
+)
+
+
+def test_xml_reader_parse_only():
+    reader = PartialXMLReader()
+    full_docs = list(reader.source2dicts((partial_xml, {})))
+    assert full_docs[1] == {'title': 'A', 'text': ['two', 'three'], 'date': None}
+
+    reader.parse_only = True
+    strainer = reader._parse_filter()
+    assert strainer is not None
+    soup = reader._soup_from_data(partial_xml, strainer)
+    assert soup.find('notes') is None
+    assert list(reader.source2dicts((partial_xml, {}))) == full_docs
+
+    # readers that may need any part of the document are parsed completely
+    class SoupFuncReader(PartialXMLReader):
+        fields = PartialXMLReader.fields + [
+            Field('notes', XML(Tag('notes'), extract_soup_func=lambda soup: soup.text)),
+        ]
+        parse_only = True
+
+    assert SoupFuncReader()._parse_filter() is None
+    assert HamletXMLReader()._extraction_plan().parse_filter() is not None
+
+
+def test_xml_reader_streaming_bytes():
+    reader = StreamingHamletXMLReader()
+    path, metadata = next(reader.sources())
+    with open(path, 'rb') as f:
+        data = f.read()
+
+    docs = list(reader.source2dicts((data, metadata)))
+    assert docs == target_documents
+
+
+def test_xml_reader_source_invariant_fields():
+    titles = []
+
+    def count_title(title):
+        titles.append(title)
+        return title
+
+    class CountingHamletXMLReader(HamletXMLReader):
+        title = Field('title', XML(Tag('title'), toplevel=True, transform=count_title))
+        fields = [title, HamletXMLReader.character, HamletXMLReader.lines]
+
+    reader = CountingHamletXMLReader()
+    docs = list(reader.documents())
+
+    assert docs == target_documents
+    assert titles == ['Hamlet']
+    assert list(docs[0].keys()) == ['title', 'character', 'lines']
+
+
+def test_xml_reader_source_invariant_values_not_shared():
+    class ListTitleHamletXMLReader(HamletXMLReader):
+        title = Field('title', XML(Tag('title'), toplevel=True, multiple=True))
+        fields = [title, HamletXMLReader.character]
+
+    reader = ListTitleHamletXMLReader()
+    docs = reader.documents()
+    first = next(docs)
+    first['title'].append('Ophelia')
+
+    assert all(doc['title'] == ['Hamlet'] for doc in docs)
+
+
+external_doc = '''<?xml version="1.0" encoding="UTF-8"?>
+<metadata>
+    <play id="hamlet">
+        <author>William Shakespeare</author>
+    </play>
+</metadata>
+'''
+
+
+class ExternalHamletXMLReader(HamletXMLReader):
+    external_file_tag_toplevel = Tag('metadata')
+
+    author = Field(
+        'author',
+        XML(Tag('play', id='hamlet'), Tag('author'), external_file=True)
+    )
+    fields = [HamletXMLReader.title, HamletXMLReader.character, author]
+
+
+def test_xml_reader_external_file_cache(tmpdir):
+    external_path = os.path.join(tmpdir, 'metadata.xml')
+    with open(external_path, 'w') as f:
+        f.write(external_doc)
+
+    reader = ExternalHamletXMLReader()
+    path, _ = next(reader.sources())
+    sources = [(path, {'external_file': external_path}) for _ in range(3)]
+
+    # caching is disabled by default
+    docs = list(reader.documents(sources))
+    assert all(doc['author'] == 'William Shakespeare' for doc in docs)
+    assert reader.external_file_cache.misses == 3
+    assert len(reader.external_file_cache) == 0
+
+    reader = ExternalHamletXMLReader()
+    reader.external_file_cache_size = 8
+    docs = list(reader.documents(sources))
+
+    assert len(docs) == 3 * len(target_documents)
+    assert all(doc['author'] == 'William Shakespeare' for doc in docs)
+    assert reader.external_file_cache.misses == 1
+    assert reader.external_file_cache.hits == 2
+
+    # a modified file is parsed again
+    with open(external_path, 'w') as f:
+        f.write(external_doc.replace('William Shakespeare', 'W. Shakespeare'))
+    stat = os.stat(external_path)
+    os.utime(external_path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10**9))
+
+    docs = list(reader.source2dicts((path, {'external_file': external_path})))
+    assert all(doc['author'] == 'W. Shakespeare' for doc in docs)
+    assert reader.external_file_cache.misses == 2
+
+
+def test_external_file_cache_eviction(tmpdir):
+    paths = []
+    for i in range(3):
+        path = os.path.join(tmpdir, 'file{}.xml'.format(i))
+        with open(path, 'w') as f:
+            f.write('<doc>{}</doc>'.format(i))
+        paths.append(path)
+
+    cache = ExternalFileCache(max_entries=2)
+    for path in paths + paths[-1:]:
+        cache.get(path, 'bs4', lambda path: path)
+
+    assert len(cache) == 2
+    assert (cache.hits, cache.misses) == (1, 3)
+    cache.get(paths[0], 'bs4', lambda path: path)
+    assert cache.misses == 4
+
+    cache = ExternalFileCache(max_bytes=0)
+    cache.get(paths[0], 'bs4', lambda path: path)
+    assert len(cache) == 0
+
+
+def test_xml_reader_select_fields(tmpdir):
+    external_path = os.path.join(tmpdir, 'metadata.xml')
+    with open(external_path, 'w') as f:
+        f.write(external_doc)
+
+    reader = ExternalHamletXMLReader()
+    path, _ = next(reader.sources())
+    source = (path, {'external_file': external_path})
+
+    docs = list(reader.documents([source], fields=['character']))
+    assert docs == [{'character': doc['character']} for doc in target_documents]
+    # the external file is not needed
+    assert reader.external_file_cache.misses == 0
+
+    source = (path, {'external_file': external_path})
+    docs = list(reader.documents([source], fields=['author']))
+    assert docs == [{'author': 'William Shakespeare'}] * len(target_documents)
+
+
+class IndexedHamletXMLReader(HamletXMLReader):
+    index = Field('index', Order())
+    filename = Field('filename', Metadata('filename'))
+    fields = HamletXMLReader.fields + [index, filename]
+
+
+@pytest.mark.parametrize('streaming', [False, True])
+def test_xml_reader_metadata_only(streaming, monkeypatch):
+    reader = IndexedHamletXMLReader()
+    reader.streaming = streaming
+    expected = [
+        {'index': doc['index'], 'filename': doc['filename']}
+        for doc in reader.documents()
+    ]
+
+    # the source should not be parsed with BeautifulSoup
+    monkeypatch.setattr(XMLReader, '_soup_from_data', None)
+    docs = list(reader.documents(fields=['index', 'filename']))
+    assert docs == expected
+    assert [doc['index'] for doc in docs] == list(range(len(target_documents)))